@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+from importlib.util import find_spec
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,6 +45,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'ref_books.middleware.MetricsMiddleware',
+    'ref_books.middleware.CompressionMiddleware',
+    'ref_books.middleware.PrimaryPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -77,13 +81,41 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Основная база данных (default) принимает запись. Реплики только для чтения добавляются в DATABASES
+# с параметром 'TEST': {'MIRROR': 'default'} и перечисляются в REF_BOOKS_DATABASE_REPLICAS,
+# запросы к ним распределяет маршрутизатор PrimaryReplicaRouter.
+# CONN_MAX_AGE - время жизни постоянных соединений в секундах (0 - соединение на каждый запрос)
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Время ожидания блокировки базы данных SQLite в секундах
+            'timeout': 20,
+        },
     }
 }
 
+DATABASE_ROUTERS = ['ref_books.routers.PrimaryReplicaRouter']
+
+# Псевдонимы реплик только для чтения из DATABASES
+REF_BOOKS_DATABASE_REPLICAS = []
+
+# Префиксы адресов, запросы к которым читают данные из основной базы данных, а не из реплик
+REF_BOOKS_PRIMARY_PATHS = ['/admin/']
+
+# Параметры каждого нового соединения с SQLite (PRAGMA) для развертывания на одном сервере: синхронизация только
+# при контрольных точках WAL, кеш страниц 64 МБ, временные таблицы в памяти и отображение файла базы данных в память.
+# Журнал WAL сохраняется в файле базы данных и устанавливается один раз миграцией 0008_sqlite_wal_journal
+REF_BOOKS_SQLITE_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+    'temp_store': 'MEMORY',
+    'mmap_size': 256 * 1024 * 1024,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -129,4 +161,80 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "rest_framework.schemas.coreapi.AutoSchema",
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    # JSON кодируется библиотекой orjson, если она установлена; формат MessagePack (Accept: application/msgpack)
+    # доступен, если установлена библиотека msgpack
+    'DEFAULT_RENDERER_CLASSES': [
+        'ref_books.renderers.FastJSONRenderer',
+        *(['ref_books.renderers.MessagePackRenderer'] if find_spec('msgpack') else []),
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
+
+# Кеши Django. Кеш ref_books - общий для процессов-обработчиков кеш элементов версий справочников
+# (для нескольких серверов - Redis или Memcached). Ключи записей включают идентификаторы версий и счетчики изменений,
+# поэтому после восстановления базы данных из резервной копии кеш нужно очистить
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'ref_books': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'TIMEOUT': 24 * 60 * 60,
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+}
+
+# Общий кеш элементов версий справочников: псевдоним кеша Django (None - отключен),
+# наибольшее количество элементов версии в записи и срок хранения записи в секундах
+REF_BOOKS_SHARED_CACHE = 'ref_books'
+REF_BOOKS_SHARED_CACHE_MAX_ELEMENTS = 100_000
+REF_BOOKS_SHARED_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Внутрипроцессный кеш элементов справочников для проверки элементов
+REF_BOOKS_ELEMENT_CACHE = {
+    'MAX_ENTRIES': 256,
+    'MAX_ELEMENTS': 1_000_000,
+    'TIMEOUT': 60,
+}
+
+# Фильтры Блума элементов версий для отказа без запроса к базе данных при проверке отсутствующих элементов
+# (None - отключены): ожидаемая доля ложноположительных ответов, наибольший размер одного фильтра
+# и суммарный объем фильтров в памяти процесса в байтах
+REF_BOOKS_BLOOM_FILTER = {
+    'FALSE_POSITIVE_RATE': 0.01,
+    'MAX_BYTES': 16 * 1024 * 1024,
+    'MEMORY_BYTES': 64 * 1024 * 1024,
+}
+
+# Максимальное количество элементов в одном запросе пакетной проверки
+REF_BOOKS_CHECK_ELEMENTS_MAX_ITEMS = 10000
+
+# Курсорная пагинация списков справочников и элементов (включается параметрами cursor или page_size)
+REF_BOOKS_PAGE_SIZE = 100
+REF_BOOKS_MAX_PAGE_SIZE = 1000
+
+# Каталог снимков версий справочников (manage.py freeze_version). Тесты и команда benchmark
+# используют временный каталог
+REF_BOOKS_SNAPSHOT_DIR = BASE_DIR / 'snapshots'
+
+TEST_RUNNER = 'ref_books.runner.RefBooksTestRunner'
+
+# Сжатие ответов (CompressionMiddleware): наименьший размер сжимаемого ответа в байтах,
+# уровень сжатия gzip и качество сжатия brotli (используется, если установлен пакет brotli)
+REF_BOOKS_COMPRESSION_MIN_SIZE = 1024
+REF_BOOKS_COMPRESSION_GZIP_LEVEL = 6
+REF_BOOKS_COMPRESSION_BROTLI_QUALITY = 4
+# Типы содержимого сжимаемых ответов API. HTML-страницы (административная панель) не сжимаются:
+# они содержат токены CSRF, которые сжатие позволяет подобрать атакой BREACH
+REF_BOOKS_COMPRESSION_CONTENT_TYPES = [
+    'application/json',
+    'application/msgpack',
+    'application/x-ndjson',
+    'text/csv',
+]
+
+# Показатели запросов к API в формате Prometheus (/metrics): адреса, с которых разрешено их получение,
+# и передача показателей каждого запроса в заголовке Server-Timing
+REF_BOOKS_METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+REF_BOOKS_METRICS_SERVER_TIMING = False
@@ -1,6 +1,13 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.forms.models import BaseInlineFormSet
 from django.utils.translation import gettext_lazy as _
 from .models import RefBook, RefBookVersion, RefBookElement
+from .services.bloom_filter import build_bloom_filter
+from .services.element_cache import element_cache
+from .services.ref_books_service import search_elements
+from .services.snapshot_service import freeze_version
+from .services.versions_service import VersionState, touch_versions
 
 
 class DirectionVersionsInline(admin.TabularInline):
@@ -9,15 +16,56 @@ class DirectionVersionsInline(admin.TabularInline):
     """
     model = RefBookVersion
     extra = 1
+    autocomplete_fields = ('parent',)
+
+
+class DirectionElementsFormSet(BaseInlineFormSet):
+    """
+    Набор форм элементов версии справочника, выводящий одну страницу элементов в порядке кодов.
+    Элементы отбираются по точному коду или началу значения без учета регистра (search_elements),
+    поэтому страница читается по индексам независимо от количества элементов версии.
+    """
+    per_page = 50
+    page_var = 'elements_page'
+    search_var = 'elements_q'
+    page_number = None
+    search = ''
+    page = None
+
+    def get_queryset(self):
+        if self.page is None:
+            queryset = self.queryset.order_by('code')
+            if self.search:
+                queryset = search_elements(queryset, self.search) | queryset.filter(code=self.search)
+            self.page = Paginator(queryset, self.per_page).get_page(self.page_number)
+        return self.page.object_list
+
+    @property
+    def page_range(self):
+        """Номера страниц для навигации с пропусками между дальними страницами"""
+        self.get_queryset()
+        return self.page.paginator.get_elided_page_range(self.page.number)
 
 
 class DirectionElementsInline(admin.TabularInline):
     """
     Встроенная форма для отображения элементов справочника в административной панели.
+    Элементы выводятся постранично (параметр elements_page) с поиском (параметр elements_q).
     """
     model = RefBookElement
+    formset = DirectionElementsFormSet
+    template = 'admin/ref_books/edit_inline/paginated_tabular.html'
     extra = 1
 
+    def get_formset(self, request, obj=None, **kwargs):
+        """
+        Передает набору форм номер страницы и строку поиска из параметров запроса.
+        """
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.page_number = request.GET.get(formset.page_var)
+        formset.search = request.GET.get(formset.search_var, '').strip()
+        return formset
+
 
 @admin.register(RefBook)
 class DirectionAdmin(admin.ModelAdmin):
@@ -26,27 +74,33 @@ class DirectionAdmin(admin.ModelAdmin):
     """
     inlines = [DirectionVersionsInline]
     list_display = ('id', 'code', 'name', 'latest_version', 'issue_date')
+    search_fields = ('code', 'name')
+    show_full_result_count = False
+    # Порядок задан явно: результаты автодополнения выводятся постранично
+    ordering = ('-pk',)
+
+    def get_queryset(self, request):
+        """
+        Добавляет к справочникам сведения о текущей версии одним запросом.
+        """
+        return super().get_queryset(request).with_current_version()
 
     def latest_version(self, obj):
         """
         Возвращает номер последней версии справочника.
         """
-        try:
-            return obj.current_version.version
-        except AttributeError:
-            return None
+        return obj.current_version_number
 
     def issue_date(self, obj):
         """
         Возвращает дату начала действия текущей версии справочника.
         """
-        try:
-            return obj.current_version.start_date
-        except AttributeError:
-            return None
+        return obj.current_version_start_date
 
     latest_version.short_description = _('текущая версия')
+    latest_version.admin_order_field = 'current_version_number'
     issue_date.short_description = _('дата начала действия версии')
+    issue_date.admin_order_field = 'current_version_start_date'
 
 
 @admin.register(RefBookVersion)
@@ -55,7 +109,41 @@ class DirectionVersionAdmin(admin.ModelAdmin):
     Административная конфигурация для модели DirectionVersion.
     """
     inlines = [DirectionElementsInline]
-    list_display = ('ref_book_name', 'ref_book_code', 'version', 'start_date')
+    list_display = ('ref_book_name', 'ref_book_code', 'version', 'start_date', 'end_date', 'parent')
+    list_select_related = ('ref_book_id', 'parent__ref_book_id')
+    search_fields = ('version', '=ref_book_id__code', 'ref_book_id__name')
+    show_full_result_count = False
+    ordering = ('-pk',)
+    autocomplete_fields = ('ref_book_id', 'parent')
+    actions = ['freeze_versions']
+
+    def get_queryset(self, request):
+        """
+        Загружает справочники версий одним запросом: наименование справочника выводится
+        в представлении версии, в том числе в результатах автодополнения.
+        """
+        return super().get_queryset(request).select_related('ref_book_id')
+
+    def save_formset(self, request, form, formset, change):
+        """
+        Сбрасывает кеш и увеличивает счетчики изменений версии и наследующих от нее версий
+        при изменении ее элементов во встроенной форме (см. touch_versions).
+        """
+        super().save_formset(request, form, formset, change)
+        if formset.model is RefBookElement and \
+                (formset.new_objects or formset.changed_objects or formset.deleted_objects):
+            touch_versions([form.instance.pk])
+
+    @admin.action(description=_('Опубликовать снимки выбранных версий'))
+    def freeze_versions(self, request, queryset):
+        """
+        Публикует снимки и фильтры Блума элементов выбранных версий справочников.
+        """
+        for ref_book_version in queryset:
+            freeze_version(ref_book_version)
+            element_cache.invalidate(version_pk=ref_book_version.pk)
+            build_bloom_filter(VersionState(ref_book_version.pk, ref_book_version.revision, ref_book_version.parent_id))
+        self.message_user(request, _('Опубликовано снимков: %(count)s') % {'count': len(queryset)})
 
     def ref_book_name(self, obj):
         """
@@ -78,4 +166,47 @@ class DirectionElementAdmin(admin.ModelAdmin):
     """
     Административная конфигурация для модели DirectionElement.
     """
-    list_display = ('id', 'ref_book_version_id', 'code', 'value')
+    list_display = ('id', 'ref_book_version_id', 'code', 'value', 'is_removed')
+    list_select_related = ('ref_book_version_id__ref_book_id',)
+    search_fields = ('=code',)
+    search_help_text = _('Точный код элемента или начало значения без учета регистра')
+    show_full_result_count = False
+    autocomplete_fields = ('ref_book_version_id',)
+
+    def save_model(self, request, obj, form, change):
+        """
+        Сохраняет элемент и сбрасывает кеш его версии, а при переносе элемента в другую версию
+        и кеш прежней версии (см. touch_versions).
+        """
+        super().save_model(request, obj, form, change)
+        version_pks = {obj.ref_book_version_id_id}
+        if change and 'ref_book_version_id' in form.changed_data:
+            version_pks.add(form.initial['ref_book_version_id'])
+        touch_versions(version_pks)
+
+    def delete_model(self, request, obj):
+        """
+        Удаляет элемент и сбрасывает кеш его версии.
+        """
+        super().delete_model(request, obj)
+        touch_versions([obj.ref_book_version_id_id])
+
+    def delete_queryset(self, request, queryset):
+        """
+        Удаляет выбранные элементы и сбрасывает кеш их версий.
+        """
+        version_pks = set(queryset.values_list('ref_book_version_id', flat=True).distinct())
+        super().delete_queryset(request, queryset)
+        touch_versions(version_pks)
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Отбирает элементы по точному коду или началу значения (search_elements) вместо поиска
+        подстроки, который требует чтения всей таблицы элементов. Список содержит элементы всех версий,
+        поэтому условия выполняются по индексам refbookelement_code_idx и refbookelement_value_lower_idx
+        (индексы версии начинаются с идентификатора версии и для них не подходят).
+        """
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        return search_elements(queryset, search_term) | queryset.filter(code=search_term), False
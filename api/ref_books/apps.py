@@ -6,3 +6,6 @@ class DirectionsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ref_books'
     verbose_name = _('Справочники')
+
+    def ready(self):
+        from ref_books import signals  # noqa: F401
@@ -0,0 +1,128 @@
+"""
+Асинхронные (ASGI) варианты представлений для чтения справочников.
+
+Представления используют асинхронный ORM Django и не переключаются на поток при попадании
+во внутрипроцессный кеш элементов и снимки версий, поэтому под ASGI-сервером (uvicorn, daphne)
+один процесс обслуживает множество одновременных запросов валидации. Ответы совпадают
+с ответами синхронных представлений DRF; постраничная выдача не поддерживается.
+"""
+from django.db.models import Count, Max, Sum
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.translation import gettext_lazy as _
+from django.views import View
+from rest_framework.exceptions import NotFound, ValidationError
+
+from ref_books.filters import DirectionsFilter
+from ref_books.models import RefBook
+from ref_books.renderers import FastJSONRenderer
+from ref_books.serializers import DirectionElementSerializer, DirectionSerializer
+from ref_books.services.async_service import aget_version_elements, aget_version_state
+from ref_books.services.ref_books_service import get_entry_state, search_elements
+from ref_books.services.shared_cache import aload_version_elements
+from ref_books.services.snapshot_service import open_snapshot
+from ref_books.services.versions_service import aget_state_chain, resolve_chain_elements
+from ref_books.views import parse_as_of
+
+
+class AsyncAPIView(View):
+    """Базовое асинхронное представление: ответы в JSON в формате DRF и строгие ETag"""
+
+    renderer = FastJSONRenderer()
+
+    def json_response(self, data, status=200, etag=None):
+        """Возвращает ответ с данными, сериализованными так же, как JSONRenderer DRF"""
+        response = HttpResponse(self.renderer.render(data), status=status, content_type='application/json')
+        if etag is not None:
+            response['ETag'] = etag
+        return response
+
+    def get_not_modified_response(self, etag):
+        """Возвращает ответ 304 (или 412), если условие запроса выполняется для указанного ETag"""
+        response = get_conditional_response(self.request, etag=etag)
+        if response is not None:
+            response['ETag'] = etag
+        return response
+
+    def get_ref_book_id(self):
+        """Возвращает идентификатор справочника из url или None, если он некорректен"""
+        id_ = self.kwargs.get('id')
+        return int(id_) if id_.isdigit() else None
+
+    async def dispatch(self, request, *args, **kwargs):
+        if 'id' in kwargs and self.get_ref_book_id() is None:
+            return self.json_response(['Введите корректное значение параметра id в url'], status=400)
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except Http404:
+            return self.json_response({'detail': NotFound.default_detail}, status=404)
+        except ValidationError as error:
+            return self.json_response(error.detail, status=400)
+
+
+class AsyncDirectionListView(AsyncAPIView):
+    """Асинхронный вариант DirectionListView"""
+
+    async def get(self, request, *args, **kwargs):
+        stats = await RefBook.objects.aaggregate(count=Count('id'), last_id=Max('id'), revisions=Sum('revision'))
+        etag = f'"refbooks-{stats["count"]}-{stats["last_id"] or 0}-{stats["revisions"] or 0}-json"'
+        response = self.get_not_modified_response(etag)
+        if response is not None:
+            return response
+        filterset = DirectionsFilter(request.GET, queryset=RefBook.objects.all())
+        if not filterset.is_valid():
+            return self.json_response(filterset.errors, status=400)
+        data = [row async for row in filterset.qs.values(*DirectionSerializer.Meta.fields)]
+        return self.json_response(data, etag=etag)
+
+
+class AsyncDirectionElementListView(AsyncAPIView):
+    """Асинхронный вариант DirectionElementListView"""
+
+    async def get(self, request, *args, **kwargs):
+        ref_book_id = self.get_ref_book_id()
+        state = await aget_version_state(ref_book_id, request.GET.get('version', None), parse_as_of(request.GET))
+        etag = f'"elements-{state.pk}-{state.revision}-json"' if state else f'"elements-{ref_book_id}-none-json"'
+        response = self.get_not_modified_response(etag)
+        if response is not None:
+            return response
+        if state is None:
+            return self.json_response([], etag=etag)
+        search = request.GET.get('search', None)
+        if search:
+            queryset = search_elements(resolve_chain_elements(await aget_state_chain(state)), search)
+        else:
+            elements = open_snapshot(state.pk, state.revision)
+            if elements is None:
+                elements = await aload_version_elements(ref_book_id, state)
+            if elements is not None:
+                return self.json_response([{'code': code, 'value': value} for code, value in elements], etag=etag)
+            queryset = resolve_chain_elements(await aget_state_chain(state))
+        queryset = queryset.order_by('pk').values(*DirectionElementSerializer.Meta.fields)
+        return self.json_response([row async for row in queryset], etag=etag)
+
+
+class AsyncCheckElementView(AsyncAPIView):
+    """Асинхронный вариант CheckElementView"""
+
+    async def get(self, request, *args, **kwargs):
+        as_of = parse_as_of(request.GET)
+        code = request.GET.get('code', None)
+        value = request.GET.get('value', None)
+        if not code or not value:
+            return self.json_response([_('Параметры "code" и "value" обязательны')], status=400)
+        elements = await aget_version_elements(
+            self.get_ref_book_id(), request.GET.get('version', None), as_of, pair=(code, value))
+        if elements.too_large:
+            chain = await aget_state_chain(get_entry_state(elements))
+            exists = await resolve_chain_elements(chain).filter(code=code, value=value).aexists()
+        else:
+            exists = (code, value) in elements.pairs
+        if elements.version_pk is not None:
+            etag = f'"elements-{elements.version_pk}-{elements.revision}-json"'
+        else:
+            etag = f'"elements-{self.get_ref_book_id()}-none-json"'
+        response = self.get_not_modified_response(etag)
+        if response is not None:
+            return response
+        return self.json_response([{'code': code, 'value': value}] if exists else [], etag=etag)
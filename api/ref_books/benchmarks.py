@@ -0,0 +1,344 @@
+"""
+Сценарии оценки производительности, запускаемые командой manage.py benchmark.
+Каждый сценарий выполняется на тестовой базе данных и возвращает словарь с результатами измерений.
+"""
+import asyncio
+import datetime
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from django.db import connections
+from django.test import AsyncClient, Client
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+
+from ref_books.filters import DirectionsFilter
+from ref_books.middleware import StreamCompressor, brotli
+from ref_books.models import RefBook, RefBookElement, RefBookVersion
+from ref_books.renderers import FastJSONRenderer, MessagePackRenderer, msgpack, orjson
+from ref_books.serializers import DirectionElementSerializer, DirectionSerializer
+from ref_books.services.generator_service import generate_refbooks
+from ref_books.services.versions_service import refresh_current_version
+
+BENCHMARKS: Dict[str, Callable[..., dict]] = {}
+
+
+def benchmark(name: str):
+    """Регистрирует сценарий оценки производительности под указанным именем"""
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+def measure(func: Callable[[], object], repeat: int) -> float:
+    """Возвращает наименьшее время выполнения функции в секундах из repeat запусков"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def percentile(sorted_values: Sequence[float], fraction: float) -> float:
+    """Возвращает перцентиль упорядоченной выборки методом ближайшего ранга"""
+    if not sorted_values:
+        return 0.0
+    rank = min(max(math.ceil(fraction * len(sorted_values)), 1), len(sorted_values))
+    return sorted_values[rank - 1]
+
+
+def run_concurrently(requests: Sequence[Tuple[str, dict]], concurrency: int) -> dict:
+    """
+    Выполняет запросы к API тестовым клиентом Django в concurrency потоках и возвращает
+    перцентили времени ответа в миллисекундах и пропускную способность.
+    :param requests: Пары (url, параметры запроса)
+    :param concurrency: Количество одновременно выполняющихся запросов
+    :return: Результаты измерений
+    """
+    latencies: List[float] = []
+    errors = []
+    lock = threading.Lock()
+    pending = iter(requests)
+
+    def worker():
+        client = Client()
+        try:
+            while True:
+                with lock:
+                    request = next(pending, None)
+                if request is None:
+                    return
+                started = time.perf_counter()
+                response = client.get(*request)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    if response.status_code != 200:
+                        errors.append(response.status_code)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'requests_per_second': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+@benchmark('serialization')
+def serialization_benchmark(elements=None, repeat=None, **options) -> dict:
+    """
+    Сравнивает сериализацию элементов версии через ModelSerializer (с select_related, как раньше)
+    и через values() с последующим рендерингом в JSON. Оба пути упорядочивают элементы по первичному ключу,
+    как ValuesListMixin: без явного порядка values() читает строки по покрывающему индексу в порядке кодов.
+    """
+    elements = elements or 100_000
+    repeat = repeat or 3
+    ref_book_version = generate_refbooks(refbooks=1, versions=1, elements=elements)[0]
+    renderer = JSONRenderer()
+
+    def serializer_path():
+        queryset = RefBookElement.objects.\
+            select_related('ref_book_version_id').\
+            filter(ref_book_version_id=ref_book_version).\
+            order_by('pk')
+        return renderer.render(DirectionElementSerializer(queryset, many=True).data)
+
+    def values_path():
+        queryset = RefBookElement.objects.filter(ref_book_version_id=ref_book_version).order_by('pk')
+        return renderer.render(list(queryset.values(*DirectionElementSerializer.Meta.fields)))
+
+    serializer_seconds = measure(serializer_path, repeat)
+    values_seconds = measure(values_path, repeat)
+    return {
+        'elements': elements,
+        'serializer_us_per_row': serializer_seconds / elements * 1e6,
+        'values_us_per_row': values_seconds / elements * 1e6,
+        'speedup': serializer_seconds / values_seconds,
+        'identical_output': serializer_path() == values_path(),
+    }
+
+
+@benchmark('asgi')
+def asgi_benchmark(elements=None, requests=None, concurrency=None, **options) -> dict:
+    """
+    Сравнивает пропускную способность синхронной (WSGI, поток на запрос) и асинхронной (ASGI)
+    проверки элемента при заданном количестве одновременных запросов.
+    Запросы выполняются тестовыми клиентами Django в текущем процессе, без сетевого сервера.
+    """
+    elements = elements or 1000
+    requests = requests or 2000
+    concurrency = concurrency or 50
+    ref_book_version = generate_refbooks(refbooks=1, versions=1, elements=elements)[0]
+    ref_book_id = ref_book_version.ref_book_id_id
+    refresh_current_version(ref_book_id)
+    params = {'code': '1', 'value': f'Значение 1 версии {ref_book_version.version}'}
+    wsgi_url = reverse('ref_books:check-element', kwargs={'id': ref_book_id})
+    asgi_url = reverse('ref_books:async-check-element', kwargs={'id': ref_book_id})
+
+    def wsgi_request(_):
+        try:
+            return Client().get(wsgi_url, params).status_code
+        finally:
+            connections.close_all()
+
+    def run_wsgi():
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return list(pool.map(wsgi_request, range(requests)))
+
+    async def run_asgi():
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def asgi_request():
+            async with semaphore:
+                return (await client.get(asgi_url, params)).status_code
+
+        return await asyncio.gather(*(asgi_request() for _ in range(requests)))
+
+    run_wsgi()
+    asyncio.run(run_asgi())
+    wsgi_seconds = measure(run_wsgi, 1)
+    asgi_seconds = measure(lambda: asyncio.run(run_asgi()), 1)
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'wsgi_requests_per_second': requests / wsgi_seconds,
+        'asgi_requests_per_second': requests / asgi_seconds,
+    }
+
+
+@benchmark('date_filter')
+def date_filter_benchmark(refbooks=None, versions=None, repeat=None, **options) -> dict:
+    """
+    Сравнивает фильтр списка справочников по дате через EXISTS с прежним соединением с версиями и DISTINCT.
+    Время запроса и ответа API измеряется при одной версии у каждого справочника и после добавления
+    остальных версий: с EXISTS оно не должно зависеть от количества версий.
+    """
+    refbooks = refbooks or 10_000
+    versions = versions or 50
+    repeat = repeat or 5
+    start_date = datetime.date(2020, 1, 1)
+    params = {'date': (start_date + datetime.timedelta(days=versions)).isoformat()}
+    url = reverse('ref_books:direction-list')
+    client = Client()
+
+    def exists_query():
+        queryset = DirectionsFilter(params, queryset=RefBook.objects.all()).qs
+        return list(queryset.values(*DirectionSerializer.Meta.fields))
+
+    def distinct_query():
+        return list(
+            RefBook.objects.filter(refbookversion__start_date__lte=params['date']).
+            distinct().
+            values(*DirectionSerializer.Meta.fields)
+        )
+
+    def run():
+        return {
+            'matched': len(exists_query()),
+            'exists_ms': measure(exists_query, repeat) * 1000,
+            'distinct_ms': measure(distinct_query, repeat) * 1000,
+            'endpoint_ms': measure(lambda: client.get(url, params), repeat) * 1000,
+        }
+
+    ref_book_versions = generate_refbooks(refbooks=refbooks, versions=1, elements=0, start_date=start_date)
+    single_version = run()
+    RefBookVersion.objects.bulk_create([
+        RefBookVersion(
+            ref_book_id_id=ref_book_version.ref_book_id_id,
+            version=f'1.{index}',
+            start_date=start_date + datetime.timedelta(days=index),
+        )
+        for ref_book_version in ref_book_versions for index in range(1, versions)
+    ], batch_size=5000)
+    many_versions = run()
+    return {
+        'refbooks': refbooks,
+        'versions': versions,
+        'single_version': single_version,
+        'many_versions': many_versions,
+    }
+
+
+@benchmark('endpoints')
+def endpoints_benchmark(refbooks=None, versions=None, elements=None, requests=None, concurrency=None,
+                        **options) -> dict:
+    """
+    Нагрузочный сценарий для основных точек API: списка справочников, списка элементов и проверки элемента.
+    Справочники создаются генератором синтетических данных, запросы выполняются тестовым клиентом Django
+    с фиксированным количеством одновременных запросов и псевдослучайными (воспроизводимыми) параметрами.
+    """
+    refbooks = refbooks or 100
+    versions = versions or 5
+    elements = elements or 1000
+    requests = requests or 1000
+    concurrency = concurrency or 8
+    ref_book_versions = generate_refbooks(refbooks=refbooks, versions=versions, elements=elements)
+    ref_book_ids = sorted({ref_book_version.ref_book_id_id for ref_book_version in ref_book_versions})
+    for ref_book_id in ref_book_ids:
+        refresh_current_version(ref_book_id)
+    current_version = f'1.{versions - 1}'
+
+    randomizer = random.Random(0)
+    scenarios = {
+        'direction-list': [
+            (reverse('ref_books:direction-list'), {}) for _ in range(requests)
+        ],
+        'element-list': [
+            (reverse('ref_books:element-list', kwargs={'id': randomizer.choice(ref_book_ids)}), {})
+            for _ in range(requests)
+        ],
+        'check-element': [
+            (
+                reverse('ref_books:check-element', kwargs={'id': randomizer.choice(ref_book_ids)}),
+                {'code': str(code), 'value': f'Значение {code} версии {current_version}'},
+            )
+            for code in (randomizer.randrange(elements) for _ in range(requests))
+        ],
+    }
+    result = {
+        'refbooks': refbooks,
+        'versions': versions,
+        'elements': elements,
+        'concurrency': concurrency,
+    }
+    for name, scenario in scenarios.items():
+        result[name] = run_concurrently(scenario, concurrency)
+    return result
+
+
+@benchmark('search')
+def search_benchmark(elements=None, repeat=None, **options) -> dict:
+    """
+    Время поиска элементов по началу значения без учета регистра в одной большой версии справочника:
+    узкий запрос (несколько совпадений) и широкий запрос с постраничной выдачей первых 10 совпадений.
+    """
+    elements = elements or 500_000
+    repeat = repeat or 5
+    ref_book_version = generate_refbooks(refbooks=1, versions=1, elements=elements)[0]
+    refresh_current_version(ref_book_version.ref_book_id_id)
+    url = reverse('ref_books:element-list', kwargs={'id': ref_book_version.ref_book_id_id})
+    client = Client()
+    narrow = {'search': f'ЗНАЧЕНИЕ {elements // 2} '}
+    broad = {'search': 'значение 1', 'page_size': 10}
+    return {
+        'elements': elements,
+        'narrow_matches': len(client.get(url, narrow).json()),
+        'narrow_ms': measure(lambda: client.get(url, narrow), repeat) * 1000,
+        'broad_page_ms': measure(lambda: client.get(url, broad), repeat) * 1000,
+    }
+
+
+@benchmark('renderers')
+def renderers_benchmark(elements=None, repeat=None, **options) -> dict:
+    """
+    Время кодирования и размер списка элементов одной версии справочника в каждом доступном формате:
+    JSON (JSONRenderer DRF), JSON через orjson и MessagePack, а также размер и время сжатия gzip и brotli.
+    """
+    elements = elements or 100_000
+    repeat = repeat or 3
+    ref_book_version = generate_refbooks(refbooks=1, versions=1, elements=elements)[0]
+    data = list(RefBookElement.objects.\
+                filter(ref_book_version_id=ref_book_version).\
+                order_by('code').\
+                values(*DirectionElementSerializer.Meta.fields))
+    renderers = {'json': JSONRenderer()}
+    if orjson is not None:
+        renderers['orjson'] = FastJSONRenderer()
+    if msgpack is not None:
+        renderers['msgpack'] = MessagePackRenderer()
+    encodings = ['gzip', *(['br'] if brotli is not None else [])]
+
+    def compress(content, encoding):
+        compressor = StreamCompressor(encoding)
+        return compressor.compress(content) + compressor.finish()
+
+    result = {'elements': elements}
+    for name, renderer in renderers.items():
+        content = renderer.render(data)
+        entry = result[name] = {
+            'encode_ms': measure(lambda: renderer.render(data), repeat) * 1000,
+            'bytes': len(content),
+        }
+        for encoding in encodings:
+            entry[f'{encoding}_bytes'] = len(compress(content, encoding))
+            entry[f'{encoding}_ms'] = measure(lambda: compress(content, encoding), repeat) * 1000
+    return result
@@ -1,5 +1,7 @@
 import django_filters
-from ref_books.models import RefBook, RefBookElement
+from django.db.models import Exists, OuterRef
+from ref_books.models import RefBook, RefBookElement, RefBookVersion
+from ref_books.services.ref_books_service import search_elements
 
 
 class DirectionsFilter(django_filters.FilterSet):
@@ -8,16 +10,20 @@ class DirectionsFilter(django_filters.FilterSet):
 
     :param date: Фильтр по дате начала действия версии справочника (меньше или равно)
     """
-    date = django_filters.DateFilter(field_name='refbookversion__start_date', lookup_expr='lte')
+    date = django_filters.DateFilter(method='filter_date')
 
     class Meta:
         model = RefBook
         fields = ['date']
 
-    def filter_queryset(self, queryset):
-        """Пользовательский метод для возврата уникальных значений"""
-        queryset = super().filter_queryset(queryset)
-        return queryset.distinct()
+    def filter_date(self, queryset, name, value):
+        """
+        Оставляет справочники, у которых есть версия с датой начала действия не позднее указанной.
+        Условие проверяется подзапросом EXISTS по индексу (ref_book_id, start_date), поэтому справочники
+        не соединяются со всеми своими версиями и не требуют DISTINCT
+        """
+        versions = RefBookVersion.objects.filter(ref_book_id=OuterRef('pk'), start_date__lte=value)
+        return queryset.filter(Exists(versions))
 
 
 class DirectionElementFilter(django_filters.FilterSet):
@@ -25,9 +31,23 @@ class DirectionElementFilter(django_filters.FilterSet):
     Фильтры для списка элементов справочника.
 
     :param version: Фильтр по версии справочника
+    :param search: Поиск элементов по началу значения без учета регистра
     """
-    version = django_filters.CharFilter(field_name='ref_book_version_id__version', lookup_expr='exact')
+    version = django_filters.CharFilter(method='filter_version')
+    search = django_filters.CharFilter(method='filter_search')
 
     class Meta:
         model = RefBookElement
-        fields = ['version']
+        fields = ['version', 'search']
+
+    def filter_version(self, queryset, name, value):
+        """
+        Версия справочника выбирается представлением до фильтрации (см. get_ref_book_queryset): элементы,
+        унаследованные от родительской версии, хранятся в строках родительской версии, поэтому условие
+        по номеру версии строки элемента не применяется
+        """
+        return queryset
+
+    def filter_search(self, queryset, name, value):
+        """Оставляет элементы, значение которых начинается с указанной строки без учета регистра"""
+        return search_elements(queryset, value)
@@ -0,0 +1,57 @@
+import json
+import tempfile
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from ref_books.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    """
+    Запускает сценарий оценки производительности на отдельной тестовой базе данных
+    и выводит результаты в формате JSON для сравнения между коммитами.
+    """
+    help = 'Запускает сценарий оценки производительности и выводит результаты в JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(BENCHMARKS), help='Имя сценария')
+        parser.add_argument('--refbooks', type=int, help='Количество справочников')
+        parser.add_argument('--versions', type=int, help='Количество версий каждого справочника')
+        parser.add_argument('--elements', type=int, help='Количество элементов каждой версии')
+        parser.add_argument('--repeat', type=int, help='Количество повторов измерения')
+        parser.add_argument('--requests', type=int, help='Количество запросов к API')
+        parser.add_argument('--concurrency', type=int, help='Количество одновременных запросов к API')
+        parser.add_argument('--output', help='Файл для сохранения результатов, по умолчанию - стандартный вывод')
+
+    # Общий кеш элементов на время оценки хранится в памяти процесса, а снимки версий - во временном каталоге,
+    # чтобы не смешивать записи тестовой базы данных с записями рабочей базы данных
+    CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'ref_books': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'ref_books-benchmark'},
+    }
+
+    def handle(self, *args, **options):
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with tempfile.TemporaryDirectory() as snapshot_dir, \
+                    override_settings(CACHES=self.CACHES, REF_BOOKS_SNAPSHOT_DIR=snapshot_dir):
+                result = BENCHMARKS[options['name']](
+                    refbooks=options['refbooks'],
+                    versions=options['versions'],
+                    elements=options['elements'],
+                    repeat=options['repeat'],
+                    requests=options['requests'],
+                    concurrency=options['concurrency'],
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        report = json.dumps({'benchmark': options['name'], **result}, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(report + '\n')
+        else:
+            self.stdout.write(report)
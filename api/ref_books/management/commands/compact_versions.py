@@ -0,0 +1,67 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ref_books.models import RefBookVersion
+from ref_books.routers import use_primary
+from ref_books.services.versions_service import compact_version
+
+
+class Command(BaseCommand):
+    """
+    Материализует элементы версий справочников, наследующих элементы от родительских версий, если цепочка
+    наследования длиннее допустимой: длинные цепочки замедляют чтение элементов версии.
+    Версия получает полный состав элементов в прежнем порядке и перестает наследовать элементы, поэтому ее кеши
+    и снимки остаются действительными. У версий, наследующих элементы от нее, меняется порядок элементов,
+    и их счетчики изменений увеличиваются.
+    """
+    help = 'Материализует элементы версий справочников с длинными цепочками наследования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--refbook', help='Код справочника, по умолчанию - все справочники')
+        parser.add_argument(
+            '--max-depth',
+            type=int,
+            default=8,
+            help='Наибольшее допустимое количество родительских версий в цепочке наследования',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Материализовать все версии, наследующие элементы, независимо от длины цепочки',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help='Размер пакета чтения и вставки')
+
+    @use_primary()
+    def handle(self, *args, **options):
+        if options['max_depth'] < 1:
+            raise CommandError('Наибольшая длина цепочки должна быть положительной')
+        if options['batch_size'] <= 0:
+            raise CommandError('Размер пакета должен быть положительным')
+        max_depth = 0 if options['all'] else options['max_depth']
+        versions = RefBookVersion.objects.all()
+        if options['refbook']:
+            versions = versions.filter(ref_book_id__code=options['refbook'])
+        parents = dict(versions.filter(parent__isnull=False).values_list('pk', 'parent'))
+
+        def get_depth(version_pk):
+            depth = 0
+            while version_pk in parents:
+                version_pk = parents[version_pk]
+                depth += 1
+            return depth
+
+        compacted = 0
+        for version_pk in sorted(parents, key=get_depth):
+            if get_depth(version_pk) <= max_depth:
+                continue
+            started = time.monotonic()
+            ref_book_version = RefBookVersion.objects.select_related('ref_book_id').get(pk=version_pk)
+            elements = compact_version(ref_book_version, options['batch_size'])
+            del parents[version_pk]
+            compacted += 1
+            self.stdout.write(
+                f'Справочник {ref_book_version.ref_book_id.code}, версия {ref_book_version.version}: '
+                f'{elements} элементов ({time.monotonic() - started:.2f} с)'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Материализовано версий: {compacted}'))
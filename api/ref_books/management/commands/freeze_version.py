@@ -0,0 +1,70 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ref_books.models import RefBookVersion
+from ref_books.routers import use_primary
+from ref_books.services.bloom_filter import build_bloom_filter
+from ref_books.services.element_cache import element_cache
+from ref_books.services.snapshot_service import freeze_version
+from ref_books.services.versions_service import VersionState
+
+
+class Command(BaseCommand):
+    """
+    Публикует снимки элементов версий справочников, из которых API выдает элементы без обращения к базе данных.
+    Снимок перестает использоваться после изменения элементов версии, тогда его нужно опубликовать повторно.
+    Вместе со снимком строится фильтр Блума элементов версии (см. bloom_filter), его размер и ожидаемая доля
+    ложноположительных ответов выводятся в отчете. С параметром --bloom-only строятся только фильтры Блума:
+    они передаются процессам через общий кеш, если снимки недоступны на серверах API.
+    """
+    help = 'Публикует снимки элементов версий справочников'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--refbook', help='Код справочника')
+        parser.add_argument('--refbook-version', help='Номер версии справочника, по умолчанию - все версии')
+        parser.add_argument(
+            '--started',
+            action='store_true',
+            help='Публиковать только версии, дата начала действия которых наступила',
+        )
+        parser.add_argument(
+            '--bloom-only',
+            action='store_true',
+            help='Строить только фильтры Блума, без снимков',
+        )
+
+    @use_primary()
+    def handle(self, *args, **options):
+        versions = RefBookVersion.objects.select_related('ref_book_id').order_by('pk')
+        if options['refbook']:
+            versions = versions.filter(ref_book_id__code=options['refbook'])
+        if options['refbook_version']:
+            if not options['refbook']:
+                raise CommandError('Номер версии указывается вместе с --refbook')
+            versions = versions.filter(version=options['refbook_version'])
+        if options['started']:
+            versions = versions.filter(start_date__lte=datetime.date.today())
+        if not versions.exists():
+            raise CommandError('Не найдено версий справочников для публикации')
+
+        for ref_book_version in versions.iterator():
+            started = time.monotonic()
+            report = []
+            if not options['bloom_only']:
+                path = freeze_version(ref_book_version)
+                element_cache.invalidate(version_pk=ref_book_version.pk)
+                report.append(f'{path} {path.stat().st_size} байт')
+            bloom_filter = build_bloom_filter(VersionState(
+                ref_book_version.pk, ref_book_version.revision, ref_book_version.parent_id))
+            if bloom_filter is not None:
+                report.append(
+                    f'фильтр Блума {bloom_filter.size_bytes} байт, '
+                    f'доля ложноположительных ответов {bloom_filter.false_positive_rate:.4%}'
+                )
+            report.append(f'{time.monotonic() - started:.2f} с')
+            self.stdout.write(
+                f'Справочник {ref_book_version.ref_book_id.code}, версия {ref_book_version.version}: '
+                + ', '.join(report)
+            )
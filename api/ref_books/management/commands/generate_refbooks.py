@@ -0,0 +1,56 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ref_books.models import RefBook
+from ref_books.routers import use_primary
+from ref_books.services.generator_service import generate_refbooks
+from ref_books.services.versions_service import refresh_current_version
+
+
+class Command(BaseCommand):
+    """
+    Создает синтетические справочники для нагрузочного тестирования и планирования мощностей:
+    заданное количество справочников, версий каждого справочника и элементов каждой версии.
+    Записи вставляются пакетами в одной транзакции, после чего пересчитываются указатели текущих версий.
+    """
+    help = 'Создает синтетические справочники, версии и элементы'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--refbooks', type=int, default=100, help='Количество справочников')
+        parser.add_argument('--versions', type=int, default=5, help='Количество версий каждого справочника')
+        parser.add_argument('--elements', type=int, default=1000, help='Количество элементов каждой версии')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Размер пакета вставки')
+        parser.add_argument(
+            '--start-date',
+            type=datetime.date.fromisoformat,
+            default=datetime.date(2020, 1, 1),
+            help='Дата начала действия первой версии (YYYY-MM-DD), версии начинают действовать ежедневно',
+        )
+        parser.add_argument('--code-prefix', default='synthetic', help='Префикс кодов справочников')
+
+    @use_primary()
+    def handle(self, *args, **options):
+        if min(options['refbooks'], options['versions'], options['batch_size']) < 1 or options['elements'] < 0:
+            raise CommandError('Количество справочников, версий и размер пакета должны быть положительными')
+        if RefBook.objects.filter(code__startswith=f'{options["code_prefix"]}-').exists():
+            raise CommandError(f'Справочники с префиксом кода {options["code_prefix"]} уже существуют')
+
+        started = time.monotonic()
+        with transaction.atomic():
+            ref_book_versions = generate_refbooks(
+                refbooks=options['refbooks'],
+                versions=options['versions'],
+                elements=options['elements'],
+                batch_size=options['batch_size'],
+                start_date=options['start_date'],
+                code_prefix=options['code_prefix'],
+            )
+            for ref_book_id in sorted({version.ref_book_id_id for version in ref_book_versions}):
+                refresh_current_version(ref_book_id)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано справочников: {options["refbooks"]}, версий: {len(ref_book_versions)}, '
+            f'элементов: {len(ref_book_versions) * options["elements"]} ({time.monotonic() - started:.2f} с)'
+        ))
@@ -0,0 +1,148 @@
+import datetime
+import time
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from ref_books.models import RefBook, RefBookVersion
+from ref_books.routers import use_primary
+from ref_books.services.element_cache import element_cache
+from ref_books.services.import_service import (
+    clear_version_elements,
+    import_delta_elements,
+    import_elements,
+    read_csv_rows,
+    read_jsonl_rows,
+)
+from ref_books.services.versions_service import bump_version_revision, get_version_descendants
+
+
+class Command(BaseCommand):
+    """
+    Потоковая загрузка элементов версии справочника из CSV или JSON Lines.
+    Файл читается по строкам и загружается пакетами в одной транзакции на версию.
+    С параметром --parent файл содержит полный состав версии, но в версию записываются только отличия
+    от родительской версии, остальные элементы наследуются (см. import_delta_elements).
+    """
+    help = 'Загружает элементы версии справочника из CSV/JSONL-файла'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=Path, help='Путь к файлу с элементами')
+        parser.add_argument('--refbook', required=True, help='Код справочника')
+        parser.add_argument('--name', help='Наименование справочника, если его требуется создать')
+        parser.add_argument('--refbook-version', required=True, help='Номер версии справочника')
+        parser.add_argument(
+            '--start-date',
+            type=datetime.date.fromisoformat,
+            help='Дата начала действия версии (YYYY-MM-DD), обязательна для новой версии',
+        )
+        parser.add_argument(
+            '--format',
+            dest='file_format',
+            choices=('csv', 'jsonl'),
+            help='Формат файла, по умолчанию определяется по расширению',
+        )
+        parser.add_argument('--delimiter', default=',', help='Разделитель колонок CSV')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Размер пакета вставки')
+        parser.add_argument(
+            '--parent',
+            help='Номер родительской версии справочника: сохраняются только отличия от нее',
+        )
+        parser.add_argument(
+            '--replace',
+            action='store_true',
+            help='Удалить существующие элементы версии перед загрузкой',
+        )
+
+    @use_primary()
+    def handle(self, *args, **options):
+        path = options['path']
+        if not path.is_file():
+            raise CommandError(f'Файл {path} не найден')
+        if options['batch_size'] <= 0:
+            raise CommandError('Размер пакета должен быть положительным')
+        file_format = options['file_format'] or path.suffix.lstrip('.').lower()
+        if file_format not in ('csv', 'jsonl'):
+            raise CommandError('Не удалось определить формат файла, укажите --format')
+
+        started = time.monotonic()
+
+        def report(imported):
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'Загружено {imported} элементов, {imported / elapsed:.0f} строк/с')
+
+        try:
+            with path.open(encoding='utf-8', newline='') as file, transaction.atomic():
+                ref_book_version = self.get_ref_book_version(options)
+                if options['replace']:
+                    clear_version_elements(ref_book_version)
+                if file_format == 'csv':
+                    rows = read_csv_rows(file, delimiter=options['delimiter'])
+                else:
+                    rows = read_jsonl_rows(file)
+                progress = report if options['verbosity'] > 1 else None
+                if ref_book_version.parent_id is None:
+                    imported = import_elements(ref_book_version, rows, options['batch_size'], progress=progress)
+                else:
+                    imported = import_delta_elements(
+                        ref_book_version, rows, options['batch_size'], progress=progress)
+                version_pks = {ref_book_version.pk, *get_version_descendants([ref_book_version.pk])}
+                bump_version_revision(version_pks)
+                transaction.on_commit(lambda: self.invalidate_cache(version_pks))
+        except (ValueError, IntegrityError) as error:
+            raise CommandError(f'Загрузка отменена: {error}') from error
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено {imported} элементов в версию {ref_book_version.version} справочника '
+            f'{ref_book_version.ref_book_id.code} за {elapsed:.2f} с ({imported / max(elapsed, 1e-9):.0f} строк/с)'
+        ))
+
+    @staticmethod
+    def invalidate_cache(version_pks) -> None:
+        """Сбрасывает кеш элементов загруженной версии и наследующих от нее версий"""
+        for version_pk in version_pks:
+            element_cache.invalidate(version_pk=version_pk)
+
+    def get_ref_book_version(self, options) -> RefBookVersion:
+        """Возвращает версию справочника, создавая справочник и версию при необходимости"""
+        ref_book = RefBook.objects.filter(code=options['refbook']).first()
+        if ref_book is None:
+            if not options['name']:
+                raise CommandError(f'Справочник {options["refbook"]} не найден, укажите --name для его создания')
+            ref_book = RefBook.objects.create(code=options['refbook'], name=options['name'])
+        parent = None
+        if options['parent']:
+            parent = RefBookVersion.objects.filter(ref_book_id=ref_book, version=options['parent']).first()
+            if parent is None:
+                raise CommandError(f'Родительская версия {options["parent"]} не найдена')
+        ref_book_version = RefBookVersion.objects.\
+            filter(ref_book_id=ref_book, version=options['refbook_version']).first()
+        if ref_book_version is None:
+            if options['start_date'] is None:
+                raise CommandError('Для новой версии укажите --start-date')
+            ref_book_version = RefBookVersion.objects.create(
+                ref_book_id=ref_book,
+                version=options['refbook_version'],
+                start_date=options['start_date'],
+                parent=parent,
+            )
+            return ref_book_version
+        update_fields = []
+        if options['start_date'] is not None and options['start_date'] != ref_book_version.start_date:
+            ref_book_version.start_date = options['start_date']
+            update_fields.append('start_date')
+        if parent is not None and parent.pk != ref_book_version.parent_id:
+            if not options['replace']:
+                raise CommandError('Для загрузки отличий в существующую версию укажите --replace')
+            ref_book_version.parent = parent
+            try:
+                ref_book_version.clean()
+            except ValidationError as error:
+                raise CommandError('; '.join(error.messages)) from error
+            update_fields.append('parent')
+        if update_fields:
+            ref_book_version.save(update_fields=update_fields)
+        return ref_book_version
@@ -0,0 +1,44 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from ref_books.models import RefBook
+from ref_books.routers import use_primary
+from ref_books.services.element_cache import element_cache
+from ref_books.services.versions_service import refresh_current_version, refresh_version_intervals
+
+
+class Command(BaseCommand):
+    """
+    Переводит указатель текущей версии справочников на версии, дата начала действия которых наступила.
+    Предназначена для ежедневного запуска по расписанию (например, из cron).
+    """
+    help = 'Пересчитывает указатели на текущие версии справочников'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            type=datetime.date.fromisoformat,
+            default=None,
+            help='Дата, на которую определяются текущие версии (YYYY-MM-DD), по умолчанию - сегодня',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересчитать указатели и интервалы действия версий всех справочников, а не только устаревшие указатели',
+        )
+
+    @use_primary()
+    def handle(self, *args, **options):
+        today = options['date'] or datetime.date.today()
+        ref_books = RefBook.objects.all()
+        if not options['all']:
+            ref_books = ref_books.filter(actual_version_expires__lte=today)
+        refreshed = 0
+        for ref_book_id in ref_books.values_list('pk', flat=True).iterator():
+            refresh_current_version(ref_book_id, today)
+            if options['all']:
+                refresh_version_intervals(ref_book_id)
+            element_cache.invalidate(ref_book_id=ref_book_id)
+            refreshed += 1
+        self.stdout.write(self.style.SUCCESS(f'Обновлено справочников: {refreshed}'))
@@ -0,0 +1,265 @@
+import zlib
+from contextlib import contextmanager
+from typing import Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from ref_books.routers import use_primary
+from ref_books.services.metrics_service import RequestMetrics, current_request_metrics, metrics_registry
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+class MetricsMiddleware:
+    """
+    Собирает показатели каждого запроса: количество и время SQL-запросов, время сериализации (рендеринга)
+    ответа DRF, размер и длительность ответа. Показатели группируются по имени url и доступны
+    по адресу /metrics в формате Prometheus. Если включена настройка REF_BOOKS_METRICS_SERVER_TIMING,
+    показатели запроса также передаются в заголовке Server-Timing.
+    Поддерживает синхронный и асинхронный режимы, поэтому не переводит ASGI-представления в поток.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = request.ref_books_metrics = RequestMetrics()
+        with self.collect(metrics):
+            response = self.get_response(request)
+        return self.process_metrics(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = request.ref_books_metrics = RequestMetrics()
+        with self.collect(metrics):
+            response = await self.get_response(request)
+        return self.process_metrics(request, response, metrics)
+
+    def process_template_response(self, request, response):
+        """Измеряет время рендеринга ответов DRF, которые рендерятся после выхода из представления"""
+        metrics = getattr(request, 'ref_books_metrics', None)
+        if metrics is not None:
+            metrics.start_render()
+            response.add_post_render_callback(lambda rendered: metrics.finish_render())
+        return response
+
+    @staticmethod
+    @contextmanager
+    def collect(metrics: RequestMetrics):
+        """Учитывает SQL-запросы, выполняемые в контексте, в показателях запроса. Запросы учитываются оберткой
+        соединений record_query, поэтому учитываются и запросы из потоков sync_to_async асинхронных представлений"""
+        token = current_request_metrics.set(metrics)
+        try:
+            yield
+        finally:
+            current_request_metrics.reset(token)
+
+    def process_metrics(self, request, response, metrics: RequestMetrics):
+        """Записывает показатели запроса в реестр и добавляет заголовок Server-Timing"""
+        resolver_match = getattr(request, 'resolver_match', None)
+        endpoint = resolver_match.url_name or resolver_match.view_name if resolver_match else 'unresolved'
+        if getattr(settings, 'REF_BOOKS_METRICS_SERVER_TIMING', False):
+            response['Server-Timing'] = ', '.join((
+                f'db;dur={metrics.db_seconds * 1000:.3f};desc="{metrics.queries} queries"',
+                f'render;dur={metrics.render_seconds * 1000:.3f}',
+                f'total;dur={metrics.duration_seconds * 1000:.3f}',
+            ))
+
+        if not response.streaming:
+            metrics_registry.record(endpoint, request.method, response.status_code, metrics, len(response.content))
+        elif response.is_async:
+            metrics_registry.record(endpoint, request.method, response.status_code, metrics, 0)
+        else:
+            response.streaming_content = self.count_streamed(
+                response.streaming_content, endpoint, request.method, response.status_code, metrics)
+        return response
+
+    def count_streamed(self, chunks, endpoint, method, status, metrics: RequestMetrics):
+        """Учитывает SQL-запросы и размер потокового ответа, показатели записываются после последнего фрагмента"""
+        size = 0
+        chunks = iter(chunks)
+        try:
+            while True:
+                # Показатели подключаются на время получения каждого фрагмента: между фрагментами генератор
+                # может продолжаться в другом контексте
+                with self.collect(metrics):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                size += len(chunk)
+                yield chunk
+        finally:
+            metrics_registry.record(endpoint, method, status, metrics, size)
+
+
+class StreamCompressor:
+    """Потоковое сжатие фрагментов ответа в формате gzip или brotli"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == 'br':
+            self.compressor = brotli.Compressor(quality=getattr(settings, 'REF_BOOKS_COMPRESSION_BROTLI_QUALITY', 4))
+        else:
+            level = getattr(settings, 'REF_BOOKS_COMPRESSION_GZIP_LEVEL', 6)
+            self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        """Сжимает фрагмент и сбрасывает буфер, чтобы клиент получал данные по мере формирования ответа"""
+        if self.encoding == 'br':
+            return self.compressor.process(data) + self.compressor.flush()
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        """Завершает сжатый поток"""
+        if self.encoding == 'br':
+            return self.compressor.finish()
+        return self.compressor.flush()
+
+
+class CompressionMiddleware:
+    """
+    Сжимает ответы в формате brotli (если установлен пакет brotli) или gzip в зависимости от заголовка
+    Accept-Encoding запроса. Сжимаются только ответы API с типами содержимого из REF_BOOKS_COMPRESSION_CONTENT_TYPES
+    (JSON, MessagePack, выгрузка): они не содержат секретов, поэтому сжатие не открывает атаку BREACH,
+    от которой GZipMiddleware защищает HTML-страницы с токенами CSRF. Страницы административной панели
+    и документации API не сжимаются. Ответы меньше REF_BOOKS_COMPRESSION_MIN_SIZE байт не сжимаются,
+    потоковые ответы (выгрузка, изменения между версиями) сжимаются по фрагментам.
+    Строгий ETag сжатого ответа становится слабым, как в GZipMiddleware Django, условные запросы
+    при этом продолжают работать. В отличие от GZipMiddleware поддерживает асинхронный режим без перехода в поток.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    @staticmethod
+    def select_encoding(request) -> Optional[str]:
+        """Выбирает способ сжатия из заголовка Accept-Encoding: brotli предпочтительнее gzip"""
+        accepted = set()
+        for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+            coding, *params = (part.strip() for part in item.split(';'))
+            quality = next((param[2:] for param in params if param.startswith('q=')), '1')
+            try:
+                if float(quality) > 0:
+                    accepted.add(coding.lower())
+            except ValueError:
+                continue
+        if brotli is not None and 'br' in accepted:
+            return 'br'
+        if 'gzip' in accepted:
+            return 'gzip'
+        return None
+
+    @staticmethod
+    def is_compressible(response) -> bool:
+        """Проверяет, относится ли тип содержимого ответа к сжимаемым ответам API"""
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        return content_type in getattr(settings, 'REF_BOOKS_COMPRESSION_CONTENT_TYPES', ())
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding') or response.status_code == 304 or \
+                not self.is_compressible(response):
+            return response
+        min_size = getattr(settings, 'REF_BOOKS_COMPRESSION_MIN_SIZE', 1024)
+        if not response.streaming and len(response.content) < min_size:
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = self.select_encoding(request)
+        if encoding is None:
+            return response
+
+        compressor = StreamCompressor(encoding)
+        if not response.streaming:
+            compressed = compressor.compress(response.content) + compressor.finish()
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+        elif response.is_async:
+            response.streaming_content = self.acompress_stream(response.streaming_content, compressor)
+            del response['Content-Length']
+        else:
+            response.streaming_content = self.compress_stream(response.streaming_content, compressor)
+            del response['Content-Length']
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
+
+    @staticmethod
+    def compress_stream(chunks, compressor: StreamCompressor):
+        """Сжимает фрагменты потокового ответа"""
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+
+    @staticmethod
+    async def acompress_stream(chunks, compressor: StreamCompressor):
+        """Сжимает фрагменты асинхронного потокового ответа"""
+        async for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+
+
+class PrimaryPinningMiddleware:
+    """
+    Закрепляет чтение за основной базой данных (см. PrimaryReplicaRouter) в запросах с небезопасными методами
+    и в запросах к адресам, начинающимся с префиксов из настройки REF_BOOKS_PRIMARY_PATHS (административная панель),
+    чтобы изменения были видны сразу после записи. Остальные запросы читают данные из реплик.
+    """
+    sync_capable = True
+    async_capable = True
+
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.is_primary_request(request):
+            return self.get_response(request)
+        with use_primary():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        if not self.is_primary_request(request):
+            return await self.get_response(request)
+        with use_primary():
+            return await self.get_response(request)
+
+    def is_primary_request(self, request) -> bool:
+        """Проверяет, должен ли запрос читать данные из основной базы данных"""
+        if request.method not in self.SAFE_METHODS:
+            return True
+        return request.path_info.startswith(tuple(getattr(settings, 'REF_BOOKS_PRIMARY_PATHS', ('/admin/',))))
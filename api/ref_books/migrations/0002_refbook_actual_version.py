@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-18 04:18
+import datetime
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_actual_versions(apps, schema_editor):
+    RefBook = apps.get_model('ref_books', 'RefBook')
+    RefBookVersion = apps.get_model('ref_books', 'RefBookVersion')
+    today = datetime.date.today()
+    for ref_book in RefBook.objects.all():
+        versions = RefBookVersion.objects.filter(ref_book_id=ref_book.pk)
+        ref_book.actual_version = versions.filter(start_date__lte=today).order_by('-start_date').first()
+        ref_book.actual_version_expires = versions.filter(start_date__gt=today).\
+            order_by('start_date').values_list('start_date', flat=True).first()
+        ref_book.save(update_fields=['actual_version', 'actual_version_expires'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ref_books', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='refbook',
+            name='actual_version',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='ref_books.refbookversion', verbose_name='текущая версия'),
+        ),
+        migrations.AddField(
+            model_name='refbook',
+            name='actual_version_expires',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='дата начала действия следующей версии'),
+        ),
+        migrations.RunPython(fill_actual_versions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 04:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ref_books', '0002_refbook_actual_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='refbookelement',
+            index=models.Index(fields=['ref_book_version_id', 'code', 'value'], name='refbookelement_check_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='refbookversion',
+            index=models.Index(fields=['ref_book_id', '-start_date'], name='refbookversion_current_idx'),
+        ),
+    ]
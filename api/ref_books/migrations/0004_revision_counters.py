@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 04:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ref_books', '0003_api_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='refbook',
+            name='revision',
+            field=models.PositiveBigIntegerField(default=1, editable=False, verbose_name='счетчик изменений справочника и его версий'),
+        ),
+        migrations.AddField(
+            model_name='refbookversion',
+            name='revision',
+            field=models.PositiveBigIntegerField(default=1, editable=False, verbose_name='счетчик изменений элементов версии'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-18 04:30
+
+from django.db import migrations, models
+
+
+def fill_version_intervals(apps, schema_editor):
+    RefBookVersion = apps.get_model('ref_books', 'RefBookVersion')
+    versions = RefBookVersion.objects.filter(start_date__isnull=False).order_by('ref_book_id', 'start_date')
+    previous = None
+    for version in versions:
+        if previous is not None and previous.ref_book_id_id == version.ref_book_id_id:
+            previous.end_date = version.start_date
+            previous.save(update_fields=['end_date'])
+        previous = version
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ref_books', '0004_revision_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='refbookversion',
+            name='end_date',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='дата окончания действия версии'),
+        ),
+        migrations.AddIndex(
+            model_name='refbookversion',
+            index=models.Index(fields=['ref_book_id', 'start_date', 'end_date'], name='refbookversion_interval_idx'),
+        ),
+        migrations.RunPython(fill_version_intervals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 04:39
+
+from django.db import migrations, models
+
+
+def fill_value_lower(apps, schema_editor):
+    # Функция lower() в SQLite меняет регистр только латинских букв, поэтому значения приводятся в Python
+    RefBookElement = apps.get_model('ref_books', 'RefBookElement')
+    last_pk = 0
+    while True:
+        batch = list(RefBookElement.objects.filter(pk__gt=last_pk).order_by('pk').only('value')[:5000])
+        if not batch:
+            return
+        for element in batch:
+            element.value_lower = element.value.lower()[:300]
+        RefBookElement.objects.bulk_update(batch, ['value_lower'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ref_books', '0005_version_intervals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='refbookelement',
+            name='value_lower',
+            field=models.CharField(default='', editable=False, max_length=300, verbose_name='значение элемента для поиска'),
+        ),
+        migrations.RunPython(fill_value_lower, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='refbookelement',
+            index=models.Index(fields=['ref_book_version_id', 'value_lower'], name='refbookelement_search_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 04:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ref_books', '0006_element_value_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='refbookelement',
+            name='is_removed',
+            field=models.BooleanField(default=False, verbose_name='удален'),
+        ),
+        migrations.AddField(
+            model_name='refbookversion',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='children', to='ref_books.refbookversion', verbose_name='родительская версия'),
+        ),
+    ]
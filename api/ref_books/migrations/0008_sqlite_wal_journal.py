@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+def enable_wal_journal(apps, schema_editor):
+    """Переводит базу данных SQLite в журнал WAL, при котором запись не блокирует чтение.
+    Режим журнала сохраняется в файле базы данных, поэтому устанавливается один раз, а не при каждом соединении"""
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode = WAL')
+
+
+class Migration(migrations.Migration):
+
+    # Режим журнала нельзя изменить внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('ref_books', '0007_copy_on_write_versions'),
+    ]
+
+    operations = [
+        migrations.RunPython(enable_wal_journal, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 05:10
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ref_books', '0008_sqlite_wal_journal'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='refbookversion',
+            name='refbookversion_current_idx',
+        ),
+    ]
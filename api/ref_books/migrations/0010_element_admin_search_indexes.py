@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 05:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ref_books', '0009_remove_refbookversion_current_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='refbookelement',
+            index=models.Index(fields=['code'], name='refbookelement_code_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='refbookelement',
+            index=models.Index(fields=['value_lower'], name='refbookelement_value_lower_idx'),
+        ),
+    ]
@@ -1,9 +1,39 @@
 import datetime
 
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import OuterRef, Subquery
 from django.utils.translation import gettext_lazy as _
 
 
+SEARCH_VALUE_MAX_LENGTH = 300
+
+
+def normalize_search_value(value: str) -> str:
+    """Приводит значение элемента (или строку поиска) к виду, в котором выполняется поиск: нижний регистр"""
+    return value.lower()[:SEARCH_VALUE_MAX_LENGTH]
+
+
+class RefBookQuerySet(models.QuerySet):
+    """QuerySet справочников"""
+
+    def with_current_version(self, date=None):
+        """
+        Добавляет к справочникам сведения о версии, действующей на указанную дату (по умолчанию - на сегодня):
+        current_version_pk, current_version_number и current_version_start_date.
+        Версия определяется подзапросом, поэтому количество запросов не зависит от количества справочников.
+        """
+        date = date or datetime.date.today()
+        versions = RefBookVersion.objects.\
+            filter(ref_book_id=OuterRef('pk'), start_date__lte=date).\
+            order_by('-start_date')
+        return self.annotate(
+            current_version_pk=Subquery(versions.values('pk')[:1]),
+            current_version_number=Subquery(versions.values('version')[:1]),
+            current_version_start_date=Subquery(versions.values('start_date')[:1]),
+        )
+
+
 class RefBook(models.Model):
     """Модель справочника"""
     class Meta:
@@ -13,10 +43,42 @@ class RefBook(models.Model):
     code = models.CharField(max_length=100, unique=True, verbose_name=_('код'))
     name = models.CharField(max_length=300, verbose_name=_('наименование'))
     description = models.TextField(blank=True, null=True, verbose_name=_('описание'))
+    actual_version = models.ForeignKey(
+        'RefBookVersion',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='+',
+        verbose_name=_('текущая версия')
+    )
+    actual_version_expires = models.DateField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name=_('дата начала действия следующей версии')
+    )
+    revision = models.PositiveBigIntegerField(
+        default=1,
+        editable=False,
+        verbose_name=_('счетчик изменений справочника и его версий')
+    )
+
+    objects = RefBookQuerySet.as_manager()
 
     @property
     def current_version(self):
-        """Свойство для вывода текущей версии справочника"""
+        """Свойство для вывода текущей версии справочника.
+        Если справочник получен через with_current_version, версия берется из аннотаций без запроса к базе данных"""
+        if hasattr(self, 'current_version_pk'):
+            if self.current_version_pk is None:
+                return None
+            return RefBookVersion(
+                pk=self.current_version_pk,
+                ref_book_id=self,
+                version=self.current_version_number,
+                start_date=self.current_version_start_date,
+            )
         today = datetime.date.today()
         version = RefBookVersion.objects.\
             filter(
@@ -35,6 +97,11 @@ class RefBookVersion(models.Model):
         verbose_name = _('версия справочника')
         verbose_name_plural = _('версии справочников')
         unique_together = (('ref_book_id', 'version'), ('ref_book_id', 'start_date'))
+        # Один индекс интервалов обслуживает и поиск версии на дату, и поиск текущей версии (обратным обходом
+        # по start_date); отдельный индекс (ref_book_id, -start_date) повторял бы уникальное ограничение
+        indexes = [
+            models.Index(fields=['ref_book_id', 'start_date', 'end_date'], name='refbookversion_interval_idx'),
+        ]
 
     ref_book_id = models.ForeignKey(
         RefBook,
@@ -43,6 +110,41 @@ class RefBookVersion(models.Model):
     )
     version = models.CharField(max_length=50, verbose_name=_('версия'))
     start_date = models.DateField(null=True, blank=True, verbose_name=_('дата начала действия версии'))
+    # Дата начала действия следующей версии справочника: версия действует в интервале [start_date, end_date),
+    # пустое значение - бессрочно. Поддерживается сигналами, см. refresh_version_intervals
+    end_date = models.DateField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name=_('дата окончания действия версии')
+    )
+    revision = models.PositiveBigIntegerField(
+        default=1,
+        editable=False,
+        verbose_name=_('счетчик изменений элементов версии')
+    )
+    # Версия, от которой наследуются элементы: в версии хранятся только добавленные и измененные элементы
+    # и отметки об удалении (is_removed), остальные элементы берутся из родительской версии.
+    # См. resolve_chain_elements и команду compact_versions
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.RESTRICT,
+        null=True,
+        blank=True,
+        related_name='children',
+        verbose_name=_('родительская версия')
+    )
+
+    def clean(self):
+        if self.parent_id is None:
+            return
+        if self.parent.ref_book_id_id != self.ref_book_id_id:
+            raise ValidationError({'parent': _('Родительская версия должна относиться к тому же справочнику')})
+        ancestor = self.parent
+        while ancestor is not None:
+            if ancestor.pk == self.pk:
+                raise ValidationError({'parent': _('Версия не может наследовать элементы от самой себя')})
+            ancestor = ancestor.parent
 
     def __str__(self):
         return f"id {self.id},  версия {self.version}, справочник: {self.ref_book_id.name}"
@@ -54,6 +156,13 @@ class RefBookElement(models.Model):
         verbose_name = _('элемент справочник')
         verbose_name_plural = _('элементы справочников')
         unique_together = ('ref_book_version_id', 'code')
+        indexes = [
+            models.Index(fields=['ref_book_version_id', 'code', 'value'], name='refbookelement_check_idx'),
+            models.Index(fields=['ref_book_version_id', 'value_lower'], name='refbookelement_search_idx'),
+            # Поиск элементов всех версий в административной панели (по точному коду или началу значения)
+            models.Index(fields=['code'], name='refbookelement_code_idx'),
+            models.Index(fields=['value_lower'], name='refbookelement_value_lower_idx'),
+        ]
 
     ref_book_version_id = models.ForeignKey(
         RefBookVersion,
@@ -62,3 +171,27 @@ class RefBookElement(models.Model):
     )
     code = models.CharField(max_length=100, verbose_name=_('код элемента'))
     value = models.CharField(max_length=300, verbose_name=_('значение элемента'))
+    # Значение в нижнем регистре для поиска по началу значения без учета регистра (см. normalize_search_value).
+    # Заполняется при сохранении элемента, при вставке через bulk_create заполняется вызывающим кодом
+    value_lower = models.CharField(
+        max_length=SEARCH_VALUE_MAX_LENGTH,
+        default='',
+        editable=False,
+        verbose_name=_('значение элемента для поиска')
+    )
+    # Отметка об удалении унаследованного от родительской версии элемента с этим кодом
+    is_removed = models.BooleanField(default=False, verbose_name=_('удален'))
+
+    def clean(self):
+        if self.is_removed and self.ref_book_version_id_id is not None and \
+                self.ref_book_version_id.parent_id is None:
+            raise ValidationError({
+                'is_removed': _('Удалять можно только элементы, унаследованные от родительской версии'),
+            })
+
+    def save(self, *args, **kwargs):
+        self.value_lower = normalize_search_value(self.value)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'value' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'value_lower'}
+        super().save(*args, **kwargs)
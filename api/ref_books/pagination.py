@@ -0,0 +1,35 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class OptInCursorPagination(CursorPagination):
+    """
+    Курсорная (keyset) пагинация, включаемая по запросу клиента.
+
+    Если в запросе нет параметров cursor и page_size, список возвращается целиком, как и без пагинации.
+    Страница выбирается условием по ключу сортировки, а не смещением, поэтому стоимость получения
+    страницы не зависит от ее номера.
+    """
+    page_size = getattr(settings, 'REF_BOOKS_PAGE_SIZE', 100)
+    max_page_size = getattr(settings, 'REF_BOOKS_MAX_PAGE_SIZE', 1000)
+    page_size_query_param = 'page_size'
+
+    def is_requested(self, request):
+        """Проверяет, запросил ли клиент постраничную выдачу"""
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+class DirectionCursorPagination(OptInCursorPagination):
+    """Курсорная пагинация списка справочников по идентификатору"""
+    ordering = 'id'
+
+
+class DirectionElementCursorPagination(OptInCursorPagination):
+    """Курсорная пагинация элементов версии справочника по коду элемента (уникален в пределах версии)"""
+    ordering = ('code', 'id')
@@ -0,0 +1,52 @@
+"""
+Рендереры ответов API.
+
+FastJSONRenderer выдает тот же JSON, что и JSONRenderer DRF, но кодирует его библиотекой orjson,
+если она установлена. MessagePackRenderer выдает компактный двоичный формат MessagePack
+(Accept: application/msgpack или параметр format=msgpack) и подключается в настройках,
+только если установлена библиотека msgpack.
+"""
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+
+# Кодировщик DRF для значений, которые не кодируются напрямую (дата и время, отложенные переводы, Decimal)
+_encoder = JSONEncoder()
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer, кодирующий данные библиотекой orjson. Вывод совпадает с компактным выводом JSONRenderer
+    (UNICODE_JSON и COMPACT_JSON). Если orjson не установлена или клиент запросил отступы, используется JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact or \
+                self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = orjson.dumps(data, default=_encoder.default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        # Как и JSONRenderer, экранирует разделители строк, недопустимые в JavaScript
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Рендерер ответов в формате MessagePack"""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_encoder.default, use_bin_type=True)
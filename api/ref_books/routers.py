@@ -0,0 +1,56 @@
+"""
+Маршрутизация запросов к основной базе данных и репликам только для чтения.
+
+Запись всегда выполняется в основную базу данных (default), чтение - из реплик, перечисленных
+в настройке REF_BOOKS_DATABASE_REPLICAS. Чтение закрепляется за основной базой данных внутри ее транзакций,
+в запросах с небезопасными методами и к административной панели (PrimaryPinningMiddleware),
+а также в блоке use_primary(), чтобы изменения были видны сразу, без задержки репликации.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_use_primary: ContextVar[bool] = ContextVar('ref_books_use_primary', default=False)
+
+
+@contextmanager
+def use_primary():
+    """Закрепляет чтение за основной базой данных в пределах блока (в том числе в асинхронном коде)"""
+    token = _use_primary.set(True)
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+
+def get_replicas():
+    """Возвращает псевдонимы реплик только для чтения из настройки REF_BOOKS_DATABASE_REPLICAS"""
+    return getattr(settings, 'REF_BOOKS_DATABASE_REPLICAS', [])
+
+
+class PrimaryReplicaRouter:
+    """Маршрутизатор баз данных: запись - в основную базу данных, чтение - из случайной реплики"""
+
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+        if not replicas or _use_primary.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплик повторяет схему основной базы данных средствами репликации
+        if db in get_replicas():
+            return False
+        return None
@@ -0,0 +1,22 @@
+import tempfile
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class RefBooksTestRunner(DiscoverRunner):
+    """
+    Запускает тесты с временным каталогом снимков версий справочников: снимки, опубликованные
+    в каталоге разработки (REF_BOOKS_SNAPSHOT_DIR), не должны выдаваться для тестовой базы данных.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._snapshot_dir = tempfile.TemporaryDirectory()
+        self._snapshot_settings = override_settings(REF_BOOKS_SNAPSHOT_DIR=self._snapshot_dir.name)
+        self._snapshot_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._snapshot_settings.disable()
+        self._snapshot_dir.cleanup()
+        super().teardown_test_environment(**kwargs)
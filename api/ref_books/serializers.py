@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 from ref_books.models import RefBook, RefBookElement
 
@@ -15,3 +17,47 @@ class DirectionSerializer(serializers.ModelSerializer):
     class Meta:
         model = RefBook
         fields = ('id', 'code', 'name')
+
+
+class RefBookReferenceField(serializers.Field):
+    """Поле ссылки на справочник: целое число - идентификатор справочника, строка - код справочника"""
+    default_error_messages = {
+        'invalid': _('Укажите идентификатор (число) или код (строка) справочника'),
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, int) and not isinstance(data, bool):
+            return 'id', data
+        if isinstance(data, str) and data:
+            return 'code', data
+        self.fail('invalid')
+
+    def to_representation(self, value):
+        return value[1]
+
+
+class CheckElementsItemSerializer(serializers.Serializer):
+    """Сериализатор проверяемого элемента. Принимает объект или список [справочник, версия, код, значение]"""
+    refbook = RefBookReferenceField()
+    version = serializers.CharField(required=False, allow_null=True, allow_blank=True, default=None)
+    code = serializers.CharField()
+    value = serializers.CharField()
+
+    def to_internal_value(self, data):
+        if isinstance(data, (list, tuple)):
+            if len(data) != 4:
+                raise serializers.ValidationError(_('Ожидается список [справочник, версия, код, значение]'))
+            data = dict(zip(('refbook', 'version', 'code', 'value'), data))
+        return super().to_internal_value(data)
+
+
+class CheckElementsSerializer(serializers.Serializer):
+    """Сериализатор запроса пакетной проверки элементов справочников"""
+    elements = CheckElementsItemSerializer(many=True, allow_empty=False)
+
+    def validate_elements(self, value):
+        max_items = getattr(settings, 'REF_BOOKS_CHECK_ELEMENTS_MAX_ITEMS', 10000)
+        if len(value) > max_items:
+            raise serializers.ValidationError(
+                _('Количество элементов не должно превышать %(max_items)s') % {'max_items': max_items})
+        return value
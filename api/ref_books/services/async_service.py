@@ -0,0 +1,134 @@
+"""Асинхронные варианты функций сервиса справочников для ASGI-представлений (асинхронный ORM Django)"""
+import datetime
+from typing import Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from django.http import Http404
+
+from ref_books.models import RefBook, RefBookVersion
+from ref_books.services.element_cache import VersionElements, element_cache
+from ref_books.services.bloom_filter import aload_bloom_filter, is_definitely_absent
+from ref_books.services.ref_books_service import (
+    VersionState,
+    get_entry_state,
+    make_absent_entry,
+    rejects_uncacheable,
+    set_too_large,
+)
+from ref_books.services.shared_cache import aload_version_elements
+from ref_books.services.snapshot_service import open_snapshot
+from ref_books.services.versions_service import aget_state_chain, refresh_current_version, resolve_chain_elements
+
+
+async def aget_version_at(ref_book_id: int, as_of: datetime.date) -> Optional[Tuple[int, str, int, Optional[int]]]:
+    """
+    Асинхронный вариант get_version_at.
+    :param ref_book_id: Идентификатор справочника
+    :param as_of: Дата
+    :return: Идентификатор, номер версии, значение счетчика изменений ее элементов и идентификатор
+        родительской версии или None, если на указанную дату версий не действовало
+    :raises Http404: Если справочник не найден
+    """
+    row = await RefBookVersion.objects.\
+        filter(ref_book_id=ref_book_id, start_date__lte=as_of).\
+        filter(Q(end_date__gt=as_of) | Q(end_date__isnull=True)).\
+        values_list('pk', 'version', 'revision', 'parent').afirst()
+    if row is None and not await RefBook.objects.filter(id=ref_book_id).aexists():
+        raise Http404
+    return row
+
+
+async def aget_version_state(ref_book_id: int, version: Optional[str] = None,
+                             as_of: Optional[datetime.date] = None) -> Optional[VersionState]:
+    """
+    Асинхронный вариант get_version_state.
+    :param ref_book_id: Идентификатор справочника
+    :param version: Номер версии справочника, если не указан - используется текущая версия
+    :param as_of: Дата, на которую определяется действующая версия (вместо номера версии)
+    :return: Состояние версии или None, если такой версии нет
+    :raises Http404: Если справочник не найден
+    """
+    if as_of is not None:
+        row = await aget_version_at(ref_book_id, as_of)
+        return VersionState(row[0], row[2], row[3]) if row else None
+    if version:
+        if not await RefBook.objects.filter(id=ref_book_id).aexists():
+            raise Http404
+        row = await RefBookVersion.objects.\
+            filter(ref_book_id=ref_book_id, version=version).\
+            values_list('pk', 'revision', 'parent').afirst()
+        return VersionState(*row) if row else None
+
+    ref_book = await RefBook.objects.\
+        filter(id=ref_book_id).\
+        values('actual_version', 'actual_version__revision', 'actual_version__parent', 'actual_version_expires').\
+        afirst()
+    if ref_book is None:
+        raise Http404
+    today = datetime.date.today()
+    if ref_book['actual_version_expires'] is not None and ref_book['actual_version_expires'] <= today:
+        version_pk, _ = await sync_to_async(refresh_current_version)(ref_book_id, today)
+        if version_pk is None:
+            return None
+        revision, parent_pk = await RefBookVersion.objects.filter(pk=version_pk).\
+            values_list('revision', 'parent').afirst()
+        return VersionState(version_pk, revision, parent_pk)
+    if ref_book['actual_version'] is None:
+        return None
+    return VersionState(
+        ref_book['actual_version'], ref_book['actual_version__revision'], ref_book['actual_version__parent'])
+
+
+async def aget_version_elements(ref_book_id: int, version: Optional[str] = None,
+                                as_of: Optional[datetime.date] = None,
+                                pair: Optional[Tuple[str, str]] = None) -> VersionElements:
+    """
+    Асинхронный вариант get_version_elements. При попадании во внутрипроцессный кеш
+    выполняется только запрос состояния версии.
+    :param ref_book_id: Идентификатор справочника
+    :param version: Номер версии справочника, если не указан - используется текущая версия
+    :param as_of: Дата, на которую определяется действующая версия (вместо номера версии)
+    :param pair: Проверяемая пара (код, значение), см. get_version_elements
+    :return: Запись кеша с элементами версии или отметка о том, что элементы версии не помещаются в кеш,
+        с состоянием версии (get_entry_state)
+    """
+    if as_of is not None:
+        row = await aget_version_at(ref_book_id, as_of)
+        if row is not None:
+            version_pk, version, revision, parent_pk = row
+            state = VersionState(version_pk, revision, parent_pk)
+        else:
+            state = None
+    else:
+        state = await aget_version_state(ref_book_id, version)
+    if state is None:
+        return VersionElements(None, None, frozenset(), 0, None, 0)
+    entry = element_cache.get(ref_book_id, version, state.pk, state.revision)
+    if entry is not None:
+        return await _areject_absent(entry, pair)
+
+    snapshot = open_snapshot(state.pk, state.revision)
+    if snapshot is not None:
+        return element_cache.set(
+            ref_book_id, version, state.pk, snapshot, state.revision, size=0, parent_pk=state.parent_pk)
+    if pair is not None and rejects_uncacheable(await aload_bloom_filter(state), pair):
+        return make_absent_entry(state)
+    if not element_cache.can_store(0):
+        return set_too_large(ref_book_id, version, state)
+    elements = await aload_version_elements(ref_book_id, state)
+    if elements is None:
+        limit = element_cache.max_elements + 1
+        rows = resolve_chain_elements(await aget_state_chain(state)).values_list('code', 'value')[:limit]
+        elements = [row async for row in rows]
+    pairs = frozenset(elements)
+    if not element_cache.can_store(len(pairs)):
+        return set_too_large(ref_book_id, version, state)
+    return element_cache.set(ref_book_id, version, state.pk, pairs, state.revision, parent_pk=state.parent_pk)
+
+
+async def _areject_absent(entry: VersionElements, pair: Optional[Tuple[str, str]]) -> VersionElements:
+    if entry.too_large and pair is not None and \
+            is_definitely_absent(await aload_bloom_filter(get_entry_state(entry)), *pair):
+        return make_absent_entry(get_entry_state(entry))
+    return entry
@@ -0,0 +1,236 @@
+"""
+Фильтры Блума пар (код, значение) элементов версий справочников.
+
+Фильтр позволяет проверке элемента отклонить заведомо отсутствующую пару без запроса к таблице элементов:
+отрицательный ответ фильтра точен, а положительный с заданной вероятностью ложный и проверяется запросом
+к базе данных. Фильтр строится только вне запросов к API - при публикации версии (команда freeze_version
+и действие административной панели), хранится в памяти процесса и в общем для процессов кеше
+и привязан к значению счетчика изменений версии, поэтому изменение элементов делает его недействительным.
+"""
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+
+from django.conf import settings
+
+from ref_books.services.shared_cache import get_shared_cache, get_timeout
+from ref_books.services.versions_service import VersionState, get_state_chain, resolve_chain_elements
+
+
+class BloomFilter:
+    """
+    Фильтр Блума пар (код, значение). Позиции битов вычисляются двойным хешированием
+    по 128-битному хешу BLAKE2b пары.
+    """
+
+    def __init__(self, bit_count: int, hash_count: int, revision: Optional[int] = None):
+        self.bit_count = bit_count
+        self.hash_count = hash_count
+        self.revision = revision
+        self.element_count = 0
+        self.bits = bytearray((bit_count + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, element_count: int, false_positive_rate: float, max_bytes: Optional[int] = None,
+                     revision: Optional[int] = None) -> 'BloomFilter':
+        """
+        Создает фильтр оптимального размера для указанного количества элементов и доли ложноположительных ответов.
+        Если размер фильтра ограничен max_bytes, доля ложноположительных ответов возрастает.
+        """
+        element_count = max(element_count, 1)
+        bit_count = math.ceil(-element_count * math.log(false_positive_rate) / math.log(2) ** 2)
+        if max_bytes:
+            bit_count = min(bit_count, max_bytes * 8)
+        bit_count = max(bit_count, 64)
+        hash_count = max(1, round(bit_count / element_count * math.log(2)))
+        return cls(bit_count, hash_count, revision)
+
+    def _positions(self, code: str, value: str) -> Iterable[int]:
+        digest = hashlib.blake2b(f'{code}\x1f{value}'.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + index * second) % self.bit_count for index in range(self.hash_count))
+
+    def add(self, code: str, value: str) -> None:
+        """Добавляет пару (код, значение) в фильтр"""
+        for position in self._positions(code, value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.element_count += 1
+
+    def __contains__(self, pair: Tuple[str, str]) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(*pair))
+
+    @property
+    def size_bytes(self) -> int:
+        """Размер битового массива фильтра в байтах"""
+        return len(self.bits)
+
+    @property
+    def false_positive_rate(self) -> float:
+        """Ожидаемая доля ложноположительных ответов для добавленного количества элементов"""
+        return (1 - math.exp(-self.hash_count * self.element_count / self.bit_count)) ** self.hash_count
+
+
+class BloomFilterRegistry:
+    """
+    Внутрипроцессное хранилище фильтров Блума версий справочников с вытеснением давно не использованных
+    фильтров при превышении суммарного объема. Также подсчитывает проверки и отказы по фильтрам.
+    """
+
+    def __init__(self):
+        self._filters: 'OrderedDict[int, BloomFilter]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.rejections = 0
+
+    def get(self, state: VersionState) -> Optional[BloomFilter]:
+        """Возвращает фильтр версии или None, если его нет или он построен для прежнего счетчика изменений"""
+        with self._lock:
+            bloom_filter = self._filters.get(state.pk)
+            if bloom_filter is None or bloom_filter.revision != state.revision:
+                return None
+            self._filters.move_to_end(state.pk)
+            return bloom_filter
+
+    def set(self, version_pk: int, bloom_filter: BloomFilter, memory_bytes: int) -> None:
+        """Сохраняет фильтр версии, вытесняя давно не использованные фильтры"""
+        with self._lock:
+            self._filters.pop(version_pk, None)
+            if bloom_filter.size_bytes > memory_bytes:
+                return
+            self._filters[version_pk] = bloom_filter
+            while sum(stored.size_bytes for stored in self._filters.values()) > memory_bytes:
+                self._filters.popitem(last=False)
+
+    def record(self, rejected: bool) -> None:
+        """Учитывает проверку пары по фильтру"""
+        with self._lock:
+            self.lookups += 1
+            self.rejections += rejected
+
+    def clear(self) -> None:
+        """Удаляет все фильтры и сбрасывает счетчики"""
+        with self._lock:
+            self._filters.clear()
+            self.lookups = self.rejections = 0
+
+    def render_prometheus(self) -> str:
+        """Возвращает размер и долю ложноположительных ответов фильтров, количество проверок и отказов
+        в текстовом формате Prometheus"""
+        with self._lock:
+            filters = sorted(self._filters.items())
+            lookups, rejections = self.lookups, self.rejections
+        lines = [
+            '# HELP ref_books_bloom_filter_lookups_total Количество проверок элементов по фильтрам Блума',
+            '# TYPE ref_books_bloom_filter_lookups_total counter',
+            f'ref_books_bloom_filter_lookups_total {lookups}',
+            '# HELP ref_books_bloom_filter_rejections_total Количество проверок, отклоненных без запроса к базе данных',
+            '# TYPE ref_books_bloom_filter_rejections_total counter',
+            f'ref_books_bloom_filter_rejections_total {rejections}',
+        ]
+        for name, attribute, description in (
+                ('ref_books_bloom_filter_bytes', 'size_bytes', 'Размер фильтра Блума версии в байтах'),
+                ('ref_books_bloom_filter_elements', 'element_count', 'Количество элементов в фильтре Блума версии'),
+                ('ref_books_bloom_filter_false_positive_rate', 'false_positive_rate',
+                 'Ожидаемая доля ложноположительных ответов фильтра Блума версии'),
+        ):
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} gauge')
+            for version_pk, bloom_filter in filters:
+                lines.append(f'{name}{{version="{version_pk}"}} {getattr(bloom_filter, attribute)}')
+        return '\n'.join(lines) + '\n'
+
+
+bloom_filters = BloomFilterRegistry()
+
+
+def get_bloom_filter_options() -> Optional[dict]:
+    """
+    Возвращает параметры фильтров Блума из настройки REF_BOOKS_BLOOM_FILTER
+    или None, если фильтры отключены
+    """
+    options = getattr(settings, 'REF_BOOKS_BLOOM_FILTER', {})
+    if options is None:
+        return None
+    return {
+        'FALSE_POSITIVE_RATE': options.get('FALSE_POSITIVE_RATE', 0.01),
+        'MAX_BYTES': options.get('MAX_BYTES', 16 * 1024 * 1024),
+        'MEMORY_BYTES': options.get('MEMORY_BYTES', 64 * 1024 * 1024),
+    }
+
+
+def make_bloom_filter_key(version_pk: int) -> str:
+    """Возвращает ключ записи общего кеша с фильтром Блума версии справочника"""
+    return f'ref_books:bloom:{version_pk}'
+
+
+def build_bloom_filter(state: VersionState) -> Optional[BloomFilter]:
+    """
+    Строит фильтр Блума действующих элементов версии справочника (с учетом наследования),
+    сохраняет его в памяти процесса и в общем кеше.
+    :param state: Версия справочника и счетчик изменений ее элементов
+    :return: Фильтр Блума или None, если фильтры отключены
+    """
+    options = get_bloom_filter_options()
+    if options is None:
+        return None
+    elements = resolve_chain_elements(get_state_chain(state))
+    bloom_filter = BloomFilter.for_capacity(
+        elements.count(), options['FALSE_POSITIVE_RATE'], options['MAX_BYTES'], state.revision)
+    for code, value in elements.values_list('code', 'value').iterator(chunk_size=5000):
+        bloom_filter.add(code, value)
+    bloom_filters.set(state.pk, bloom_filter, options['MEMORY_BYTES'])
+    cache = get_shared_cache()
+    if cache is not None:
+        cache.set(make_bloom_filter_key(state.pk), bloom_filter, timeout=get_timeout(), version=state.revision)
+    return bloom_filter
+
+
+def load_bloom_filter(state: VersionState) -> Optional[BloomFilter]:
+    """
+    Возвращает фильтр Блума версии справочника из памяти процесса или общего кеша. Фильтр не строится:
+    построение читает все элементы версии и выполняется только при публикации версии.
+    :param state: Версия справочника и счетчик изменений ее элементов
+    :return: Фильтр Блума или None, если фильтры отключены или фильтр версии не построен
+    """
+    options = get_bloom_filter_options()
+    if options is None:
+        return None
+    bloom_filter = bloom_filters.get(state)
+    if bloom_filter is not None:
+        return bloom_filter
+    cache = get_shared_cache()
+    if cache is None:
+        return None
+    bloom_filter = cache.get(make_bloom_filter_key(state.pk), version=state.revision)
+    if bloom_filter is not None:
+        bloom_filters.set(state.pk, bloom_filter, options['MEMORY_BYTES'])
+    return bloom_filter
+
+
+async def aload_bloom_filter(state: VersionState) -> Optional[BloomFilter]:
+    """Асинхронный вариант load_bloom_filter"""
+    options = get_bloom_filter_options()
+    if options is None:
+        return None
+    bloom_filter = bloom_filters.get(state)
+    if bloom_filter is not None:
+        return bloom_filter
+    cache = get_shared_cache()
+    if cache is None:
+        return None
+    bloom_filter = await cache.aget(make_bloom_filter_key(state.pk), version=state.revision)
+    if bloom_filter is not None:
+        bloom_filters.set(state.pk, bloom_filter, options['MEMORY_BYTES'])
+    return bloom_filter
+
+
+def is_definitely_absent(bloom_filter: Optional[BloomFilter], code: str, value: str) -> bool:
+    """Проверяет по фильтру Блума, что пары (код, значение) заведомо нет в версии, и учитывает проверку"""
+    if bloom_filter is None:
+        return False
+    rejected = (code, value) not in bloom_filter
+    bloom_filters.record(rejected)
+    return rejected
@@ -0,0 +1,76 @@
+import json
+from itertools import islice
+from typing import Iterable, Iterator, Optional, Tuple
+
+from ref_books.services.ref_books_service import VersionState, get_ref_book_queryset
+from ref_books.services.snapshot_service import open_snapshot
+
+DIFF_CONTENT_TYPE = 'application/json; charset=utf-8'
+
+ADDED = 'added'
+REMOVED = 'removed'
+CHANGED = 'changed'
+
+
+def iter_version_pairs(state: Optional[VersionState], chunk_size: int = 2000) -> Iterator[Tuple[str, str]]:
+    """
+    Возвращает пары (код, значение) элементов версии справочника в порядке кодов.
+    Если для версии опубликован снимок, элементы читаются из него, иначе - из базы данных порциями.
+    :param state: Версия справочника и счетчик ее изменений, None - версия без элементов
+    :param chunk_size: Количество элементов, читаемых из базы данных за один запрос
+    :return: Итератор пар (код, значение)
+    """
+    if state is None:
+        return iter(())
+    snapshot = open_snapshot(state.pk, state.revision)
+    if snapshot is not None:
+        return snapshot.iter_by_code()
+    return get_ref_book_queryset(state).\
+        order_by('code').\
+        values_list('code', 'value').\
+        iterator(chunk_size=chunk_size)
+
+
+def diff_pairs(old: Iterable[Tuple[str, str]], new: Iterable[Tuple[str, str]]) -> Iterator[dict]:
+    """
+    Сравнивает два упорядоченных по коду потока элементов слиянием за один проход.
+    Коды уникальны в пределах версии, поэтому элементы с одинаковым кодом сопоставляются друг с другом.
+    Порядок кодов в базе данных должен совпадать с порядком строк Python (двоичная сортировка, как в SQLite).
+    :param old: Элементы исходной версии
+    :param new: Элементы новой версии
+    :return: Итератор изменений: добавленные, удаленные и измененные элементы в порядке кодов
+    """
+    old, new = iter(old), iter(new)
+    old_item, new_item = next(old, None), next(new, None)
+    while old_item is not None or new_item is not None:
+        if new_item is None or (old_item is not None and old_item[0] < new_item[0]):
+            yield {'change': REMOVED, 'code': old_item[0], 'value': old_item[1]}
+            old_item = next(old, None)
+        elif old_item is None or new_item[0] < old_item[0]:
+            yield {'change': ADDED, 'code': new_item[0], 'value': new_item[1]}
+            new_item = next(new, None)
+        else:
+            if old_item[1] != new_item[1]:
+                yield {'change': CHANGED, 'code': new_item[0], 'value': new_item[1], 'old_value': old_item[1]}
+            old_item, new_item = next(old, None), next(new, None)
+
+
+def iter_diff_chunks(from_state: Optional[VersionState], to_state: Optional[VersionState],
+                     chunk_size: int = 2000) -> Iterator[str]:
+    """
+    Построчно формирует JSON-массив изменений между двумя версиями справочника.
+    Элементы версий читаются и сравниваются потоково, поэтому потребление памяти не зависит от размера версий.
+    :param from_state: Исходная версия справочника
+    :param to_state: Новая версия справочника
+    :param chunk_size: Количество изменений в одном фрагменте ответа
+    :return: Итератор фрагментов JSON-массива
+    """
+    changes = diff_pairs(iter_version_pairs(from_state, chunk_size), iter_version_pairs(to_state, chunk_size))
+    separator = '['
+    while True:
+        chunk = list(islice(changes, chunk_size))
+        if not chunk:
+            break
+        yield separator + ','.join(json.dumps(change, ensure_ascii=False) for change in chunk)
+        separator = ','
+    yield '[]' if separator == '[' else ']'
@@ -0,0 +1,162 @@
+import datetime
+import threading
+import time
+from collections import OrderedDict
+from typing import Collection, Dict, NamedTuple, Optional, Set, Tuple
+
+from django.conf import settings
+
+CacheKey = Tuple[int, Optional[str]]
+ElementPairs = Collection[Tuple[str, str]]
+
+
+class VersionElements(NamedTuple):
+    """
+    Запись кеша: элементы одной версии справочника, значение счетчика изменений версии и родительская версия.
+    Для версий, элементы которых не помещаются в кеш, pairs равно None: запись запоминает, что элементы
+    версии читать не нужно, и хранит состояние версии для проверки элементов запросом к базе данных.
+    """
+    version_pk: Optional[int]
+    revision: Optional[int]
+    pairs: Optional[ElementPairs]
+    size: int
+    resolved_on: Optional[datetime.date]
+    expires_at: float
+    parent_pk: Optional[int] = None
+
+    @property
+    def too_large(self) -> bool:
+        """Элементы версии не помещаются в кеш"""
+        return self.pairs is None
+
+
+class ElementCache:
+    """
+    Внутрипроцессный LRU-кеш пар (код, значение) элементов версий справочников.
+    Элементы хранятся в frozenset либо в опубликованном снимке версии (VersionSnapshot), который
+    отображен в память и не учитывается в объеме кеша.
+
+    Ключ кеша - (id справочника, номер версии). Для текущей версии номер версии равен None,
+    такая запись действительна только в день, в который текущая версия была определена.
+    Объем кеша ограничен количеством записей и суммарным количеством элементов во всех записях.
+    Запись проверяется по значению счетчика изменений версии (см. get), кроме того, записи устаревают
+    через timeout секунд.
+    """
+
+    def __init__(self, max_entries: int = 256, max_elements: int = 1_000_000, timeout: float = 60):
+        self.max_entries = max_entries
+        self.max_elements = max_elements
+        self.timeout = timeout
+        self._entries: 'OrderedDict[CacheKey, VersionElements]' = OrderedDict()
+        self._by_ref_book: Dict[int, Set[CacheKey]] = {}
+        self._by_version: Dict[int, Set[CacheKey]] = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> 'ElementCache':
+        """Создает кеш с параметрами из настройки REF_BOOKS_ELEMENT_CACHE"""
+        options = getattr(settings, 'REF_BOOKS_ELEMENT_CACHE', {})
+        return cls(
+            max_entries=options.get('MAX_ENTRIES', 256),
+            max_elements=options.get('MAX_ELEMENTS', 1_000_000),
+            timeout=options.get('TIMEOUT', 60),
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def can_store(self, size: int) -> bool:
+        """Проверяет, помещается ли версия указанного размера в кеш"""
+        return self.max_entries > 0 and size <= self.max_elements
+
+    def get(self, ref_book_id: int, version: Optional[str], version_pk: Optional[int] = None,
+            revision: Optional[int] = None) -> Optional[VersionElements]:
+        """
+        Возвращает запись кеша с элементами версии или None, если записи нет или она устарела.
+        Если указаны идентификатор версии и значение счетчика ее изменений (определенные запросом к базе данных),
+        запись действительна только для них: после изменения версии все процессы перестают использовать
+        свои записи одновременно, не дожидаясь истечения timeout.
+        """
+        key = (ref_book_id, version or None)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.monotonic() or \
+                    (entry.resolved_on is not None and entry.resolved_on != datetime.date.today()) or \
+                    (version_pk is not None and (entry.version_pk, entry.revision) != (version_pk, revision)):
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, ref_book_id: int, version: Optional[str], version_pk: Optional[int],
+            pairs: Optional[ElementPairs], revision: Optional[int] = None, size: Optional[int] = None,
+            parent_pk: Optional[int] = None) -> VersionElements:
+        """
+        Сохраняет элементы версии в кеш, вытесняя давно не использованные записи, и возвращает запись кеша.
+        Если pairs равно None, сохраняется отметка о том, что элементы версии не помещаются в кеш.
+        """
+        key = (ref_book_id, version or None)
+        entry = VersionElements(
+            version_pk=version_pk,
+            revision=revision,
+            pairs=pairs,
+            size=0 if pairs is None else len(pairs) if size is None else size,
+            resolved_on=None if version else datetime.date.today(),
+            expires_at=time.monotonic() + self.timeout,
+            parent_pk=parent_pk,
+        )
+        if not self.can_store(entry.size):
+            return entry
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._size += entry.size
+            self._by_ref_book.setdefault(ref_book_id, set()).add(key)
+            if version_pk is not None:
+                self._by_version.setdefault(version_pk, set()).add(key)
+            while len(self._entries) > self.max_entries or self._size > self.max_elements:
+                self._remove(next(iter(self._entries)))
+        return entry
+
+    def invalidate(self, ref_book_id: Optional[int] = None, version_pk: Optional[int] = None) -> None:
+        """Удаляет из кеша записи указанного справочника и/или указанной версии"""
+        with self._lock:
+            keys = set()
+            if ref_book_id is not None:
+                keys |= self._by_ref_book.get(ref_book_id, set())
+            if version_pk is not None:
+                keys |= self._by_version.get(version_pk, set())
+            for key in keys:
+                self._remove(key)
+
+    def clear(self) -> None:
+        """Очищает кеш"""
+        with self._lock:
+            self._entries.clear()
+            self._by_ref_book.clear()
+            self._by_version.clear()
+            self._size = 0
+
+    def _remove(self, key: CacheKey) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._size -= entry.size
+        self._discard_index(self._by_ref_book, key[0], key)
+        if entry.version_pk is not None:
+            self._discard_index(self._by_version, entry.version_pk, key)
+
+    @staticmethod
+    def _discard_index(index: Dict[int, Set[CacheKey]], index_key: int, key: CacheKey) -> None:
+        keys = index.get(index_key)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del index[index_key]
+
+
+element_cache = ElementCache.from_settings()
@@ -0,0 +1,46 @@
+import csv
+import io
+import json
+from itertools import islice
+from typing import Iterator, Optional
+
+from ref_books.services.ref_books_service import VersionState, get_ref_book_queryset
+
+EXPORT_CONTENT_TYPES = {
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+def iter_export_chunks(state: Optional[VersionState], file_format: str, chunk_size: int = 2000) -> Iterator[str]:
+    """
+    Построчно выгружает элементы версии справочника в формате JSON Lines или CSV.
+    Элементы читаются из базы данных порциями по chunk_size строк, каждая порция отдается
+    одним фрагментом текста, поэтому потребление памяти не зависит от размера версии.
+    :param state: Версия справочника, None - пустая выгрузка
+    :param file_format: Формат выгрузки: jsonl или csv
+    :param chunk_size: Количество элементов в порции
+    :return: Итератор фрагментов выгрузки
+    """
+    if file_format not in EXPORT_CONTENT_TYPES:
+        raise ValueError(f'Неизвестный формат выгрузки: {file_format}')
+    if file_format == 'csv':
+        yield 'code,value\r\n'
+    if state is None:
+        return
+    rows = get_ref_book_queryset(state).\
+        order_by('pk').\
+        values_list('code', 'value').\
+        iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        if file_format == 'csv':
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(chunk)
+            yield buffer.getvalue()
+        else:
+            yield ''.join(
+                json.dumps({'code': code, 'value': value}, ensure_ascii=False) + '\n' for code, value in chunk
+            )
@@ -0,0 +1,55 @@
+import datetime
+from typing import List
+
+from ref_books.models import RefBook, RefBookElement, RefBookVersion, normalize_search_value
+
+
+def generate_refbooks(
+        refbooks: int,
+        versions: int,
+        elements: int,
+        batch_size: int = 5000,
+        start_date: datetime.date = datetime.date(2020, 1, 1),
+        code_prefix: str = 'synthetic') -> List[RefBookVersion]:
+    """
+    Создает синтетические справочники для нагрузочного тестирования и оценки производительности.
+    Версии каждого справочника начинают действовать ежедневно, начиная с start_date.
+    Все записи вставляются пакетами через bulk_create, сигналы моделей не отправляются,
+    поэтому указатели текущих версий пересчитывает вызывающий код (интервалы действия версий заполняются сразу).
+    :param refbooks: Количество справочников
+    :param versions: Количество версий каждого справочника
+    :param elements: Количество элементов каждой версии
+    :param batch_size: Размер пакета вставки
+    :param start_date: Дата начала действия первой версии
+    :param code_prefix: Префикс кодов справочников
+    :return: Созданные версии справочников
+    """
+    ref_books = RefBook.objects.bulk_create([
+        RefBook(code=f'{code_prefix}-{index}', name=f'Синтетический справочник {index}')
+        for index in range(refbooks)
+    ], batch_size=batch_size)
+    ref_book_versions = RefBookVersion.objects.bulk_create([
+        RefBookVersion(
+            ref_book_id=ref_book,
+            version=f'1.{index}',
+            start_date=start_date + datetime.timedelta(days=index),
+            end_date=start_date + datetime.timedelta(days=index + 1) if index + 1 < versions else None,
+        )
+        for ref_book in ref_books for index in range(versions)
+    ], batch_size=batch_size)
+    batch = []
+    for ref_book_version in ref_book_versions:
+        for code in range(elements):
+            value = f'Значение {code} версии {ref_book_version.version}'
+            batch.append(RefBookElement(
+                ref_book_version_id=ref_book_version,
+                code=str(code),
+                value=value,
+                value_lower=normalize_search_value(value),
+            ))
+            if len(batch) >= batch_size:
+                RefBookElement.objects.bulk_create(batch, batch_size=batch_size)
+                batch = []
+    if batch:
+        RefBookElement.objects.bulk_create(batch, batch_size=batch_size)
+    return ref_book_versions
@@ -0,0 +1,141 @@
+import csv
+import json
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Optional, Set, TextIO, Tuple
+
+from ref_books.models import RefBookElement, RefBookVersion, normalize_search_value
+from ref_books.services.versions_service import get_version_chain, resolve_chain_elements
+
+ElementRow = Tuple[str, str]
+
+
+def read_csv_rows(file: TextIO, delimiter: str = ',') -> Iterator[ElementRow]:
+    """
+    Построчно читает элементы справочника из CSV-файла с заголовком, содержащим колонки code и value.
+    :param file: Открытый текстовый файл
+    :param delimiter: Разделитель колонок
+    :return: Итератор пар (код, значение)
+    """
+    reader = csv.DictReader(file, delimiter=delimiter)
+    if reader.fieldnames is None or not {'code', 'value'} <= set(reader.fieldnames):
+        raise ValueError('CSV-файл должен содержать заголовок с колонками code и value')
+    for line_number, row in enumerate(reader, start=2):
+        yield _validate_row(row.get('code'), row.get('value'), line_number)
+
+
+def read_jsonl_rows(file: TextIO) -> Iterator[ElementRow]:
+    """
+    Построчно читает элементы справочника из файла JSON Lines: по одному объекту {"code": ..., "value": ...} на строку.
+    :param file: Открытый текстовый файл
+    :return: Итератор пар (код, значение)
+    """
+    for line_number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        yield _validate_row(row.get('code'), row.get('value'), line_number)
+
+
+def _validate_row(code, value, line_number: int) -> ElementRow:
+    if not code or value is None or value == '':
+        raise ValueError(f'Строка {line_number}: поля code и value обязательны')
+    return str(code), str(value)
+
+
+def clear_version_elements(ref_book_version: RefBookVersion) -> int:
+    """
+    Удаляет все элементы версии справочника одним запросом DELETE.
+    На элементы не ссылаются другие модели, поэтому загрузка удаляемых объектов в память
+    (которую выполняет QuerySet.delete() при наличии обработчиков сигналов) не требуется.
+    Кеш элементов версии сбрасывает вызывающий код.
+    :param ref_book_version: Версия справочника
+    :return: Количество удаленных элементов
+    """
+    queryset = RefBookElement.objects.filter(ref_book_version_id=ref_book_version)
+    return queryset._raw_delete(queryset.db)
+
+
+def import_elements(
+        ref_book_version: RefBookVersion,
+        rows: Iterable[ElementRow],
+        batch_size: int = 5000,
+        progress: Optional[Callable[[int], None]] = None) -> int:
+    """
+    Загружает элементы в версию справочника пакетами через bulk_create.
+    В памяти одновременно находится не более batch_size элементов, поэтому потребление памяти
+    не зависит от размера источника. Транзакцией управляет вызывающий код.
+    :param ref_book_version: Версия справочника
+    :param rows: Итератор пар (код, значение)
+    :param batch_size: Размер пакета вставки
+    :param progress: Функция, вызываемая после каждого пакета с общим количеством загруженных элементов
+    :return: Количество загруженных элементов
+    """
+    rows = iter(rows)
+    imported = 0
+    while True:
+        batch = [
+            RefBookElement(
+                ref_book_version_id=ref_book_version,
+                code=code,
+                value=value,
+                value_lower=normalize_search_value(value),
+            )
+            for code, value in islice(rows, batch_size)
+        ]
+        if not batch:
+            return imported
+        RefBookElement.objects.bulk_create(batch, batch_size=batch_size)
+        imported += len(batch)
+        if progress is not None:
+            progress(imported)
+
+
+def import_delta_elements(
+        ref_book_version: RefBookVersion,
+        rows: Iterable[ElementRow],
+        batch_size: int = 5000,
+        progress: Optional[Callable[[int], None]] = None) -> int:
+    """
+    Загружает полный состав элементов в версию справочника, наследующую элементы от родительской версии.
+    В версию записываются только элементы, добавленные или измененные относительно родительской версии,
+    и отметки об удалении элементов родительской версии, отсутствующих в источнике.
+    Для определения удаленных элементов коды источника хранятся в памяти. Транзакцией управляет вызывающий код.
+    :param ref_book_version: Версия справочника с заполненной родительской версией
+    :param rows: Итератор пар (код, значение)
+    :param batch_size: Размер пакета вставки
+    :param progress: Функция, вызываемая после каждого пакета с общим количеством прочитанных элементов
+    :return: Количество записанных в версию строк
+    """
+    inherited = resolve_chain_elements(get_version_chain(ref_book_version.parent_id))
+    rows = iter(rows)
+    codes: Set[str] = set()
+    read = stored = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        values = dict(inherited.filter(code__in=[code for code, _ in batch]).values_list('code', 'value'))
+        codes.update(code for code, _ in batch)
+        changed = [
+            RefBookElement(
+                ref_book_version_id=ref_book_version,
+                code=code,
+                value=value,
+                value_lower=normalize_search_value(value),
+            )
+            for code, value in batch if values.get(code) != value
+        ]
+        RefBookElement.objects.bulk_create(changed, batch_size=batch_size)
+        read += len(batch)
+        stored += len(changed)
+        if progress is not None:
+            progress(read)
+
+    removed = [code for code in inherited.values_list('code', flat=True).iterator(chunk_size=batch_size)
+               if code not in codes]
+    RefBookElement.objects.bulk_create(
+        (RefBookElement(ref_book_version_id=ref_book_version, code=code, value='', is_removed=True)
+         for code in removed),
+        batch_size=batch_size,
+    )
+    return stored + len(removed)
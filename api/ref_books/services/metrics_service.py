@@ -0,0 +1,158 @@
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+# Границы интервалов гистограммы длительности запросов, в секундах
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+MetricsKey = Tuple[str, str, str]
+
+
+class RequestMetrics:
+    """
+    Показатели одного запроса: количество и суммарное время SQL-запросов, время рендеринга ответа.
+    Экземпляр используется как обертка выполнения SQL-запросов (см. record_query).
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_started = None
+        self.render_seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_seconds += time.perf_counter() - started
+
+    def start_render(self) -> None:
+        """Отмечает начало рендеринга ответа"""
+        self.render_started = time.perf_counter()
+
+    def finish_render(self) -> None:
+        """Отмечает окончание рендеринга ответа"""
+        if self.render_started is not None:
+            self.render_seconds += time.perf_counter() - self.render_started
+            self.render_started = None
+
+    @property
+    def duration_seconds(self) -> float:
+        """Время обработки запроса с момента его поступления"""
+        return time.perf_counter() - self.started
+
+
+# Показатели обрабатываемого запроса. Контекст передается в потоки sync_to_async вместе с переменной,
+# поэтому учитываются и SQL-запросы асинхронных представлений, выполняемые в другом потоке
+current_request_metrics: ContextVar[Optional[RequestMetrics]] = ContextVar('current_request_metrics', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Обертка выполнения SQL-запросов, подключаемая к каждому соединению с базой данных
+    (см. signals.install_query_metrics): учитывает запрос в показателях обрабатываемого запроса, если они собираются.
+    """
+    metrics = current_request_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+class EndpointMetrics:
+    """Накопленные показатели запросов к одной точке API с одним методом и кодом ответа"""
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+        self.response_bytes = 0
+        self.duration_seconds = 0.0
+        self.duration_buckets: List[int] = [0] * len(DURATION_BUCKETS)
+
+
+class MetricsRegistry:
+    """
+    Внутрипроцессный реестр показателей запросов к API с выдачей в текстовом формате Prometheus.
+    Показатели группируются по имени url (endpoint), методу и коду ответа. Каждый процесс-обработчик
+    накапливает собственные показатели, поэтому при нескольких процессах опрашивается каждый из них.
+    """
+
+    def __init__(self):
+        self._endpoints: Dict[MetricsKey, EndpointMetrics] = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, method: str, status: int, metrics: RequestMetrics,
+               response_bytes: int) -> None:
+        """Добавляет показатели обработанного запроса"""
+        duration_seconds = metrics.duration_seconds
+        key = (endpoint, method, str(status))
+        with self._lock:
+            entry = self._endpoints.get(key)
+            if entry is None:
+                entry = self._endpoints[key] = EndpointMetrics()
+            entry.requests += 1
+            entry.queries += metrics.queries
+            entry.max_queries = max(entry.max_queries, metrics.queries)
+            entry.db_seconds += metrics.db_seconds
+            entry.render_seconds += metrics.render_seconds
+            entry.response_bytes += response_bytes
+            entry.duration_seconds += duration_seconds
+            bucket = bisect.bisect_left(DURATION_BUCKETS, duration_seconds)
+            if bucket < len(DURATION_BUCKETS):
+                entry.duration_buckets[bucket] += 1
+
+    def clear(self) -> None:
+        """Сбрасывает накопленные показатели"""
+        with self._lock:
+            self._endpoints.clear()
+
+    def render_prometheus(self) -> str:
+        """Возвращает накопленные показатели в текстовом формате Prometheus"""
+        with self._lock:
+            endpoints = sorted(
+                (key, vars(entry).copy()) for key, entry in self._endpoints.items()
+            )
+        lines = []
+        for name, metric_type, attribute, description in (
+                ('ref_books_requests_total', 'counter', 'requests', 'Количество обработанных запросов'),
+                ('ref_books_db_queries_total', 'counter', 'queries', 'Количество SQL-запросов'),
+                ('ref_books_db_queries_max', 'gauge', 'max_queries', 'Наибольшее количество SQL-запросов за запрос'),
+                ('ref_books_db_seconds_total', 'counter', 'db_seconds', 'Время выполнения SQL-запросов'),
+                ('ref_books_render_seconds_total', 'counter', 'render_seconds', 'Время сериализации ответов'),
+                ('ref_books_response_bytes_total', 'counter', 'response_bytes', 'Размер ответов в байтах'),
+        ):
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for key, entry in endpoints:
+                lines.append(f'{name}{{{_format_labels(key)}}} {entry[attribute]}')
+
+        name = 'ref_books_request_duration_seconds'
+        lines.append(f'# HELP {name} Длительность обработки запросов')
+        lines.append(f'# TYPE {name} histogram')
+        for key, entry in endpoints:
+            labels = _format_labels(key)
+            cumulative = 0
+            for bound, count in zip(DURATION_BUCKETS, entry['duration_buckets']):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {entry["requests"]}')
+            lines.append(f'{name}_sum{{{labels}}} {entry["duration_seconds"]}')
+            lines.append(f'{name}_count{{{labels}}} {entry["requests"]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(key: MetricsKey) -> str:
+    endpoint, method, status = (
+        value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in key
+    )
+    return f'endpoint="{endpoint}",method="{method}",status="{status}"'
+
+
+metrics_registry = MetricsRegistry()
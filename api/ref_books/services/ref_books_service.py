@@ -1,14 +1,309 @@
-from ref_books.models import RefBookElement
+import datetime
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db.models import F, Q
 from django.db.models.query import QuerySet
+from django.shortcuts import get_object_or_404
+
+from ref_books.models import RefBook, RefBookElement, RefBookVersion, normalize_search_value
+from ref_books.services.bloom_filter import BloomFilter, is_definitely_absent, load_bloom_filter
+from ref_books.services.element_cache import VersionElements, element_cache
+from ref_books.services.shared_cache import load_version_elements
+from ref_books.services.snapshot_service import open_snapshot
+from ref_books.services.versions_service import (
+    VersionState,
+    get_current_version_pk,
+    get_state_chain,
+    get_version_chain,
+    resolve_chain_elements,
+)
 
 
-def get_ref_book_queryset(**kwargs) -> QuerySet[RefBookElement]:
+def get_ref_book_queryset(version: Optional[VersionState] = None, **kwargs) -> QuerySet[RefBookElement]:
     """
     Возвращает запрос к базе данных для элементов справочника с заданными фильтрами.
+    :param version: Версия справочника: отбираются ее действующие элементы, в том числе унаследованные
+        от родительской версии
     :param kwargs: Фильтры для запроса
     :return: QuerySet с элементами справочника, удовлетворяющими фильтрам
     """
-    queryset = RefBookElement.objects.\
-        select_related('ref_book_version_id').\
-        filter(**kwargs)
-    return queryset
+    queryset = RefBookElement.objects.all() if version is None else resolve_chain_elements(get_state_chain(version))
+    return queryset.filter(**kwargs)
+
+
+# Наибольший символ Unicode: строки, начинающиеся с префикса, меньше строки префикс + SEARCH_UPPER_BOUND
+SEARCH_UPPER_BOUND = '\U0010ffff'
+
+
+def search_elements(queryset: QuerySet[RefBookElement], search: str) -> QuerySet[RefBookElement]:
+    """
+    Отбирает элементы, значение которых начинается с указанной строки без учета регистра.
+    Условие по началу строки записано как диапазон значений нормализованного столбца value_lower,
+    поэтому поиск выполняется по индексу (ref_book_version_id, value_lower), в отличие от LIKE и ILIKE.
+    :param queryset: Запрос к элементам справочника
+    :param search: Начало значения элемента
+    :return: QuerySet с найденными элементами
+    """
+    prefix = normalize_search_value(search)
+    return queryset.filter(value_lower__gte=prefix, value_lower__lt=prefix + SEARCH_UPPER_BOUND)
+
+
+def get_version_at(ref_book_id: int, as_of: datetime.date) -> Optional[Tuple[int, str, int, Optional[int]]]:
+    """
+    Определяет версию справочника, действовавшую на указанную дату, одним запросом по индексу
+    интервалов действия версий [start_date, end_date).
+    :param ref_book_id: Идентификатор справочника
+    :param as_of: Дата
+    :return: Идентификатор, номер версии, значение счетчика изменений ее элементов и идентификатор
+        родительской версии или None, если на указанную дату версий не действовало
+    :raises Http404: Если справочник не найден
+    """
+    row = RefBookVersion.objects.\
+        filter(ref_book_id=ref_book_id, start_date__lte=as_of).\
+        filter(Q(end_date__gt=as_of) | Q(end_date__isnull=True)).\
+        values_list('pk', 'version', 'revision', 'parent').first()
+    if row is None:
+        get_object_or_404(RefBook.objects.only('pk'), id=ref_book_id)
+    return row
+
+
+def get_version_state(ref_book_id: int, version: Optional[str] = None,
+                      as_of: Optional[datetime.date] = None) -> Optional[VersionState]:
+    """
+    Возвращает идентификатор версии справочника и значение счетчика изменений ее элементов
+    без обращения к таблице элементов.
+    :param ref_book_id: Идентификатор справочника
+    :param version: Номер версии справочника, если не указан - используется текущая версия
+    :param as_of: Дата, на которую определяется действующая версия (вместо номера версии)
+    :return: Состояние версии или None, если такой версии нет
+    :raises Http404: Если справочник не найден
+    """
+    if as_of is not None:
+        row = get_version_at(ref_book_id, as_of)
+        return VersionState(row[0], row[2], row[3]) if row else None
+    if version:
+        ref_book = get_object_or_404(RefBook.objects.only('pk'), id=ref_book_id)
+        row = RefBookVersion.objects.\
+            filter(ref_book_id=ref_book, version=version).\
+            values_list('pk', 'revision', 'parent').first()
+        return VersionState(*row) if row else None
+    ref_book = get_object_or_404(RefBook.objects.select_related('actual_version'), id=ref_book_id)
+    if get_current_version_pk(ref_book) is None:
+        return None
+    actual_version = ref_book.actual_version
+    return VersionState(actual_version.pk, actual_version.revision, actual_version.parent_id)
+
+
+def get_version_pk(ref_book_id: int, version: Optional[str] = None) -> Optional[int]:
+    """
+    Возвращает идентификатор версии справочника.
+    :param ref_book_id: Идентификатор справочника
+    :param version: Номер версии справочника, если не указан - используется текущая версия
+    :return: Идентификатор версии или None, если такой версии нет
+    :raises Http404: Если справочник не найден
+    """
+    state = get_version_state(ref_book_id, version)
+    return state.pk if state else None
+
+
+def get_version_elements(ref_book_id: int, version: Optional[str] = None, as_of: Optional[datetime.date] = None,
+                         pair: Optional[Tuple[str, str]] = None) -> VersionElements:
+    """
+    Возвращает множество пар (код, значение) элементов версии справочника, используя внутрипроцессный кеш,
+    опубликованные снимки версий и общий для процессов кеш (см. shared_cache).
+    Версия и значение счетчика ее изменений определяются одним запросом к базе данных, запись внутрипроцессного
+    кеша используется, только если она соответствует этому значению, поэтому после изменения версии
+    все процессы переходят на новые элементы одновременно.
+    Для версии, элементы которой не помещаются в кеш, в кеше сохраняется отметка (VersionElements.too_large),
+    поэтому последующие проверки не читают элементы версии, а сразу проверяют элемент запросом по индексу.
+    :param ref_book_id: Идентификатор справочника
+    :param version: Номер версии справочника, если не указан - используется текущая версия
+    :param as_of: Дата, на которую определяется действующая версия (вместо номера версии).
+        Версия определяется запросом к базе данных, элементы берутся из кеша по ее номеру
+    :param pair: Проверяемая пара (код, значение). Если элементов версии нет в кеше и снимке, элементы версии
+        не помещаются в кеш, а по фильтру Блума версии пары заведомо нет, элементы версии не читаются
+        и возвращается не сохраняемая в кеше запись без элементов (см. rejects_uncacheable)
+    :return: Запись кеша с элементами версии или отметка о том, что элементы версии не помещаются в кеш,
+        с состоянием версии (get_entry_state)
+    """
+    if as_of is not None:
+        row = get_version_at(ref_book_id, as_of)
+        if row is not None:
+            version_pk, version, revision, parent_pk = row
+            state = VersionState(version_pk, revision, parent_pk)
+        else:
+            state = None
+    else:
+        state = get_version_state(ref_book_id, version)
+    if state is None:
+        return VersionElements(None, None, frozenset(), 0, None, 0)
+    entry = element_cache.get(ref_book_id, version, state.pk, state.revision)
+    if entry is not None:
+        return _reject_absent(entry, pair)
+
+    snapshot = open_snapshot(state.pk, state.revision)
+    if snapshot is not None:
+        return element_cache.set(
+            ref_book_id, version, state.pk, snapshot, state.revision, size=0, parent_pk=state.parent_pk)
+    if pair is not None and rejects_uncacheable(load_bloom_filter(state), pair):
+        return make_absent_entry(state)
+    if not element_cache.can_store(0):
+        return set_too_large(ref_book_id, version, state)
+    elements = load_version_elements(ref_book_id, state)
+    if elements is None:
+        limit = element_cache.max_elements + 1
+        elements = get_ref_book_queryset(state).values_list('code', 'value')[:limit]
+    pairs = frozenset(elements)
+    if not element_cache.can_store(len(pairs)):
+        return set_too_large(ref_book_id, version, state)
+    return element_cache.set(ref_book_id, version, state.pk, pairs, state.revision, parent_pk=state.parent_pk)
+
+
+def set_too_large(ref_book_id: int, version: Optional[str], state: VersionState) -> VersionElements:
+    """Сохраняет в кеше отметку о том, что элементы версии справочника не помещаются в кеш"""
+    return element_cache.set(ref_book_id, version, state.pk, None, state.revision, parent_pk=state.parent_pk)
+
+
+def make_absent_entry(state: VersionState) -> VersionElements:
+    """Возвращает не сохраняемую в кеше запись версии без элементов для пары, отклоненной фильтром Блума"""
+    return VersionElements(state.pk, state.revision, frozenset(), 0, None, 0, state.parent_pk)
+
+
+def rejects_uncacheable(bloom_filter: Optional[BloomFilter], pair: Tuple[str, str]) -> bool:
+    """
+    Проверяет, что пара заведомо отсутствует в версии, элементы которой не помещаются в кеш.
+    Для версии, элементы которой помещаются в кеш, фильтр не используется: ее элементы читаются при первом
+    промахе кеша, и последующие проверки, в том числе заведомо отсутствующих пар, не обращаются к базе данных
+    """
+    if bloom_filter is None or element_cache.can_store(bloom_filter.element_count):
+        return False
+    return is_definitely_absent(bloom_filter, *pair)
+
+
+def _reject_absent(entry: VersionElements, pair: Optional[Tuple[str, str]]) -> VersionElements:
+    # Для версии, элементы которой не помещаются в кеш, пара проверяется по фильтру Блума до запроса к базе данных
+    if entry.too_large and pair is not None and is_definitely_absent(load_bloom_filter(get_entry_state(entry)), *pair):
+        return make_absent_entry(get_entry_state(entry))
+    return entry
+
+
+def get_entry_state(entry: VersionElements) -> Optional[VersionState]:
+    """Возвращает состояние версии из записи кеша элементов или None, если версии нет"""
+    if entry.version_pk is None:
+        return None
+    return VersionState(entry.version_pk, entry.revision, entry.parent_pk)
+
+
+CHECK_ELEMENTS_CODES_BATCH_SIZE = 500
+
+
+def check_elements(items: Iterable[dict]) -> List[bool]:
+    """
+    Проверяет наличие элементов в версиях справочников.
+
+    Элементы группируются по паре (справочник, версия). Версии всех групп и значения счетчиков их изменений
+    определяются общими запросами, по ним проверяются записи внутрипроцессного кеша элементов версий.
+    Для групп, отсутствующих в кеше, элементы всех версий читаются общим запросом
+    на каждые CHECK_ELEMENTS_CODES_BATCH_SIZE кодов, поэтому количество запросов не зависит от количества
+    версий в пакете. Для версий, наследующих элементы от родительской версии, запрос включает строки всех версий
+    цепочки наследования, а действующая строка кода определяется по ближайшей версии цепочки.
+    :param items: Проверяемые элементы - словари с ключами refbook (('id', значение) или ('code', значение)),
+        version, code и value
+    :return: Список признаков наличия элементов в порядке их передачи
+    """
+    items = list(items)
+    result = [False] * len(items)
+
+    ref_book_ids = {ref for kind, ref in (item['refbook'] for item in items) if kind == 'id'}
+    ref_book_codes = {ref for kind, ref in (item['refbook'] for item in items) if kind == 'code'}
+    resolved_ref_books = {}
+    for id_, code in RefBook.objects.filter(Q(id__in=ref_book_ids) | Q(code__in=ref_book_codes)).\
+            values_list('id', 'code'):
+        resolved_ref_books[('id', id_)] = id_
+        resolved_ref_books[('code', code)] = id_
+
+    groups: Dict[Tuple[int, Optional[str]], List[int]] = defaultdict(list)
+    for index, item in enumerate(items):
+        ref_book_id = resolved_ref_books.get(item['refbook'])
+        if ref_book_id is not None:
+            groups[(ref_book_id, item['version'] or None)].append(index)
+
+    versions = _resolve_versions(groups)
+    missed_groups = {}
+    for key, indexes in groups.items():
+        if key not in versions:
+            continue
+        version_pk, revision, _ = versions[key]
+        entry = element_cache.get(*key, version_pk, revision)
+        if entry is None or entry.too_large:
+            missed_groups[key] = indexes
+            continue
+        for index in indexes:
+            result[index] = (items[index]['code'], items[index]['value']) in entry.pairs
+
+    chains = {
+        version_pk: [version_pk] if parent_pk is None else get_version_chain(version_pk)
+        for version_pk, _, parent_pk in {versions[key] for key in missed_groups}
+    }
+    wanted: List[Tuple[int, str]] = sorted({
+        (versions[key][0], items[index]['code'])
+        for key, indexes in missed_groups.items()
+        for index in indexes
+    })
+    # Строки версий цепочек наследования: (версия, код) -> (значение, признак удаления)
+    rows: Dict[Tuple[int, str], Tuple[str, bool]] = {}
+    for start in range(0, len(wanted), CHECK_ELEMENTS_CODES_BATCH_SIZE):
+        codes_by_version: Dict[int, List[str]] = defaultdict(list)
+        for version_pk, code in wanted[start:start + CHECK_ELEMENTS_CODES_BATCH_SIZE]:
+            codes_by_version[version_pk].append(code)
+        condition = Q()
+        for version_pk, codes in codes_by_version.items():
+            condition |= Q(ref_book_version_id__in=chains[version_pk], code__in=codes)
+        for version_pk, code, value, is_removed in RefBookElement.objects.filter(condition).\
+                values_list('ref_book_version_id', 'code', 'value', 'is_removed'):
+            rows[(version_pk, code)] = (value, is_removed)
+    for key, indexes in missed_groups.items():
+        chain = chains[versions[key][0]]
+        for index in indexes:
+            code = items[index]['code']
+            # Действует строка ближайшей к версии по цепочке наследования версии, содержащей код
+            row = next((rows[(version_pk, code)] for version_pk in chain if (version_pk, code) in rows), None)
+            result[index] = row is not None and not row[1] and row[0] == items[index]['value']
+    return result
+
+
+def _resolve_versions(keys: Iterable[Tuple[int, Optional[str]]]) \
+        -> Dict[Tuple[int, Optional[str]], Tuple[int, int, Optional[int]]]:
+    """Определяет идентификаторы версий, значения счетчиков их изменений и идентификаторы родительских версий
+    для пар (справочник, номер версии), None - текущая версия"""
+    keys = list(keys)
+    labelled = [key for key in keys if key[1] is not None]
+    current_ref_book_ids = {ref_book_id for ref_book_id, version in keys if version is None}
+    versions = {}
+    if labelled:
+        rows = RefBookVersion.objects.\
+            filter(ref_book_id__in={ref_book_id for ref_book_id, _ in labelled},
+                   version__in={version for _, version in labelled}).\
+            values_list('ref_book_id', 'version', 'pk', 'revision', 'parent')
+        wanted = set(labelled)
+        for ref_book_id, version, pk, revision, parent_pk in rows:
+            if (ref_book_id, version) in wanted:
+                versions[(ref_book_id, version)] = (pk, revision, parent_pk)
+    if current_ref_book_ids:
+        ref_books = RefBook.objects.\
+            filter(id__in=current_ref_book_ids).\
+            only('id', 'actual_version', 'actual_version_expires').\
+            annotate(actual_version_revision=F('actual_version__revision'),
+                     actual_version_parent=F('actual_version__parent'))
+        for ref_book in ref_books:
+            previous_pk = ref_book.actual_version_id
+            pk = get_current_version_pk(ref_book)
+            if pk is None:
+                continue
+            if pk == previous_pk:
+                revision, parent_pk = ref_book.actual_version_revision, ref_book.actual_version_parent
+            else:
+                revision, parent_pk = RefBookVersion.objects.filter(pk=pk).values_list('revision', 'parent').first()
+            versions[(ref_book.pk, None)] = (pk, revision, parent_pk)
+    return versions
@@ -0,0 +1,90 @@
+"""
+Общий для процессов-обработчиков кеш элементов версий справочников на основе кеша Django.
+
+Ключ записи включает идентификаторы справочника и версии, а версия ключа кеша Django - счетчик изменений
+элементов версии (RefBookVersion.revision). Изменение элементов через административную панель, загрузку
+или API увеличивает счетчик, поэтому все процессы одновременно перестают использовать прежние записи,
+а устаревшие записи вытесняются бэкендом кеша по истечении срока хранения.
+"""
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import BaseCache, caches
+
+from ref_books.services.versions_service import (
+    VersionState,
+    aget_state_chain,
+    get_state_chain,
+    resolve_chain_elements,
+)
+
+ElementTuple = Tuple[Tuple[str, str], ...]
+
+# Значение записи для версий, элементы которых не помещаются в общий кеш
+TOO_LARGE = 'too-large'
+
+
+def get_shared_cache() -> Optional[BaseCache]:
+    """Возвращает кеш Django, заданный настройкой REF_BOOKS_SHARED_CACHE, или None, если общий кеш отключен"""
+    alias = getattr(settings, 'REF_BOOKS_SHARED_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def get_max_elements() -> int:
+    """Наибольшее количество элементов версии, сохраняемых в общем кеше"""
+    return getattr(settings, 'REF_BOOKS_SHARED_CACHE_MAX_ELEMENTS', 100_000)
+
+
+def make_elements_key(ref_book_id: int, version_pk: int) -> str:
+    """Возвращает ключ записи общего кеша с элементами версии справочника"""
+    return f'ref_books:elements:{ref_book_id}:{version_pk}'
+
+
+def load_version_elements(ref_book_id: int, state: VersionState) -> Optional[ElementTuple]:
+    """
+    Возвращает пары (код, значение) элементов версии справочника в порядке добавления из общего кеша.
+    При промахе элементы читаются из базы данных (с учетом наследования от родительской версии)
+    и сохраняются в общий кеш.
+    :param ref_book_id: Идентификатор справочника
+    :param state: Версия справочника и счетчик изменений ее элементов
+    :return: Пары (код, значение) или None, если общий кеш отключен или версия в него не помещается
+    """
+    cache = get_shared_cache()
+    if cache is None:
+        return None
+    key = make_elements_key(ref_book_id, state.pk)
+    elements = cache.get(key, version=state.revision)
+    if elements is None:
+        elements = _check_size(tuple(_elements_queryset(get_state_chain(state))))
+        cache.set(key, elements, timeout=get_timeout(), version=state.revision)
+    return None if elements == TOO_LARGE else elements
+
+
+async def aload_version_elements(ref_book_id: int, state: VersionState) -> Optional[ElementTuple]:
+    """Асинхронный вариант load_version_elements"""
+    cache = get_shared_cache()
+    if cache is None:
+        return None
+    key = make_elements_key(ref_book_id, state.pk)
+    elements = await cache.aget(key, version=state.revision)
+    if elements is None:
+        chain = await aget_state_chain(state)
+        elements = _check_size(tuple([row async for row in _elements_queryset(chain)]))
+        await cache.aset(key, elements, timeout=get_timeout(), version=state.revision)
+    return None if elements == TOO_LARGE else elements
+
+
+def get_timeout() -> Optional[int]:
+    """Срок хранения записей общего кеша в секундах: записи не устаревают, но вытесняются по сроку"""
+    return getattr(settings, 'REF_BOOKS_SHARED_CACHE_TIMEOUT', 24 * 60 * 60)
+
+
+def _elements_queryset(chain: List[int]):
+    # На одну строку больше наибольшего размера, чтобы определить, что версия не помещается в кеш
+    return resolve_chain_elements(chain).\
+        order_by('pk').\
+        values_list('code', 'value')[:get_max_elements() + 1]
+
+
+def _check_size(elements: ElementTuple):
+    return TOO_LARGE if len(elements) > get_max_elements() else elements
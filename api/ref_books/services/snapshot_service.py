@@ -0,0 +1,186 @@
+import mmap
+import os
+import secrets
+import struct
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+from django.conf import settings
+
+from ref_books.models import RefBookVersion
+from ref_books.services.versions_service import VersionState, get_state_chain, resolve_chain_elements
+
+SNAPSHOT_MAGIC = b'RBSNAP01'
+# Заголовок: сигнатура, количество элементов, смещение индекса кодов
+HEADER = struct.Struct('<8sQQ')
+# Заголовок записи элемента: длина кода и длина значения в байтах UTF-8
+RECORD_HEADER = struct.Struct('<II')
+# Элемент индекса: смещение записи элемента от начала файла
+INDEX_ENTRY = struct.Struct('<Q')
+# Наименьшее значение счетчика изменений опубликованной версии (см. new_snapshot_revision)
+SNAPSHOT_REVISION_MIN = 2 ** 61
+
+
+class VersionSnapshot:
+    """
+    Неизменяемый снимок элементов версии справочника, отображенный в память (mmap).
+
+    Файл снимка состоит из заголовка, записей элементов в порядке выдачи API (в порядке добавления элементов)
+    и индекса смещений записей, отсортированного по байтам кода, по которому выполняется двоичный поиск.
+    Страницы файла находятся в кеше операционной системы и разделяются всеми процессами-обработчиками.
+    """
+
+    def __init__(self, path: Path):
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count, self._index_offset = HEADER.unpack_from(self._mmap, 0)
+        if magic != SNAPSHOT_MAGIC:
+            self._mmap.close()
+            raise ValueError(f'Файл {path} не является снимком версии справочника')
+        self.path = path
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        offset = HEADER.size
+        for _ in range(self._count):
+            code, value, offset = self._read_record(offset)
+            yield code.decode(), value.decode()
+
+    def iter_by_code(self) -> Iterator[Tuple[str, str]]:
+        """Возвращает пары (код, значение) в порядке байтов кода по индексу снимка (порядок строк Python и SQLite)"""
+        for position in range(self._count):
+            record_offset, = INDEX_ENTRY.unpack_from(self._mmap, self._index_offset + position * INDEX_ENTRY.size)
+            code, value, _ = self._read_record(record_offset)
+            yield code.decode(), value.decode()
+
+    def __contains__(self, item: Tuple[str, str]) -> bool:
+        code, value = item
+        return self.get(code) == value
+
+    def get(self, code: str) -> Optional[str]:
+        """Возвращает значение элемента с указанным кодом или None, если элемента нет"""
+        target = code.encode()
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            record_offset, = INDEX_ENTRY.unpack_from(self._mmap, self._index_offset + middle * INDEX_ENTRY.size)
+            current, value, _ = self._read_record(record_offset)
+            if current < target:
+                low = middle + 1
+            elif current > target:
+                high = middle
+            else:
+                return value.decode()
+        return None
+
+    def close(self) -> None:
+        self._mmap.close()
+
+    def _read_record(self, offset: int) -> Tuple[bytes, bytes, int]:
+        code_length, value_length = RECORD_HEADER.unpack_from(self._mmap, offset)
+        code_start = offset + RECORD_HEADER.size
+        value_start = code_start + code_length
+        value_end = value_start + value_length
+        return self._mmap[code_start:value_start], self._mmap[value_start:value_end], value_end
+
+
+def get_snapshot_dir() -> Path:
+    """Возвращает каталог снимков версий справочников"""
+    return Path(getattr(settings, 'REF_BOOKS_SNAPSHOT_DIR', Path(settings.BASE_DIR) / 'snapshots'))
+
+
+def get_snapshot_path(version_pk: int, revision: int) -> Path:
+    """Возвращает путь к снимку версии справочника с указанным значением счетчика изменений"""
+    return get_snapshot_dir() / f'{version_pk}-{revision}.snap'
+
+
+def new_snapshot_revision() -> int:
+    """
+    Возвращает случайное значение счетчика изменений версии для публикации снимка. Значения выбираются из диапазона,
+    недостижимого счетчиком, который увеличивается на единицу от начального значения, поэтому снимок не совпадает
+    по имени ни с одним состоянием версии с тем же идентификатором в другой базе данных (пересозданной,
+    восстановленной из резервной копии или тестовой), использующей тот же каталог снимков.
+    """
+    return SNAPSHOT_REVISION_MIN + secrets.randbelow(SNAPSHOT_REVISION_MIN)
+
+
+def freeze_version(ref_book_version: RefBookVersion) -> Path:
+    """
+    Записывает снимок элементов версии справочника и публикует его: счетчик изменений версии получает новое
+    случайное значение (см. new_snapshot_revision), к которому привязано имя снимка. Состав элементов версии
+    не меняется, но ETag ответов и записи кешей обновляются. Снимок перестает использоваться после изменения
+    элементов версии. Прежние снимки версии удаляются.
+    :param ref_book_version: Версия справочника
+    :return: Путь к файлу снимка
+    :raises RuntimeError: Если элементы версии изменились во время записи снимка
+    """
+    ref_book_version.refresh_from_db(fields=['revision', 'parent'])
+    revision = new_snapshot_revision()
+    path = get_snapshot_path(ref_book_version.pk, revision)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    state = VersionState(ref_book_version.pk, ref_book_version.revision, ref_book_version.parent_id)
+    rows = resolve_chain_elements(get_state_chain(state)).\
+        order_by('pk').\
+        values_list('code', 'value').\
+        iterator(chunk_size=5000)
+
+    index = []
+    descriptor, temp_name = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(HEADER.pack(SNAPSHOT_MAGIC, 0, 0))
+            offset = HEADER.size
+            for code, value in rows:
+                code_bytes, value_bytes = code.encode(), value.encode()
+                index.append((code_bytes, offset))
+                file.write(RECORD_HEADER.pack(len(code_bytes), len(value_bytes)))
+                file.write(code_bytes)
+                file.write(value_bytes)
+                offset += RECORD_HEADER.size + len(code_bytes) + len(value_bytes)
+            index.sort()
+            for _, record_offset in index:
+                file.write(INDEX_ENTRY.pack(record_offset))
+            file.seek(0)
+            file.write(HEADER.pack(SNAPSHOT_MAGIC, len(index), offset))
+        os.replace(temp_name, path)
+    except BaseException:
+        os.unlink(temp_name)
+        raise
+    published = RefBookVersion.objects.\
+        filter(pk=ref_book_version.pk, revision=ref_book_version.revision).\
+        update(revision=revision)
+    if not published:
+        path.unlink(missing_ok=True)
+        raise RuntimeError(f'Элементы версии {ref_book_version.pk} изменились во время записи снимка')
+    ref_book_version.revision = revision
+
+    for stale_path in path.parent.glob(f'{ref_book_version.pk}-*.snap'):
+        if stale_path != path:
+            stale_path.unlink(missing_ok=True)
+    return path
+
+
+_open_snapshots: Dict[int, VersionSnapshot] = {}
+_open_snapshots_lock = threading.Lock()
+
+
+def open_snapshot(version_pk: int, revision: int) -> Optional[VersionSnapshot]:
+    """
+    Возвращает снимок версии справочника, если он опубликован для указанного значения счетчика изменений.
+    Открытые снимки переиспользуются в пределах процесса.
+    """
+    path = get_snapshot_path(version_pk, revision)
+    with _open_snapshots_lock:
+        snapshot = _open_snapshots.get(version_pk)
+        if snapshot is not None and snapshot.path == path:
+            return snapshot
+        if not path.is_file():
+            return None
+        # Снимок прежней ревизии не закрывается явно: его может читать другой поток,
+        # отображение будет освобождено вместе с объектом
+        snapshot = _open_snapshots[version_pk] = VersionSnapshot(path)
+        return snapshot
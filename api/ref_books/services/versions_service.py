@@ -0,0 +1,212 @@
+import datetime
+from itertools import islice
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from asgiref.sync import sync_to_async
+from django.db import connection, transaction
+from django.db.models import Exists, F, Max, OuterRef, Q, QuerySet
+
+from ref_books.models import RefBook, RefBookElement, RefBookVersion
+from ref_books.services.element_cache import element_cache
+
+# Наибольшая глубина цепочки наследования версий, которую читает get_version_chain
+MAX_VERSION_CHAIN_DEPTH = 1000
+
+
+class VersionState(NamedTuple):
+    """Идентификатор версии справочника, значение счетчика изменений ее элементов и родительская версия"""
+    pk: int
+    revision: int
+    parent_pk: Optional[int] = None
+
+
+def refresh_current_version(ref_book_id: int, today: Optional[datetime.date] = None) \
+        -> Tuple[Optional[int], Optional[datetime.date]]:
+    """
+    Пересчитывает указатель на текущую версию справочника и дату, до которой он действителен.
+    :param ref_book_id: Идентификатор справочника
+    :param today: Дата, на которую определяется текущая версия, по умолчанию - сегодня
+    :return: Идентификатор текущей версии и дата начала действия следующей версии
+    """
+    today = today or datetime.date.today()
+    versions = RefBookVersion.objects.filter(ref_book_id=ref_book_id)
+    current_version_pk = versions.\
+        filter(start_date__lte=today).\
+        order_by('-start_date').\
+        values_list('pk', flat=True).first()
+    expires = versions.\
+        filter(start_date__gt=today).\
+        order_by('start_date').\
+        values_list('start_date', flat=True).first()
+    RefBook.objects.filter(pk=ref_book_id).update(actual_version=current_version_pk, actual_version_expires=expires)
+    return current_version_pk, expires
+
+
+def refresh_version_intervals(ref_book_id: int) -> None:
+    """
+    Пересчитывает интервалы действия [start_date, end_date) версий справочника:
+    версия действует до даты начала действия следующей по дате версии.
+    :param ref_book_id: Идентификатор справочника
+    """
+    versions = list(
+        RefBookVersion.objects.filter(ref_book_id=ref_book_id).order_by('start_date').only('start_date', 'end_date')
+    )
+    dated = [version for version in versions if version.start_date is not None]
+    end_dates = {version.pk: None for version in versions}
+    end_dates.update((version.pk, following.start_date) for version, following in zip(dated, dated[1:]))
+    changed = [version for version in versions if version.end_date != end_dates[version.pk]]
+    for version in changed:
+        version.end_date = end_dates[version.pk]
+    RefBookVersion.objects.bulk_update(changed, ['end_date'])
+
+
+def get_current_version_pk(ref_book: RefBook) -> Optional[int]:
+    """
+    Возвращает идентификатор текущей версии справочника по указателю actual_version.
+    Если наступила дата начала действия следующей версии, указатель пересчитывается.
+    :param ref_book: Справочник
+    :return: Идентификатор текущей версии или None, если действующих версий нет
+    """
+    today = datetime.date.today()
+    if ref_book.actual_version_expires is not None and ref_book.actual_version_expires <= today:
+        ref_book.actual_version_id, ref_book.actual_version_expires = refresh_current_version(ref_book.pk, today)
+    return ref_book.actual_version_id
+
+
+def bump_ref_book_revision(ref_book_ids: Iterable[int]) -> None:
+    """Увеличивает счетчик изменений справочников"""
+    RefBook.objects.filter(pk__in=list(ref_book_ids)).update(revision=F('revision') + 1)
+
+
+def bump_version_revision(version_pks: Iterable[int]) -> None:
+    """Увеличивает счетчик изменений элементов версий справочников"""
+    RefBookVersion.objects.filter(pk__in=list(version_pks)).update(revision=F('revision') + 1)
+
+
+def invalidate_versions(version_pks: Iterable[int]) -> None:
+    """Сбрасывает кеш элементов версий справочников и увеличивает счетчики их изменений"""
+    version_pks = set(version_pks)
+    for version_pk in version_pks:
+        element_cache.invalidate(version_pk=version_pk)
+    if version_pks:
+        bump_version_revision(version_pks)
+
+
+def touch_versions(version_pks: Iterable[int]) -> None:
+    """
+    Сбрасывает кеш и увеличивает счетчики изменений версий справочников и наследующих от них версий.
+    Вызывается после изменения элементов версий: у модели элементов нет обработчиков сигналов,
+    поэтому удаление версии удаляет ее элементы одним запросом, не загружая их в память.
+    """
+    version_pks = set(version_pks)
+    invalidate_versions(version_pks | get_version_descendants(version_pks))
+
+
+def get_version_chain(version_pk: int) -> List[int]:
+    """
+    Возвращает цепочку наследования версии справочника одним рекурсивным запросом:
+    саму версию, ее родительскую версию, родительскую версию родительской и т.д.
+    :param version_pk: Идентификатор версии справочника
+    :return: Идентификаторы версий от указанной до корневой
+    """
+    table = connection.ops.quote_name(RefBookVersion._meta.db_table)
+    parent = connection.ops.quote_name(RefBookVersion._meta.get_field('parent').column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'WITH RECURSIVE chain (id, parent_id, depth) AS ('
+            f'SELECT id, {parent}, 0 FROM {table} WHERE id = %s '
+            f'UNION ALL '
+            f'SELECT version.id, version.{parent}, chain.depth + 1 FROM {table} version '
+            f'JOIN chain ON version.id = chain.parent_id WHERE chain.depth < %s'
+            f') SELECT id FROM chain ORDER BY depth',
+            [version_pk, MAX_VERSION_CHAIN_DEPTH],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def get_state_chain(state: VersionState) -> List[int]:
+    """Возвращает цепочку наследования версии, не обращаясь к базе данных для версий без родительской версии"""
+    return [state.pk] if state.parent_pk is None else get_version_chain(state.pk)
+
+
+async def aget_state_chain(state: VersionState) -> List[int]:
+    """Асинхронный вариант get_state_chain"""
+    return [state.pk] if state.parent_pk is None else await sync_to_async(get_version_chain)(state.pk)
+
+
+def resolve_chain_elements(chain: Sequence[int]) -> QuerySet[RefBookElement]:
+    """
+    Возвращает запрос к действующим элементам версии справочника с учетом наследования.
+    Элемент версии из цепочки действует, если в более близких версиях цепочки нет строки с тем же кодом
+    (измененного элемента или отметки об удалении). Условие проверяется подзапросами EXISTS
+    по индексу (версия, код), поэтому для версии без родительской версии запрос не отличается от обычного.
+    :param chain: Цепочка наследования версии (см. get_version_chain)
+    :return: QuerySet с действующими элементами версии
+    """
+    if len(chain) == 1:
+        return RefBookElement.objects.filter(ref_book_version_id=chain[0])
+    condition = Q()
+    for depth, version_pk in enumerate(chain):
+        own = Q(ref_book_version_id=version_pk)
+        if depth:
+            own &= ~Exists(
+                RefBookElement.objects.filter(ref_book_version_id__in=chain[:depth], code=OuterRef('code'))
+            )
+        condition |= own
+    return RefBookElement.objects.filter(condition, is_removed=False)
+
+
+def get_version_descendants(version_pks: Iterable[int]) -> Set[int]:
+    """Возвращает идентификаторы всех версий, наследующих элементы от указанных версий (прямо или через цепочку)"""
+    descendants: Set[int] = set()
+    level = set(version_pks)
+    while level:
+        level = set(RefBookVersion.objects.filter(parent__in=level).values_list('pk', flat=True)) - descendants
+        descendants |= level
+    return descendants
+
+
+def compact_version(ref_book_version: RefBookVersion, batch_size: int = 5000) -> int:
+    """
+    Материализует элементы версии справочника: переписывает в версию все ее действующие элементы, в том числе
+    унаследованные, взамен прежних строк версии, удаляет отметки об удалении и отвязывает ее от родительской версии.
+    Элементы читаются потоково в порядке выдачи API (по первичному ключу) и вставляются пакетами в том же порядке,
+    поэтому версия не загружается в память целиком, а порядок ее элементов не меняется. Чтение ограничено строками,
+    существовавшими до начала материализации, поэтому вставленные строки в него не попадают. Состав и порядок
+    элементов версии не меняются, поэтому ее счетчик изменений не увеличивается, а ETag, кеши и снимки версии
+    остаются действительными. У версий, наследующих элементы от материализованной версии, меняется порядок
+    элементов (унаследованные строки получают новые первичные ключи), поэтому их счетчики изменений увеличиваются.
+    :param ref_book_version: Версия справочника
+    :param batch_size: Размер пакета чтения и вставки
+    :return: Количество элементов версии
+    """
+    with transaction.atomic():
+        chain = get_version_chain(ref_book_version.pk)
+        last_pk = RefBookElement.objects.aggregate(last_pk=Max('pk'))['last_pk'] or 0
+        rows = resolve_chain_elements(chain).\
+            filter(pk__lte=last_pk).\
+            order_by('pk').\
+            values_list('code', 'value', 'value_lower').\
+            iterator(chunk_size=batch_size)
+        elements = 0
+        while True:
+            batch = [
+                RefBookElement(ref_book_version_id=ref_book_version, code=code, value=value, value_lower=value_lower)
+                for code, value, value_lower in islice(rows, batch_size)
+            ]
+            if not batch:
+                break
+            # Прежние строки версии с кодами пакета удаляются перед вставкой (код уникален в пределах версии),
+            # вставленные строки продолжают скрывать элементы родительских версий с этими кодами
+            RefBookElement.objects.\
+                filter(ref_book_version_id=ref_book_version.pk, pk__lte=last_pk, code__in=[row.code for row in batch]).\
+                _raw_delete(connection.alias)
+            RefBookElement.objects.bulk_create(batch, batch_size=batch_size)
+            elements += len(batch)
+        RefBookElement.objects.\
+            filter(ref_book_version_id=ref_book_version.pk, pk__lte=last_pk).\
+            _raw_delete(connection.alias)
+        RefBookVersion.objects.filter(pk=ref_book_version.pk).update(parent=None)
+        bump_version_revision(get_version_descendants([ref_book_version.pk]))
+    ref_book_version.parent = None
+    return elements
@@ -0,0 +1,112 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models import F, QuerySet
+from django.db.models.expressions import Combinable
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from ref_books.models import RefBook, RefBookElement, RefBookVersion
+from ref_books.services.element_cache import element_cache
+from ref_books.services.metrics_service import record_query
+from ref_books.services.versions_service import (
+    bump_ref_book_revision,
+    get_version_descendants,
+    invalidate_versions,
+    refresh_current_version,
+    refresh_version_intervals,
+)
+
+
+def _deleted_by_cascade(instance, origin) -> bool:
+    """Проверяет, что объект удаляется каскадно вместе с родительским объектом другой модели"""
+    if origin is None:
+        return False
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return origin_model is not type(instance)
+
+
+@receiver(pre_save, sender=RefBook)
+@receiver(pre_save, sender=RefBookVersion)
+def increment_revision(sender, instance, raw, **kwargs):
+    """Увеличивает счетчик изменений при сохранении справочника или версии. Значение вычисляется
+    в базе данных, поэтому сохранение устаревшего экземпляра не уменьшает счетчик"""
+    if raw or instance._state.adding:
+        return
+    instance.revision = F('revision') + 1
+
+
+@receiver(post_save, sender=RefBook)
+@receiver(post_save, sender=RefBookVersion)
+def reload_revision(sender, instance, **kwargs):
+    """Загружает вычисленное базой данных значение счетчика изменений в экземпляр"""
+    if isinstance(instance.revision, Combinable):
+        instance.refresh_from_db(fields=['revision'])
+
+
+@receiver([post_save, post_delete], sender=RefBook)
+def invalidate_ref_book_cache(sender, instance, **kwargs):
+    """Сбрасывает кеш элементов справочника при его изменении или удалении"""
+    element_cache.invalidate(ref_book_id=instance.pk)
+
+
+@receiver([post_save, post_delete], sender=RefBookVersion)
+def invalidate_ref_book_version_cache(sender, instance, **kwargs):
+    """Сбрасывает кеш элементов справочника при изменении или удалении его версии"""
+    element_cache.invalidate(ref_book_id=instance.ref_book_id_id, version_pk=instance.pk)
+
+
+@receiver(post_save, sender=RefBookVersion)
+def invalidate_descendant_versions(sender, instance, created, raw, **kwargs):
+    """Сбрасывает кеш и увеличивает счетчик изменений версий, наследующих элементы от измененной версии
+    (ее родительская версия могла измениться). Если версия перестала наследовать элементы,
+    удаляет ее отметки об удалении элементов"""
+    if created or raw:
+        return
+    if instance.parent_id is None:
+        queryset = RefBookElement.objects.filter(ref_book_version_id=instance.pk, is_removed=True)
+        queryset._raw_delete(queryset.db)
+    invalidate_versions(get_version_descendants([instance.pk]))
+
+
+@receiver([post_save, post_delete], sender=RefBookVersion)
+def refresh_ref_book_current_version(sender, instance, **kwargs):
+    """Пересчитывает указатель на текущую версию справочника, интервалы действия его версий
+    и увеличивает счетчик его изменений при изменении или удалении его версии"""
+    if _deleted_by_cascade(instance, kwargs.get('origin')):
+        return
+    ref_book_ids = {instance.ref_book_id_id}
+    ref_book_ids.update(RefBook.objects.filter(actual_version=instance.pk).values_list('pk', flat=True))
+    for ref_book_id in ref_book_ids:
+        refresh_current_version(ref_book_id)
+        refresh_version_intervals(ref_book_id)
+    bump_ref_book_revision(ref_book_ids)
+
+
+@receiver(pre_delete, sender=RefBookVersion)
+def invalidate_deleted_version(sender, instance, **kwargs):
+    """Сбрасывает кеш удаляемой версии и наследующих от нее версий до удаления ее элементов.
+    Обработчиков сигналов модели элементов нет: элементы версии изменяются сервисами и административной панелью,
+    которые сами вызывают touch_versions, а каскадное удаление выполняется одним запросом без загрузки элементов"""
+    element_cache.invalidate(version_pk=instance.pk)
+    if _deleted_by_cascade(instance, kwargs.get('origin')):
+        return
+    invalidate_versions(get_version_descendants([instance.pk]))
+
+
+@receiver(connection_created)
+def install_query_metrics(sender, connection, **kwargs):
+    """Подключает к новому соединению учет SQL-запросов в показателях запросов к API (MetricsMiddleware).
+    Обертка ставится первой: обертки connection.execute_wrapper снимаются с конца списка"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """Применяет к новому соединению с SQLite параметры из настройки REF_BOOKS_SQLITE_PRAGMAS
+    (режим синхронизации, размер кеша страниц и т.д.). Журнал WAL устанавливается миграцией, а не здесь"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'REF_BOOKS_SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {name} = {value}')
@@ -1,13 +1,55 @@
+import gzip
 import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from importlib import import_module
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
 from datetime import date
-from django.db import transaction
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from django.test.utils import CaptureQueriesContext
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.urls import reverse
 from django.db.utils import IntegrityError
+from rest_framework.renderers import JSONRenderer
 from ref_books.models import RefBook, RefBookVersion, RefBookElement
+from ref_books.renderers import msgpack
+from ref_books.routers import PrimaryReplicaRouter, use_primary
+from ref_books.serializers import DirectionElementSerializer, DirectionSerializer
+from ref_books.services.bloom_filter import BloomFilter, bloom_filters
+from ref_books.services.element_cache import ElementCache, element_cache
+from ref_books.services.generator_service import generate_refbooks
+from ref_books.services.metrics_service import metrics_registry
+from ref_books.services.shared_cache import get_shared_cache, make_elements_key
+from ref_books.services.snapshot_service import SNAPSHOT_REVISION_MIN
+from ref_books.services.versions_service import bump_version_revision, compact_version, touch_versions
 
+# Имя модуля миграции начинается с цифры, поэтому он импортируется по строке
+wal_migration = import_module('ref_books.migrations.0008_sqlite_wal_journal')
 
+# Общий кеш элементов в тестах хранится в памяти процесса, а не в каталоге кеша разработчика
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'ref_books': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'ref_books-tests'},
+}
+
+
+def clear_caches():
+    """Очищает внутрипроцессный и общий кеши элементов и фильтры Блума версий справочников"""
+    element_cache.clear()
+    bloom_filters.clear()
+    get_shared_cache().clear()
+
+
+@override_settings(CACHES=TEST_CACHES)
 class RefBooksModelTest(TestCase):
     fixtures = ['fixtures/001_user.json']
 
@@ -69,6 +111,9 @@ class RefBooksModelTest(TestCase):
             value='Заведующий'
         )
 
+    def setUp(self):
+        clear_caches()
+
     @classmethod
     def tearDownClass(cls):
         """Метод для удаления объектов после теста"""
@@ -275,3 +320,1145 @@ class RefBooksModelTest(TestCase):
         response_json = json.dumps(response_data)
         expected_json = json.dumps(expected_content)
         self.assertJSONEqual(response_json, expected_json)
+
+    def test_api_check_element_uses_cache(self):
+        """
+        Тест для проверки кеширования элементов версии при валидации элемента.
+
+        Повторная проверка элемента выполняет только запрос состояния версии.
+        Изменение элемента сбрасывает кеш и учитывается при следующей проверке, в том числе изменение
+        в другом процессе, которое не сбрасывает внутрипроцессный кеш, но увеличивает счетчик изменений версии.
+        """
+        url = reverse('ref_books:check-element', kwargs={'id': self.ref_book_1.id})
+        self.client.get(url, {'code': 1, 'value': 'Терапевт'})
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'code': 1, 'value': 'Терапевт'})
+        self.assertEqual(response.json(), [{'code': '1', 'value': 'Терапевт'}])
+
+        RefBookElement.objects.filter(ref_book_version_id=self.ref_book_version_2, code='2').update(value='Ортопед')
+        bump_version_revision([self.ref_book_version_2.pk])
+        self.assertEqual(self.client.get(url, {'code': 2, 'value': 'Травматолог'}).json(), [])
+        self.assertEqual(len(self.client.get(url, {'code': 2, 'value': 'Ортопед'}).json()), 1)
+
+        element = RefBookElement.objects.get(ref_book_version_id=self.ref_book_version_2, code='1')
+        element.value = 'Педиатр'
+        element.save()
+        touch_versions([self.ref_book_version_2.pk])
+
+        response = self.client.get(url, {'code': 1, 'value': 'Терапевт'})
+        self.assertEqual(response.json(), [])
+        response = self.client.get(url, {'code': 1, 'value': 'Педиатр'})
+        self.assertEqual(response.json(), [{'code': '1', 'value': 'Педиатр'}])
+
+    @override_settings(REF_BOOKS_BLOOM_FILTER=None)
+    def test_api_check_element_too_large_version(self):
+        """
+        Тест для проверки версии, элементы которой не помещаются в кеш: отметка об этом сохраняется в кеше,
+        поэтому последующие проверки не читают элементы версии, а после запроса состояния версии
+        проверяют элемент одним запросом по индексу.
+        """
+        url = reverse('ref_books:check-element', kwargs={'id': self.ref_book_1.id})
+        with mock.patch.object(element_cache, 'max_elements', 1):
+            response = self.client.get(url, {'code': '1', 'value': 'Терапевт'})
+            self.assertEqual(response.json(), [{'code': '1', 'value': 'Терапевт'}])
+            self.assertTrue(element_cache.get(self.ref_book_1.id, None).too_large)
+            with self.assertNumQueries(2):
+                response = self.client.get(url, {'code': '1', 'value': 'Терапевт'})
+            self.assertEqual(response.json(), [{'code': '1', 'value': 'Терапевт'}])
+            with self.assertNumQueries(2):
+                response = self.client.get(url, {'code': '1', 'value': 'Хирург'})
+            self.assertEqual(response.json(), [])
+
+            response = self.client.post(
+                reverse('ref_books:check-elements'),
+                {'elements': [{'refbook': self.ref_book_1.id, 'code': '1', 'value': 'Терапевт'}]},
+                content_type='application/json')
+            self.assertEqual(response.json(), {'bitmap': '1'})
+
+    def test_api_check_element_bloom_filter(self):
+        """
+        Тест для проверки отказа по фильтру Блума версии, элементы которой не помещаются в кеш:
+        заведомо отсутствующий элемент отклоняется без запроса к таблице элементов,
+        а изменение элемента делает фильтр недействительным. Для версии, элементы которой помещаются в кеш,
+        фильтр не используется: отсутствующий элемент читает элементы версии в кеш.
+        """
+        bloom_filter = BloomFilter.for_capacity(1000, 0.01)
+        for code in range(1000):
+            bloom_filter.add(str(code), f'Значение {code}')
+        self.assertTrue(all((str(code), f'Значение {code}') in bloom_filter for code in range(1000)))
+        false_positives = sum((str(code), 'Другое') in bloom_filter for code in range(10000))
+        self.assertLess(false_positives, 300)
+        self.assertAlmostEqual(bloom_filter.false_positive_rate, 0.01, delta=0.005)
+
+        url = reverse('ref_books:check-element', kwargs={'id': self.ref_book_1.id})
+        with mock.patch.object(element_cache, 'max_elements', 1):
+            # Фильтр не строится при проверке элемента, только при публикации версии
+            self.client.get(url, {'code': '1', 'value': 'Хирург'})
+            self.assertEqual(bloom_filters.lookups, 0)
+            clear_caches()
+            call_command('freeze_version', '--bloom-only', refbook='1', refbook_version='1.1', stdout=StringIO())
+
+            # Определение версии, отказ по фильтру без чтения элементов версии
+            with self.assertNumQueries(1):
+                response = self.client.get(url, {'code': '1', 'value': 'Хирург'})
+            self.assertEqual(response.json(), [])
+            self.ref_book_version_2.refresh_from_db()
+            self.assertEqual(
+                response['ETag'], f'"elements-{self.ref_book_version_2.pk}-{self.ref_book_version_2.revision}-json"')
+            # Определение версии, чтение элементов версии, которые не помещаются в кеш, и проверка элемента
+            with self.assertNumQueries(3):
+                response = self.client.get(url, {'code': '1', 'value': 'Терапевт'})
+            self.assertEqual(len(response.json()), 1)
+            # Отметка о размере версии в кеше: после определения версии отказ по фильтру без запросов
+            # к таблице элементов, проверка элемента одним запросом
+            with self.assertNumQueries(1):
+                response = self.client.get(url, {'code': '1', 'value': 'Хирург'})
+            self.assertEqual(response.json(), [])
+            with self.assertNumQueries(2):
+                response = self.client.get(url, {'code': '1', 'value': 'Терапевт'})
+            self.assertEqual(len(response.json()), 1)
+            self.assertEqual(bloom_filters.rejections, 2)
+
+            element = RefBookElement.objects.get(ref_book_version_id=self.ref_book_version_2, code='1')
+            element.value = 'Хирург'
+            element.save()
+            touch_versions([self.ref_book_version_2.pk])
+            self.assertEqual(len(self.client.get(url, {'code': '1', 'value': 'Хирург'}).json()), 1)
+            call_command('freeze_version', '--bloom-only', refbook='1', refbook_version='1.1', stdout=StringIO())
+
+        clear_caches()
+        call_command('freeze_version', '--bloom-only', refbook='1', refbook_version='1.1', stdout=StringIO())
+        self.assertEqual(self.client.get(url, {'code': '1', 'value': 'Другое'}).json(), [])
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'code': '2', 'value': 'Другое'})
+        self.assertEqual(response.json(), [])
+        self.assertEqual(bloom_filters.lookups, 0)
+
+        response = self.client.get(reverse('metrics'))
+        self.assertIn(
+            f'ref_books_bloom_filter_bytes{{version="{self.ref_book_version_2.pk}"}}', response.content.decode())
+
+    def test_api_check_elements_batch(self):
+        """
+        Тест для проверки пакетной валидации элементов справочников через API.
+
+        Элементы передаются объектами и списками, справочник указывается идентификатором или кодом.
+        Проверка битовой строки результата и ответа 400 при некорректном справочнике.
+        """
+        url = reverse('ref_books:check-elements')
+        elements = [
+            {'refbook': self.ref_book_1.id, 'code': '1', 'value': 'Терапевт'},
+            {'refbook': '1', 'version': '1.0', 'code': '1', 'value': 'Терапевт'},
+            [self.ref_book_1.id, '1.1', '3', 'Хирург'],
+            ['2', None, '1', 'Заведующий'],
+            [self.ref_book_2.id, None, '1', 'Терапевт'],
+            {'refbook': 'unknown', 'code': '1', 'value': 'Терапевт'},
+        ]
+        response = self.client.post(url, {'elements': elements}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'bitmap': '101100'})
+
+        response = self.client.post(
+            url, {'elements': [{'refbook': 1.5, 'code': '1', 'value': 'Терапевт'}]}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_admin_direction_changelist_query_count(self):
+        """
+        Тест для проверки того, что количество запросов списка справочников в административной панели
+        не зависит от количества справочников, а текущая версия выводится для каждого справочника.
+        """
+        self.client.force_login(User.objects.get(username='admin'))
+        url = reverse('admin:ref_books_refbook_changelist')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertContains(response, '1.1')
+
+        for index in range(10):
+            ref_book = RefBook.objects.create(code=f'extra-{index}', name=f'Справочник {index}')
+            RefBookVersion.objects.create(ref_book_id=ref_book, version='1.0', start_date=date(2023, 8, 1))
+        with self.assertNumQueries(len(queries)):
+            self.client.get(url)
+
+    def test_actual_version_pointer(self):
+        """
+        Тест для проверки указателя на текущую версию справочника.
+
+        Указатель пересчитывается при создании и удалении версий, а команда refresh_current_versions
+        переводит его на версию, дата начала действия которой наступила.
+        """
+        self.ref_book_1.refresh_from_db()
+        self.assertEqual(self.ref_book_1.actual_version_id, self.ref_book_version_2.pk)
+        self.assertIsNone(self.ref_book_1.actual_version_expires)
+
+        future_version = RefBookVersion.objects.create(
+            ref_book_id=self.ref_book_1,
+            version='2.0',
+            start_date=date(2100, 1, 1)
+        )
+        self.ref_book_1.refresh_from_db()
+        self.assertEqual(self.ref_book_1.actual_version_id, self.ref_book_version_2.pk)
+        self.assertEqual(self.ref_book_1.actual_version_expires, date(2100, 1, 1))
+
+        call_command('refresh_current_versions', date=date(2100, 1, 1), stdout=StringIO())
+        self.ref_book_1.refresh_from_db()
+        self.assertEqual(self.ref_book_1.actual_version_id, future_version.pk)
+        self.assertIsNone(self.ref_book_1.actual_version_expires)
+
+        future_version.delete()
+        self.ref_book_1.refresh_from_db()
+        self.assertEqual(self.ref_book_1.actual_version_id, self.ref_book_version_2.pk)
+
+        url = reverse('ref_books:element-list', kwargs={'id': self.ref_book_1.id})
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(len(response.json()), 3)
+
+    def test_api_export_elements(self):
+        """
+        Тест для проверки потоковой выгрузки элементов справочника в форматах JSON Lines и CSV.
+        """
+        url = reverse('ref_books:element-export', kwargs={'id': self.ref_book_1.id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [
+            {'code': '1', 'value': 'Терапевт'},
+            {'code': '2', 'value': 'Травматолог'},
+            {'code': '3', 'value': 'Хирург'}
+        ])
+
+        response = self.client.get(url, {'format': 'csv', 'version': '1.0'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(b''.join(response.streaming_content).decode(), 'code,value\r\n')
+
+        response = self.client.get(url, {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(reverse('ref_books:element-export', kwargs={'id': 999}), {'format': 'csv'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('detail', response.json())
+
+    def test_api_version_diff(self):
+        """
+        Тест для проверки потокового вычисления изменений между версиями справочника.
+        """
+        ref_book_version = RefBookVersion.objects.create(
+            ref_book_id=self.ref_book_1,
+            version='1.2',
+            start_date=date(2023, 8, 20)
+        )
+        RefBookElement.objects.bulk_create([
+            RefBookElement(ref_book_version_id=ref_book_version, code='1', value='Терапевт'),
+            RefBookElement(ref_book_version_id=ref_book_version, code='3', value='Хирург-онколог'),
+            RefBookElement(ref_book_version_id=ref_book_version, code='4', value='Педиатр'),
+        ])
+
+        url = reverse('ref_books:version-diff', kwargs={'id': self.ref_book_1.id})
+        response = self.client.get(url, {'from': '1.1', 'to': '1.2'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), [
+            {'change': 'removed', 'code': '2', 'value': 'Травматолог'},
+            {'change': 'changed', 'code': '3', 'value': 'Хирург-онколог', 'old_value': 'Хирург'},
+            {'change': 'added', 'code': '4', 'value': 'Педиатр'},
+        ])
+
+        response = self.client.get(url, {'from': '1.0'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(b''.join(response.streaming_content))), 3)
+
+        response = self.client.get(url, {'from': '1.1', 'to': '1.1'})
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), [])
+        response = self.client.get(url, {'from': '1.1', 'to': '1.1'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertEqual(self.client.get(url, {'from': '9.9'}).status_code, 404)
+        self.assertEqual(self.client.get(url, {'from': '1.0', 'to': '9.9'}).status_code, 404)
+
+    def test_api_version_diff_snapshot(self):
+        """
+        Тест для проверки того, что изменения между версиями, снимки которых опубликованы,
+        вычисляются в порядке кодов, хотя элементы добавлены не по порядку.
+        """
+        versions = {}
+        for version, start_date, elements in (
+                ('2.0', date(2023, 8, 12), [('5', 'Пять'), ('12', 'Двенадцать'), ('1', 'Один'), ('3', 'Три')]),
+                ('2.1', date(2023, 8, 20), [('5', 'Пять'), ('7', 'Семь'), ('3', 'Три (изм.)'), ('1', 'Один')])):
+            versions[version] = RefBookVersion.objects.create(
+                ref_book_id=self.ref_book_2, version=version, start_date=start_date)
+            for code, value in elements:
+                RefBookElement.objects.create(ref_book_version_id=versions[version], code=code, value=value)
+        url = reverse('ref_books:version-diff', kwargs={'id': self.ref_book_2.id})
+        expected = [
+            {'change': 'removed', 'code': '12', 'value': 'Двенадцать'},
+            {'change': 'changed', 'code': '3', 'value': 'Три (изм.)', 'old_value': 'Три'},
+            {'change': 'added', 'code': '7', 'value': 'Семь'},
+        ]
+        self.assertEqual(json.loads(b''.join(self.client.get(url, {'from': '2.0'}).streaming_content)), expected)
+
+        snapshot_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(snapshot_dir.cleanup)
+        with override_settings(REF_BOOKS_SNAPSHOT_DIR=snapshot_dir.name):
+            call_command('freeze_version', refbook='2', refbook_version='2.0', stdout=StringIO())
+            for params, changes in (({'from': '2.0'}, expected), ({'from': '2.0', 'to': '2.0'}, [])):
+                response = self.client.get(url, params)
+                self.assertEqual(json.loads(b''.join(response.streaming_content)), changes)
+            call_command('freeze_version', refbook='2', refbook_version='2.1', stdout=StringIO())
+            response = self.client.get(url, {'from': '2.0', 'to': '2.1'})
+            self.assertEqual(json.loads(b''.join(response.streaming_content)), expected)
+
+    def test_api_version_diff_not_found(self):
+        """
+        Тест для проверки ответа API в формате JSON, если справочник или версия для сравнения не найдены.
+        """
+        url = reverse('ref_books:version-diff', kwargs={'id': self.ref_book_1.id})
+        for params in ({'from': '9.9'}, {'from': '1.0', 'to': '9.9'}):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            self.assertEqual(response.json(), {'detail': 'Версия справочника не найдена'})
+
+        response = self.client.get(reverse('ref_books:version-diff', kwargs={'id': 999}), {'from': '1.0'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('detail', response.json())
+
+    def test_api_search_elements(self):
+        """
+        Тест для проверки поиска элементов по началу значения без учета регистра.
+        """
+        url = reverse('ref_books:element-list', kwargs={'id': self.ref_book_1.id})
+        self.assertEqual(self.client.get(url, {'search': 'хир'}).json(), [{'code': '3', 'value': 'Хирург'}])
+        self.assertEqual(self.client.get(url, {'search': 'ТЕРАП'}).json(), [{'code': '1', 'value': 'Терапевт'}])
+        self.assertEqual([element['code'] for element in self.client.get(url, {'search': 'т'}).json()], ['1', '2'])
+        self.assertEqual(self.client.get(url, {'search': 'рург'}).json(), [])
+        response = self.client.get(url, {'search': 'т', 'page_size': 1})
+        self.assertEqual(response.json()['results'], [{'code': '1', 'value': 'Терапевт'}])
+
+        element = RefBookElement.objects.get(ref_book_version_id=self.ref_book_version_2, code='3')
+        element.value = 'Нейрохирург'
+        element.save(update_fields=['value'])
+        element.refresh_from_db()
+        self.assertEqual(element.value_lower, 'нейрохирург')
+        self.assertEqual(self.client.get(url, {'search': 'НЕЙРО'}).json(), [{'code': '3', 'value': 'Нейрохирург'}])
+
+    def test_api_cursor_pagination(self):
+        """
+        Тест для проверки курсорной пагинации списков справочников и элементов.
+
+        Без параметров cursor и page_size список возвращается целиком.
+        С параметром page_size элементы выдаются страницами, упорядоченными по коду.
+        """
+        url = reverse('ref_books:element-list', kwargs={'id': self.ref_book_1.id})
+        response = self.client.get(url, {'page_size': 2})
+        self.assertEqual(response.status_code, 200)
+        page = response.json()
+        self.assertEqual(page['results'], [{'code': '1', 'value': 'Терапевт'}, {'code': '2', 'value': 'Травматолог'}])
+        self.assertIsNone(page['previous'])
+
+        page = self.client.get(page['next']).json()
+        self.assertEqual(page['results'], [{'code': '3', 'value': 'Хирург'}])
+        self.assertIsNone(page['next'])
+
+        response = self.client.get(reverse('ref_books:direction-list'), {'page_size': 1})
+        page = response.json()
+        self.assertEqual([ref_book['code'] for ref_book in page['results']], ['1'])
+        self.assertIsNotNone(page['next'])
+
+    def test_api_elements_order(self):
+        """
+        Тест для проверки порядка элементов: без постраничной выдачи элементы выдаются в порядке добавления
+        из базы данных, общего кеша и снимка версии, при курсорной пагинации - в порядке кодов.
+        """
+        ref_book_version = RefBookVersion.objects.create(
+            ref_book_id=self.ref_book_2, version='2.0', start_date=date(2023, 8, 12))
+        codes = ['5', '12', '1', '3', '10', '2']
+        for code in codes:
+            RefBookElement.objects.create(ref_book_version_id=ref_book_version, code=code, value=f'Значение {code}')
+        url = reverse('ref_books:element-list', kwargs={'id': self.ref_book_2.id})
+        params = {'version': '2.0'}
+        with override_settings(REF_BOOKS_SHARED_CACHE=None):
+            self.assertEqual([row['code'] for row in self.client.get(url, params).json()], codes)
+        self.assertEqual([row['code'] for row in self.client.get(url, params).json()], codes)
+        snapshot_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(snapshot_dir.cleanup)
+        with override_settings(REF_BOOKS_SNAPSHOT_DIR=snapshot_dir.name):
+            call_command('freeze_version', refbook='2', refbook_version='2.0', stdout=StringIO())
+            self.assertEqual([row['code'] for row in self.client.get(url, params).json()], codes)
+        response = self.client.get(url, {**params, 'page_size': 10})
+        self.assertEqual([row['code'] for row in response.json()['results']], sorted(codes))
+
+    def test_api_values_fast_path_matches_serializer(self):
+        """
+        Тест для проверки того, что быстрый путь сериализации через values() формирует
+        тот же ответ, что и сериализаторы моделей, байт в байт.
+        """
+        renderer = JSONRenderer()
+        response = self.client.get(reverse('ref_books:direction-list'), HTTP_ACCEPT='application/json')
+        self.assertEqual(response.content, renderer.render(DirectionSerializer(RefBook.objects.all(), many=True).data))
+
+        # Коды добавляются не по порядку и сравниваются как строки иначе, чем как числа
+        ref_book_version = RefBookVersion.objects.create(
+            ref_book_id=self.ref_book_2, version='2.0', start_date=date(2023, 8, 12))
+        for code in ('5', '12', '1', '3', '10', '2'):
+            RefBookElement.objects.create(ref_book_version_id=ref_book_version, code=code, value=f'Значение {code}')
+        url = reverse('ref_books:element-list', kwargs={'id': self.ref_book_2.id})
+        with override_settings(REF_BOOKS_SHARED_CACHE=None):
+            response = self.client.get(url, {'version': '2.0'}, HTTP_ACCEPT='application/json')
+        elements = RefBookElement.objects.filter(ref_book_version_id=ref_book_version).order_by('pk')
+        self.assertEqual(response.content, renderer.render(DirectionElementSerializer(elements, many=True).data))
+
+    def test_api_conditional_requests(self):
+        """
+        Тест для проверки условных запросов (ETag/If-None-Match) к спискам справочников и элементов.
+
+        При совпадении ETag возвращается ответ 304 без обращения к таблице элементов.
+        Изменение элемента версии или создание версии справочника меняет ETag.
+        """
+        url = reverse('ref_books:element-list', kwargs={'id': self.ref_book_1.id})
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse([query for query in queries.captured_queries if 'refbookelement' in query['sql']])
+
+        check_url = reverse('ref_books:check-element', kwargs={'id': self.ref_book_1.id})
+        params = {'code': 1, 'value': 'Терапевт'}
+        check_etag = self.client.get(check_url, params)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(check_url, params, HTTP_IF_NONE_MATCH=check_etag)
+        self.assertEqual(response.status_code, 304)
+
+        RefBookElement.objects.create(ref_book_version_id=self.ref_book_version_2, code='4', value='Педиатр')
+        touch_versions([self.ref_book_version_2.pk])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(check_url, params, HTTP_IF_NONE_MATCH=check_etag).status_code, 200)
+
+        list_url = reverse('ref_books:direction-list')
+        list_etag = self.client.get(list_url)['ETag']
+        self.assertEqual(self.client.get(list_url, HTTP_IF_NONE_MATCH=list_etag).status_code, 304)
+        RefBookVersion.objects.create(ref_book_id=self.ref_book_2, version='1.1', start_date=date(2023, 8, 12))
+        self.assertEqual(self.client.get(list_url, HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+
+    @override_settings(REF_BOOKS_COMPRESSION_MIN_SIZE=10)
+    def test_api_renderers_and_compression(self):
+        """
+        Тест для проверки выбора формата ответа по заголовку Accept и сжатия ответов gzip:
+        ETag зависит от формата, сжатый ответ получает слабый ETag, по которому выполняются условные запросы.
+        """
+        url = reverse('ref_books:element-list', kwargs={'id': self.ref_book_1.id})
+        response = self.client.get(url)
+        self.assertEqual(response.content, JSONRenderer().render(response.json()))
+        if msgpack is not None:
+            packed = self.client.get(url, HTTP_ACCEPT='application/msgpack')
+            self.assertEqual(packed['Content-Type'], 'application/msgpack')
+            self.assertEqual(msgpack.unpackb(packed.content), response.json())
+            self.assertNotEqual(packed['ETag'], response['ETag'])
+
+        compressed = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', compressed['Vary'])
+        self.assertEqual(gzip.decompress(compressed.content), response.content)
+        self.assertEqual(compressed['ETag'], 'W/' + response['ETag'])
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=compressed['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertFalse(self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0').has_header('Content-Encoding'))
+
+        export_url = reverse('ref_books:element-export', kwargs={'id': self.ref_book_1.id})
+        response = self.client.get(export_url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)).decode().count('\n'), 3)
+
+        # HTML-страницы с токенами CSRF не сжимаются (защита от BREACH)
+        self.client.force_login(User.objects.get(username='admin'))
+        response = self.client.get(reverse('admin:ref_books_refbook_changelist'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertGreater(len(response.content), 1024)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_api_serves_frozen_version_snapshot(self):
+        """
+        Тест для проверки выдачи элементов и валидации элемента по опубликованному снимку версии.
+
+        После публикации снимка список элементов выдается без обращения к таблице элементов.
+        После изменения элементов версии снимок перестает использоваться.
+        """
+        snapshot_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(snapshot_dir.cleanup)
+        with override_settings(REF_BOOKS_SNAPSHOT_DIR=snapshot_dir.name):
+            call_command('freeze_version', refbook='1', refbook_version='1.1', stdout=StringIO())
+            url = reverse('ref_books:element-list', kwargs={'id': self.ref_book_1.id})
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, HTTP_ACCEPT='application/json')
+            self.assertFalse([query for query in queries.captured_queries if 'refbookelement' in query['sql']])
+            self.assertEqual(response.json(), [
+                {'code': '1', 'value': 'Терапевт'},
+                {'code': '2', 'value': 'Травматолог'},
+                {'code': '3', 'value': 'Хирург'}
+            ])
+
+            check_url = reverse('ref_books:check-element', kwargs={'id': self.ref_book_1.id})
+            response = self.client.get(check_url, {'code': 2, 'value': 'Травматолог'})
+            self.assertEqual(response.json(), [{'code': '2', 'value': 'Травматолог'}])
+            response = self.client.get(check_url, {'code': 2, 'value': 'Хирург'})
+            self.assertEqual(response.json(), [])
+
+            RefBookElement.objects.create(ref_book_version_id=self.ref_book_version_2, code='0', value='Педиатр')
+            touch_versions([self.ref_book_version_2.pk])
+            response = self.client.get(url)
+            self.assertEqual(len(response.json()), 4)
+
+    def test_snapshot_bound_to_published_revision(self):
+        """
+        Тест для проверки того, что снимок привязан к значению счетчика изменений, присвоенному версии при публикации:
+        версия с тем же идентификатором и значением счетчика в другой базе данных (например, восстановленной
+        из резервной копии до публикации и затем измененной) не получает элементы из снимка.
+        """
+        snapshot_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(snapshot_dir.cleanup)
+        url = reverse('ref_books:element-list', kwargs={'id': self.ref_book_1.id})
+        with override_settings(REF_BOOKS_SNAPSHOT_DIR=snapshot_dir.name):
+            etag = self.client.get(url)['ETag']
+            revision = self.ref_book_version_2.revision
+            call_command('freeze_version', refbook='1', refbook_version='1.1', stdout=StringIO())
+            self.ref_book_version_2.refresh_from_db()
+            self.assertGreaterEqual(self.ref_book_version_2.revision, SNAPSHOT_REVISION_MIN)
+            snapshot_name = f'{self.ref_book_version_2.pk}-{self.ref_book_version_2.revision}.snap'
+            self.assertEqual(os.listdir(snapshot_dir.name), [snapshot_name])
+            response = self.client.get(url)
+            self.assertNotEqual(response['ETag'], etag)
+            self.assertEqual(len(response.json()), 3)
+
+            RefBookVersion.objects.filter(pk=self.ref_book_version_2.pk).update(revision=revision)
+            RefBookElement.objects.filter(ref_book_version_id=self.ref_book_version_2).update(value='Врач')
+            clear_caches()
+            self.assertEqual({row['value'] for row in self.client.get(url).json()}, {'Врач'})
+
+    def test_api_elements_as_of(self):
+        """
+        Тест для проверки выдачи и валидации элементов версии справочника, действовавшей на указанную дату.
+
+        Интервалы действия версий пересчитываются при создании и удалении версий.
+        """
+        self.assertEqual(
+            list(RefBookVersion.objects.filter(ref_book_id=self.ref_book_1).order_by('start_date').
+                 values_list('version', 'end_date')),
+            [('1.0', date(2023, 8, 10)), ('1.1', None)]
+        )
+
+        url = reverse('ref_books:element-list', kwargs={'id': self.ref_book_1.id})
+        self.assertEqual(self.client.get(url, {'as_of': '2023-08-05'}).json(), [])
+        self.assertEqual(len(self.client.get(url, {'as_of': '2023-08-10'}).json()), 3)
+        self.assertEqual(self.client.get(url, {'as_of': '2023-01-01'}).json(), [])
+        self.assertEqual(self.client.get(url, {'as_of': '2023-02-30'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'as_of': '2023-08-10', 'version': '1.1'}).status_code, 400)
+
+        url = reverse('ref_books:check-element', kwargs={'id': self.ref_book_1.id})
+        params = {'code': '1', 'value': 'Терапевт'}
+        with self.assertNumQueries(1):
+            # элементы версии уже загружены в общий кеш запросом списка элементов
+            self.assertEqual(len(self.client.get(url, {**params, 'as_of': '2023-09-01'}).json()), 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.client.get(url, {**params, 'as_of': '2023-09-01'}).json()), 1)
+        self.assertEqual(self.client.get(url, {**params, 'as_of': '2023-08-09'}).json(), [])
+
+        RefBookVersion.objects.create(ref_book_id=self.ref_book_1, version='1.05', start_date=date(2023, 8, 6))
+        self.assertEqual(
+            list(RefBookVersion.objects.filter(ref_book_id=self.ref_book_1).order_by('start_date').
+                 values_list('version', 'end_date')),
+            [('1.0', date(2023, 8, 6)), ('1.05', date(2023, 8, 10)), ('1.1', None)]
+        )
+        RefBookVersion.objects.filter(pk=self.ref_book_version_2.pk).delete()
+        self.assertEqual(
+            list(RefBookVersion.objects.filter(ref_book_id=self.ref_book_1).order_by('start_date').
+                 values_list('version', 'end_date')),
+            [('1.0', date(2023, 8, 6)), ('1.05', None)]
+        )
+        self.assertEqual(self.client.get(url, {**params, 'as_of': '2023-09-01'}).json(), [])
+
+    def test_shared_cache_across_workers(self):
+        """
+        Тест для проверки общего кеша элементов: процесс с пустым внутрипроцессным кешем получает элементы
+        из общего кеша, а изменение элемента увеличивает счетчик изменений версии, по которому версионируются ключи.
+        """
+        list_url = reverse('ref_books:element-list', kwargs={'id': self.ref_book_1.id})
+        check_url = reverse('ref_books:check-element', kwargs={'id': self.ref_book_1.id})
+        expected = self.client.get(list_url).json()
+        self.ref_book_version_2.refresh_from_db()
+        self.assertEqual(
+            get_shared_cache().get(make_elements_key(self.ref_book_1.id, self.ref_book_version_2.pk),
+                                   version=self.ref_book_version_2.revision),
+            tuple((element['code'], element['value']) for element in expected)
+        )
+
+        element_cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(list_url).json(), expected)
+        with self.assertNumQueries(1):
+            response = self.client.get(check_url, {'code': '2', 'value': 'Травматолог'})
+        self.assertEqual(len(response.json()), 1)
+
+        element = RefBookElement.objects.get(ref_book_version_id=self.ref_book_version_2, code='2')
+        element.value = 'Ортопед'
+        element.save()
+        touch_versions([self.ref_book_version_2.pk])
+        element_cache.clear()
+        self.assertEqual(self.client.get(check_url, {'code': '2', 'value': 'Травматолог'}).json(), [])
+        self.assertEqual(self.client.get(list_url).json()[1], {'code': '2', 'value': 'Ортопед'})
+
+        with override_settings(REF_BOOKS_SHARED_CACHE=None):
+            element_cache.clear()
+            self.assertEqual(len(self.client.get(check_url, {'code': '2', 'value': 'Ортопед'}).json()), 1)
+            self.assertEqual(len(self.client.get(list_url).json()), 3)
+
+    def test_metrics_endpoint(self):
+        """
+        Тест для проверки сбора показателей запросов к API и их выдачи в формате Prometheus.
+        """
+        metrics_registry.clear()
+        self.client.get(reverse('ref_books:direction-list'))
+        self.client.get(reverse('ref_books:element-list', kwargs={'id': self.ref_book_1.id}))
+        self.client.get(reverse('ref_books:element-list', kwargs={'id': self.ref_book_1.id}))
+        response = self.client.get(reverse('ref_books:element-export', kwargs={'id': self.ref_book_1.id}))
+        size = len(b''.join(response.streaming_content))
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        metrics = {}
+        for line in response.content.decode().splitlines():
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                metrics[name] = float(value)
+        labels = '{endpoint="element-list",method="GET",status="200"}'
+        self.assertEqual(metrics['ref_books_requests_total' + labels], 2)
+        # второй запрос получает элементы из общего кеша
+        self.assertEqual(metrics['ref_books_db_queries_total' + labels], 3)
+        self.assertEqual(metrics['ref_books_db_queries_max' + labels], 2)
+        self.assertEqual(metrics['ref_books_request_duration_seconds_count' + labels], 2)
+        self.assertGreater(metrics['ref_books_render_seconds_total' + labels], 0)
+        self.assertEqual(
+            metrics['ref_books_response_bytes_total{endpoint="element-export",method="GET",status="200"}'], size)
+        self.assertIn('ref_books_requests_total{endpoint="direction-list",method="GET",status="200"}', metrics)
+
+        with override_settings(REF_BOOKS_METRICS_SERVER_TIMING=True):
+            response = self.client.get(reverse('ref_books:element-list', kwargs={'id': self.ref_book_1.id}))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="1 queries", render;dur=[\d.]+, total;dur=')
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1').status_code, 403)
+
+    async def test_async_view_metrics(self):
+        """
+        Тест для проверки учета SQL-запросов асинхронных представлений, которые выполняются в потоках sync_to_async.
+        """
+        metrics_registry.clear()
+        url = reverse('ref_books:async-element-list', kwargs={'id': self.ref_book_1.id})
+        with override_settings(REF_BOOKS_SHARED_CACHE=None):
+            response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        labels = '{endpoint="async-element-list",method="GET",status="200"}'
+        metrics = metrics_registry.render_prometheus()
+        self.assertRegex(metrics, rf'ref_books_db_queries_total{re.escape(labels)} [1-9]')
+
+    async def test_async_views_match_sync_views(self):
+        """
+        Тест для проверки того, что асинхронные представления возвращают те же ответы, что и синхронные.
+        """
+        requests = [
+            ('direction-list', {}, {}),
+            ('direction-list', {}, {'date': '2023-08-10'}),
+            ('element-list', {'id': self.ref_book_1.id}, {}),
+            ('element-list', {'id': self.ref_book_1.id}, {'version': '1.0'}),
+            ('element-list', {'id': 100}, {}),
+            ('check-element', {'id': self.ref_book_1.id}, {'code': '1', 'value': 'Терапевт'}),
+            ('check-element', {'id': self.ref_book_1.id}, {'code': '1', 'value': 'Терапевт', 'version': '1.0'}),
+            ('check-element', {'id': self.ref_book_1.id}, {}),
+            ('check-element', {'id': 'abc'}, {'code': '1', 'value': 'Терапевт'}),
+            ('element-list', {'id': self.ref_book_1.id}, {'as_of': '2023-08-05'}),
+            ('element-list', {'id': self.ref_book_1.id}, {'search': 'тр'}),
+            ('check-element', {'id': self.ref_book_1.id}, {'code': '1', 'value': 'Терапевт', 'as_of': '2023-09-01'}),
+            ('check-element', {'id': self.ref_book_1.id}, {'code': '1', 'value': 'Терапевт', 'as_of': '2023-13-01'}),
+        ]
+        for name, kwargs, params in requests:
+            with self.subTest(name=name, kwargs=kwargs, params=params):
+                expected = await self.async_client.get(
+                    reverse(f'ref_books:{name}', kwargs=kwargs), params, HTTP_ACCEPT='application/json')
+                response = await self.async_client.get(reverse(f'ref_books:async-{name}', kwargs=kwargs), params)
+                self.assertEqual(response.status_code, expected.status_code)
+                self.assertEqual(response.content, expected.content)
+                self.assertEqual(response.get('ETag'), expected.get('ETag'))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class QueryBudgetTest(TestCase):
+    """
+    Бюджеты запросов к базе данных и времени ответа для точек API и списков административной панели.
+
+    Данные создаются генератором синтетических справочников: количество запросов каждой точки
+    не должно зависеть от количества справочников, версий и элементов (отсутствие N+1),
+    а время ответа - превышать TIME_BUDGET секунд.
+    """
+    fixtures = ['fixtures/001_user.json']
+    REFBOOKS = 40
+    VERSIONS = 10
+    ELEMENTS = 100
+    TIME_BUDGET = 1.0
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.versions = generate_refbooks(
+            refbooks=cls.REFBOOKS, versions=cls.VERSIONS, elements=cls.ELEMENTS, start_date=date(2023, 1, 1))
+        call_command('refresh_current_versions', all=True, stdout=StringIO())
+        cls.ref_book_id = cls.versions[0].ref_book_id_id
+
+    def setUp(self):
+        clear_caches()
+
+    def assertBudget(self, queries, method, url, params=None, **extra):
+        """Выполняет запрос и проверяет количество SQL-запросов и время ответа"""
+        with self.assertNumQueries(queries):
+            started = time.perf_counter()
+            response = getattr(self.client, method)(url, params or {}, **extra)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(elapsed, self.TIME_BUDGET, f'{url} {params}')
+        return response
+
+    def test_direction_list_budget(self):
+        """Список справочников: ETag и список - по одному запросу"""
+        url = reverse('ref_books:direction-list')
+        response = self.assertBudget(2, 'get', url)
+        self.assertEqual(len(response.json()), self.REFBOOKS)
+        self.assertBudget(2, 'get', url, {'date': '2023-01-05'})
+        self.assertBudget(2, 'get', url, {'page_size': 10})
+
+    def test_element_list_budget(self):
+        """Список элементов: справочник с указателем текущей версии (или версия) и элементы"""
+        url = reverse('ref_books:element-list', kwargs={'id': self.ref_book_id})
+        response = self.assertBudget(2, 'get', url)
+        self.assertEqual(len(response.json()), self.ELEMENTS)
+        self.assertBudget(3, 'get', url, {'version': '1.3'})
+        self.assertBudget(2, 'get', url, {'as_of': '2023-01-05'})
+        self.assertBudget(2, 'get', url, {'page_size': 10})
+
+    def test_check_element_budget(self):
+        """Проверка элемента: два запроса при промахе кеша, один (состояние версии) при попадании"""
+        url = reverse('ref_books:check-element', kwargs={'id': self.ref_book_id})
+        params = {'code': '1', 'value': f'Значение 1 версии 1.{self.VERSIONS - 1}'}
+        response = self.assertBudget(2, 'get', url, params)
+        self.assertEqual(len(response.json()), 1)
+        self.assertBudget(1, 'get', url, params)
+        self.assertBudget(3, 'get', url, {**params, 'version': '1.3'})
+        self.assertBudget(2, 'get', url, {**params, 'as_of': '2023-01-05'})
+
+    def test_check_elements_batch_budget(self):
+        """Пакетная проверка: запросы не зависят от количества проверяемых элементов и справочников"""
+        elements = [
+            {'refbook': version.ref_book_id_id, 'version': version.version, 'code': str(code), 'value': 'x'}
+            for version in self.versions[::self.VERSIONS] for code in range(10)
+        ]
+        self.assertBudget(3, 'post', reverse('ref_books:check-elements'), {'elements': elements},
+                          content_type='application/json')
+
+    def test_export_and_diff_budget(self):
+        """Потоковая выгрузка и сравнение версий"""
+        url = reverse('ref_books:element-export', kwargs={'id': self.ref_book_id})
+        self.assertBudget(2, 'get', url)
+        url = reverse('ref_books:version-diff', kwargs={'id': self.ref_book_id})
+        self.assertBudget(5, 'get', url, {'from': '1.0'})
+
+    def test_admin_changelists_budget(self):
+        """Списки административной панели: без запросов на каждую строку"""
+        self.client.force_login(User.objects.get(username='admin'))
+        for name, queries in (
+                ('admin:ref_books_refbook_changelist', 4),
+                ('admin:ref_books_refbookversion_changelist', 4),
+                ('admin:ref_books_refbookelement_changelist', 4),
+        ):
+            with self.subTest(name=name):
+                self.assertBudget(queries, 'get', reverse(name))
+
+    def test_admin_version_change_form_budget(self):
+        """
+        Страница версии в административной панели: элементы выводятся постранично с поиском,
+        количество запросов не зависит от номера страницы и количества элементов версии.
+        """
+        self.client.force_login(User.objects.get(username='admin'))
+        version = self.versions[0]
+        url = reverse('admin:ref_books_refbookversion_change', args=[version.pk])
+        # Первый запрос заполняет кеш типов содержимого
+        self.client.get(url)
+        response = self.assertBudget(8, 'get', url)
+        self.assertContains(response, 'name="refbookelement_set-INITIAL_FORMS" value="50"')
+        self.assertContains(response, 'Всего элементов: 100')
+        response = self.assertBudget(8, 'get', url, {'elements_page': 2})
+        self.assertContains(response, 'name="refbookelement_set-INITIAL_FORMS" value="50"')
+        self.assertContains(response, 'value="99"')
+        response = self.assertBudget(8, 'get', url, {'elements_q': 'ЗНАЧЕНИЕ 99 '})
+        self.assertContains(response, 'Всего элементов: 1\n')
+        response = self.assertBudget(8, 'get', url, {'elements_q': '42'})
+        self.assertContains(response, 'Всего элементов: 1\n')
+
+        url = reverse('admin:ref_books_refbookelement_changelist')
+        response = self.assertBudget(4, 'get', url, {'q': 'значение 99 версии 1.0'})
+        self.assertEqual(response.context['cl'].result_count, self.REFBOOKS)
+
+
+class ImportRefBookCommandTest(TestCase):
+
+    def write_file(self, suffix, content):
+        """Создает временный файл с указанным содержимым"""
+        file = tempfile.NamedTemporaryFile('w', suffix=suffix, encoding='utf-8', delete=False)
+        with file:
+            file.write(content)
+        self.addCleanup(os.remove, file.name)
+        return file.name
+
+    def test_import_csv_and_jsonl(self):
+        """
+        Тест для проверки загрузки элементов справочника из CSV и JSON Lines пакетами.
+
+        При ошибке в файле загрузка версии отменяется целиком.
+        """
+        path = self.write_file('.csv', 'code,value\n' + ''.join(f'{code},Значение {code}\n' for code in range(25)))
+        call_command(
+            'import_refbook', path, refbook='10', name='Импортированный справочник', refbook_version='1.0',
+            start_date='2023-08-01', batch_size=10, stdout=StringIO()
+        )
+        ref_book_version = RefBookVersion.objects.get(ref_book_id__code='10', version='1.0')
+        self.assertEqual(ref_book_version.refbookelement_set.count(), 25)
+        self.assertEqual(RefBook.objects.get(code='10').actual_version_id, ref_book_version.pk)
+
+        path = self.write_file('.jsonl', '{"code": "1", "value": "Новое"}\n{"code": "1", "value": "Дубль"}\n')
+        with self.assertRaises(CommandError):
+            call_command('import_refbook', path, refbook='10', refbook_version='1.0', replace=True, stdout=StringIO())
+        self.assertEqual(ref_book_version.refbookelement_set.count(), 25)
+
+        path = self.write_file('.jsonl', '{"code": "1", "value": "Новое"}\n')
+        call_command('import_refbook', path, refbook='10', refbook_version='1.0', replace=True, stdout=StringIO())
+        self.assertEqual(
+            list(ref_book_version.refbookelement_set.values_list('code', 'value', 'value_lower')),
+            [('1', 'Новое', 'новое')]
+        )
+
+
+class GenerateRefBooksCommandTest(TestCase):
+
+    def test_generate_refbooks(self):
+        """
+        Тест для проверки создания синтетических справочников с пересчетом указателей текущих версий.
+        """
+        call_command('generate_refbooks', refbooks=2, versions=3, elements=4, code_prefix='load', stdout=StringIO())
+        self.assertEqual(RefBook.objects.filter(code__startswith='load-').count(), 2)
+        self.assertEqual(RefBookVersion.objects.count(), 6)
+        self.assertEqual(RefBookElement.objects.count(), 24)
+        self.assertEqual(
+            set(RefBook.objects.values_list('actual_version__version', flat=True)), {'1.2'})
+
+        with self.assertRaises(CommandError):
+            call_command('generate_refbooks', refbooks=1, code_prefix='load', stdout=StringIO())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CopyOnWriteVersionsTest(TestCase):
+
+    def setUp(self):
+        clear_caches()
+        self.ref_book = RefBook.objects.create(code='cow', name='Справочник с наследованием версий')
+        self.parent = RefBookVersion.objects.create(
+            ref_book_id=self.ref_book, version='1.0', start_date=date(2023, 1, 1))
+        self.child = RefBookVersion.objects.create(
+            ref_book_id=self.ref_book, version='1.1', start_date=date(2023, 2, 1), parent=self.parent)
+        for code, value in (('1', 'Терапевт'), ('2', 'Хирург'), ('3', 'Педиатр')):
+            RefBookElement.objects.create(ref_book_version_id=self.parent, code=code, value=value)
+        RefBookElement.objects.create(ref_book_version_id=self.child, code='2', value='Хирург-онколог')
+        RefBookElement.objects.create(ref_book_version_id=self.child, code='3', value='', is_removed=True)
+        RefBookElement.objects.create(ref_book_version_id=self.child, code='4', value='Офтальмолог')
+
+    def get_elements(self, **params):
+        url = reverse('ref_books:element-list', kwargs={'id': self.ref_book.id})
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        if isinstance(data, dict):
+            data = data['results']
+        return [(element['code'], element['value']) for element in data]
+
+    def test_inherited_version_elements(self):
+        """
+        Тест для проверки версии, наследующей элементы: выдача, поиск, выгрузка и проверка элементов
+        учитывают измененные, добавленные и удаленные элементы, изменение родительской версии сбрасывает
+        кеш наследующей версии, а материализация версии не меняет состав ее элементов.
+        """
+        expected = [('1', 'Терапевт'), ('2', 'Хирург-онколог'), ('4', 'Офтальмолог')]
+        self.assertEqual(self.get_elements(), expected)
+        self.assertEqual(self.get_elements(version='1.1', page_size=10), expected)
+        self.assertEqual(self.get_elements(version='1.0'), [('1', 'Терапевт'), ('2', 'Хирург'), ('3', 'Педиатр')])
+        self.assertEqual(self.get_elements(search='хир'), [('2', 'Хирург-онколог')])
+
+        check_url = reverse('ref_books:check-element', kwargs={'id': self.ref_book.id})
+        self.assertEqual(len(self.client.get(check_url, {'code': '1', 'value': 'Терапевт'}).json()), 1)
+        self.assertEqual(self.client.get(check_url, {'code': '3', 'value': 'Педиатр'}).json(), [])
+        response = self.client.post(reverse('ref_books:check-elements'), {'elements': [
+            ['cow', '1.1', '1', 'Терапевт'],
+            ['cow', '1.1', '2', 'Хирург'],
+            ['cow', '1.1', '3', 'Педиатр'],
+            ['cow', '1.0', '3', 'Педиатр'],
+            ['cow', None, '4', 'Офтальмолог'],
+        ]}, content_type='application/json')
+        self.assertEqual(response.json(), {'bitmap': '10011'})
+
+        element = RefBookElement.objects.get(ref_book_version_id=self.parent, code='1')
+        element.value = 'Врач общей практики'
+        element.save()
+        touch_versions([self.parent.pk])
+        self.assertEqual(self.client.get(check_url, {'code': '1', 'value': 'Терапевт'}).json(), [])
+        self.assertIn(('1', 'Врач общей практики'), self.get_elements())
+
+        export_url = reverse('ref_books:element-export', kwargs={'id': self.ref_book.id})
+        exported = b''.join(self.client.get(export_url, {'format': 'csv'}).streaming_content).decode()
+        self.assertEqual(exported.splitlines()[1:], ['1,Врач общей практики', '2,Хирург-онколог', '4,Офтальмолог'])
+
+        grandchild = RefBookVersion.objects.create(
+            ref_book_id=self.ref_book, version='1.2', start_date=date(2023, 1, 15), parent=self.child)
+        grandchild_revision = grandchild.revision
+        url = reverse('ref_books:element-list', kwargs={'id': self.ref_book.id})
+        response = self.client.get(url)
+        expected, etag = self.get_elements(), response['ETag']
+        self.assertEqual(expected, [('1', 'Врач общей практики'), ('2', 'Хирург-онколог'), ('4', 'Офтальмолог')])
+        self.child.refresh_from_db()
+        revision = self.child.revision
+
+        # Элементы версии переписываются в прежнем порядке, хотя строка с кодом 1 унаследована
+        # и до материализации предшествовала собственным строкам версии
+        compact_version(self.child, batch_size=1)
+        self.child.refresh_from_db()
+        self.assertIsNone(self.child.parent_id)
+        self.assertEqual(self.child.revision, revision)
+        self.assertEqual(self.child.refbookelement_set.count(), 3)
+        self.assertFalse(self.child.refbookelement_set.filter(is_removed=True).exists())
+        grandchild.refresh_from_db()
+        self.assertEqual(grandchild.parent_id, self.child.pk)
+        self.assertGreater(grandchild.revision, grandchild_revision)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        clear_caches()
+        self.assertEqual(self.get_elements(), expected)
+        with override_settings(REF_BOOKS_SHARED_CACHE=None):
+            self.assertEqual(self.get_elements(), expected)
+        self.assertEqual(self.get_elements(version='1.2'), expected)
+
+    def test_admin_element_changes_and_version_delete(self):
+        """
+        Тест для проверки сброса кеша при изменении и удалении элементов в административной панели
+        (в том числе наследующей версии) и удаления версии без загрузки ее элементов в память.
+        """
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        check_url = reverse('ref_books:check-element', kwargs={'id': self.ref_book.id})
+        self.assertEqual(len(self.client.get(check_url, {'code': '1', 'value': 'Терапевт'}).json()), 1)
+
+        element = RefBookElement.objects.get(ref_book_version_id=self.parent, code='1')
+        response = self.client.post(reverse('admin:ref_books_refbookelement_change', args=[element.pk]), {
+            'ref_book_version_id': self.parent.pk, 'code': '1', 'value': 'Врач общей практики'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.client.get(check_url, {'code': '1', 'value': 'Терапевт'}).json(), [])
+        self.assertIn(('1', 'Врач общей практики'), self.get_elements())
+
+        element = RefBookElement.objects.get(ref_book_version_id=self.child, code='4')
+        delete_url = reverse('admin:ref_books_refbookelement_delete', args=[element.pk])
+        response = self.client.post(delete_url, {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.client.get(check_url, {'code': '4', 'value': 'Офтальмолог'}).json(), [])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.child.delete()
+        element_queries = [query['sql'] for query in queries if 'ref_books_refbookelement' in query['sql']]
+        self.assertEqual(len(element_queries), 1)
+        self.assertTrue(element_queries[0].startswith('DELETE'))
+        self.assertFalse(RefBookElement.objects.filter(ref_book_version_id=self.child.pk).exists())
+
+    def test_import_delta_version(self):
+        """
+        Тест для проверки загрузки версии с параметром --parent: сохраняются только отличия от родительской версии.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'elements.csv')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write('code,value\n1,Терапевт\n2,Хирург\n5,Невролог\n')
+        call_command(
+            'import_refbook', path, refbook='cow', refbook_version='1.2', parent='1.0', start_date='2023-03-01',
+            stdout=StringIO()
+        )
+        version = RefBookVersion.objects.get(ref_book_id=self.ref_book, version='1.2')
+        self.assertEqual(version.parent_id, self.parent.pk)
+        self.assertEqual(
+            sorted(version.refbookelement_set.values_list('code', 'value', 'is_removed')),
+            [('3', '', True), ('5', 'Невролог', False)]
+        )
+        self.assertEqual(self.get_elements(), [('1', 'Терапевт'), ('2', 'Хирург'), ('5', 'Невролог')])
+
+
+class ElementCacheTest(TestCase):
+
+    def test_lru_eviction_and_memory_cap(self):
+        """
+        Тест для проверки вытеснения записей кеша по количеству записей и суммарному количеству элементов.
+        """
+        cache = ElementCache(max_entries=2, max_elements=3)
+        cache.set(1, '1.0', 10, frozenset({('1', 'a')}))
+        cache.set(2, '1.0', 20, frozenset({('1', 'b')}))
+        cache.get(1, '1.0')
+        cache.set(3, '1.0', 30, frozenset({('1', 'c')}))
+        self.assertIsNone(cache.get(2, '1.0'))
+
+        cache.set(4, '1.0', 40, frozenset({('1', 'd'), ('2', 'd')}))
+        self.assertIsNone(cache.get(1, '1.0'))
+        self.assertIsNotNone(cache.get(3, '1.0'))
+        self.assertIsNotNone(cache.get(4, '1.0'))
+
+        cache.set(5, '1.0', 50, frozenset({('1', 'e'), ('2', 'e'), ('3', 'e'), ('4', 'e')}))
+        self.assertIsNone(cache.get(5, '1.0'))
+
+        cache.invalidate(ref_book_id=3, version_pk=40)
+        self.assertEqual(len(cache), 0)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN доступен только в SQLite')
+@override_settings(CACHES=TEST_CACHES)
+class QueryPlanTest(TestCase):
+    """Тесты планов запросов API: обращения к версиям и элементам справочников должны использовать индексы"""
+    scan_pattern = re.compile(r'^SCAN (ref_books_refbookversion|ref_books_refbookelement)\b')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ref_book = RefBook.objects.create(code='1', name='Специальности медицинских работников')
+        versions = RefBookVersion.objects.bulk_create([
+            RefBookVersion(ref_book_id=cls.ref_book, version=f'1.{index}', start_date=date(2023, 1, 1 + index))
+            for index in range(10)
+        ])
+        RefBookElement.objects.bulk_create([
+            RefBookElement(ref_book_version_id=version, code=str(code), value=f'Значение {code}')
+            for version in versions for code in range(50)
+        ])
+        call_command('refresh_current_versions', all=True, stdout=StringIO())
+
+    def assertQueriesUseIndexes(self, url, params):
+        """Выполняет запрос к API и проверяет, что ни один SQL-запрос не сканирует таблицы версий и элементов"""
+        clear_caches()
+        with mock.patch.object(element_cache, 'max_entries', 0), CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(queries.captured_queries)
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                cursor.execute(f'EXPLAIN QUERY PLAN {query["sql"]}')
+                plan = [row[3] for row in cursor.fetchall()]
+                scans = [step for step in plan if self.scan_pattern.match(step)]
+                self.assertFalse(scans, f'{query["sql"]}\n{plan}')
+
+    def test_direction_list_uses_indexes(self):
+        """Тест плана запроса списка справочников с фильтром по дате"""
+        self.assertQueriesUseIndexes(reverse('ref_books:direction-list'), {'date': '2023-01-05'})
+
+    def test_direction_list_date_filter_uses_exists(self):
+        """Тест фильтра списка справочников по дате: подзапрос EXISTS вместо соединения с версиями и DISTINCT"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('ref_books:direction-list'), {'date': '2023-01-05'})
+        self.assertEqual([row['id'] for row in response.json()], [self.ref_book.id])
+        sql = queries.captured_queries[-1]['sql']
+        self.assertIn('EXISTS', sql)
+        self.assertNotIn('DISTINCT', sql)
+        self.assertNotIn('JOIN', sql)
+
+    def test_element_list_uses_indexes(self):
+        """Тест планов запросов списка элементов текущей и указанной версии"""
+        url = reverse('ref_books:element-list', kwargs={'id': self.ref_book.id})
+        self.assertQueriesUseIndexes(url, {})
+        self.assertQueriesUseIndexes(url, {'version': '1.3'})
+        self.assertQueriesUseIndexes(url, {'search': 'значение 1'})
+
+    def test_check_element_uses_indexes(self):
+        """Тест планов запросов валидации элемента текущей и указанной версии"""
+        url = reverse('ref_books:check-element', kwargs={'id': self.ref_book.id})
+        self.assertQueriesUseIndexes(url, {'code': '1', 'value': 'Значение 1'})
+        self.assertQueriesUseIndexes(url, {'code': '1', 'value': 'Значение 1', 'version': '1.3'})
+        self.assertQueriesUseIndexes(url, {'code': '1', 'value': 'Значение 1', 'as_of': '2023-01-05'})
+
+    def test_admin_element_search_uses_indexes(self):
+        """Тест планов запросов поиска элементов всех версий в административной панели"""
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        url = reverse('admin:ref_books_refbookelement_changelist')
+        self.assertQueriesUseIndexes(url, {'q': 'значение 1'})
+        self.assertQueriesUseIndexes(url, {'q': '7'})
+
+
+class DatabaseRoutingTest(SimpleTestCase):
+    """Тесты маршрутизации запросов к основной базе данных и репликам и параметров соединений с SQLite"""
+
+    @override_settings(REF_BOOKS_DATABASE_REPLICAS=['replica'])
+    def test_primary_replica_router(self):
+        """Тест маршрутизатора: чтение из реплики, кроме блока use_primary(), запись - в основную базу данных"""
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(RefBookElement), 'replica')
+        self.assertEqual(router.db_for_write(RefBookElement), DEFAULT_DB_ALIAS)
+        with use_primary():
+            self.assertEqual(router.db_for_read(RefBookElement), DEFAULT_DB_ALIAS)
+        self.assertEqual(router.db_for_read(RefBookElement), 'replica')
+        self.assertFalse(router.allow_migrate('replica', 'ref_books'))
+        self.assertIsNone(router.allow_migrate(DEFAULT_DB_ALIAS, 'ref_books'))
+
+    def test_router_without_replicas(self):
+        """Тест маршрутизатора без реплик: чтение из основной базы данных"""
+        self.assertEqual(PrimaryReplicaRouter().db_for_read(RefBookElement), DEFAULT_DB_ALIAS)
+
+    def test_sqlite_wal_reader_not_blocked_by_writer(self):
+        """
+        Тест журнала WAL: миграция сохраняет его в файле базы данных для всех соединений, открытая транзакция
+        записи не блокирует чтение, а открытая транзакция чтения не блокирует фиксацию записи.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            settings_dict = connections.configure_settings({DEFAULT_DB_ALIAS: {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(directory, 'wal.sqlite3'),
+                'OPTIONS': {'timeout': 0.1},
+            }})[DEFAULT_DB_ALIAS]
+            writer = SQLiteDatabaseWrapper(settings_dict, alias='wal')
+            reader = SQLiteDatabaseWrapper(settings_dict, alias='wal')
+            try:
+                with writer.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone()[0], 'delete')
+                wal_migration.enable_wal_journal(None, SimpleNamespace(connection=writer))
+                with writer.cursor() as cursor:
+                    cursor.execute('CREATE TABLE element (code TEXT, value TEXT)')
+                    cursor.execute('BEGIN IMMEDIATE')
+                    cursor.executemany(
+                        'INSERT INTO element VALUES (%s, %s)',
+                        [(str(code), f'Значение {code}') for code in range(1000)],
+                    )
+                with reader.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone()[0], 'wal')
+                    cursor.execute('BEGIN')
+                    cursor.execute('SELECT COUNT(*) FROM element')
+                    self.assertEqual(cursor.fetchone()[0], 0)
+                with writer.cursor() as cursor:
+                    cursor.execute('COMMIT')
+                with reader.cursor() as cursor:
+                    cursor.execute('SELECT COUNT(*) FROM element')
+                    self.assertEqual(cursor.fetchone()[0], 0)
+                    cursor.execute('COMMIT')
+                    cursor.execute('SELECT COUNT(*) FROM element')
+                    self.assertEqual(cursor.fetchone()[0], 1000)
+            finally:
+                writer.close()
+                reader.close()
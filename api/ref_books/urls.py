@@ -1,11 +1,19 @@
 from django.urls import path
-from ref_books import views
+from ref_books import async_views, views
 
 app_name = "ref_books"
 
 
 urlpatterns = [
     path('refbooks/', views.DirectionListView.as_view(), name='direction-list'),
+    path('refbooks/check_elements/', views.CheckElementsView.as_view(), name='check-elements'),
     path('refbooks/<id>/elements/', views.DirectionElementListView.as_view(), name='element-list'),
+    path('refbooks/<id>/elements/export/', views.DirectionElementExportView.as_view(), name='element-export'),
+    path('refbooks/<id>/diff/', views.DirectionVersionDiffView.as_view(), name='version-diff'),
     path('refbooks/<id>/check_element/', views.CheckElementView.as_view(), name='check-element'),
+    path('async/refbooks/', async_views.AsyncDirectionListView.as_view(), name='async-direction-list'),
+    path('async/refbooks/<id>/elements/', async_views.AsyncDirectionElementListView.as_view(),
+         name='async-element-list'),
+    path('async/refbooks/<id>/check_element/', async_views.AsyncCheckElementView.as_view(),
+         name='async-check-element'),
 ]
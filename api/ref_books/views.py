@@ -1,30 +1,170 @@
 from rest_framework import generics
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
 from rest_framework.validators import ValidationError
-from django.shortcuts import get_object_or_404
+from rest_framework.views import APIView
+from django.db.models import Count, Max, Sum
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_date
+from django.views import View
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from django.utils.translation import gettext_lazy as _
 from ref_books.filters import DirectionElementFilter, DirectionsFilter
-from ref_books.models import RefBook
-from ref_books.services.ref_books_service import get_ref_book_queryset
-from ref_books.serializers import DirectionSerializer, DirectionElementSerializer
+from ref_books.models import RefBook, RefBookElement
+from ref_books.pagination import DirectionCursorPagination, DirectionElementCursorPagination
+from ref_books.services.bloom_filter import bloom_filters
+from ref_books.services.diff_service import DIFF_CONTENT_TYPE, iter_diff_chunks
+from ref_books.services.export_service import EXPORT_CONTENT_TYPES, iter_export_chunks
+from ref_books.services.metrics_service import metrics_registry
+from ref_books.services.ref_books_service import (
+    check_elements,
+    get_entry_state,
+    get_ref_book_queryset,
+    get_version_elements,
+    get_version_state,
+)
+from ref_books.services.shared_cache import load_version_elements
+from ref_books.services.snapshot_service import open_snapshot
+from ref_books.serializers import CheckElementsSerializer, DirectionSerializer, DirectionElementSerializer
 
 
-class DirectionListView(generics.ListAPIView):
+def parse_as_of(query_params):
+    """
+    Возвращает дату из параметра запроса as_of, на которую определяется действующая версия справочника.
+    :param query_params: Параметры запроса
+    :return: Дата или None, если параметр не указан
+    :raises ValidationError: Если дата некорректна или одновременно указан номер версии
+    """
+    as_of = query_params.get('as_of', None)
+    if not as_of:
+        return None
+    if query_params.get('version', None):
+        raise ValidationError(code=400, detail=_('Параметры "version" и "as_of" не могут быть указаны одновременно'))
+    try:
+        parsed = parse_date(as_of)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValidationError(code=400, detail=_('Параметр "as_of" должен быть датой в формате ГГГГ-ММ-ДД'))
+    return parsed
+
+
+class ValuesListMixin:
+    """
+    Быстрый путь сериализации для списков, сериализаторы которых выводят только поля модели.
+
+    Вместо создания экземпляров моделей и дерева полей сериализатора для каждой строки
+    элементы читаются через values() в словари с полями сериализатора в том же порядке,
+    поэтому ответ совпадает с ответом сериализатора байт в байт. Строки запроса без явного порядка
+    упорядочиваются по первичному ключу: запрос values() может читаться по покрывающему индексу
+    и без этого вернуть строки в порядке индекса, а не в порядке добавления.
+    """
+
+    def get_values_fields(self):
+        """Возвращает поля, выводимые сериализатором"""
+        return self.get_serializer_class().Meta.fields
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        if not queryset.ordered:
+            queryset = queryset.order_by('pk')
+        queryset = queryset.values(*self.get_values_fields())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(page)
+        return Response(list(queryset))
+
+
+class ConditionalListMixin:
+    """
+    Условные запросы для списков справочных данных: ответ содержит строгий ETag,
+    а при совпадении заголовка If-None-Match возвращается ответ 304 без формирования списка.
+    ETag вычисляется по счетчикам изменений справочников и версий, без обращения к таблице элементов.
+    """
+
+    def get_etag(self):
+        """Возвращает ETag ответа или None, если условные запросы не поддерживаются"""
+        return None
+
+    def make_etag(self, *parts):
+        """Формирует строгий ETag из частей и формата ответа"""
+        parts = (*parts, self.request.accepted_renderer.format)
+        return '"{}"'.format('-'.join(str(part) for part in parts))
+
+    def get_not_modified_response(self, etag):
+        """Возвращает ответ 304 (или 412), если условие запроса выполняется для указанного ETag"""
+        response = get_conditional_response(self.request, etag=etag)
+        if response is not None:
+            response['ETag'] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        etag = self.get_etag()
+        if etag is not None:
+            response = self.get_not_modified_response(etag)
+            if response is not None:
+                return response
+        response = super().list(request, *args, **kwargs)
+        if etag is not None:
+            response['ETag'] = etag
+        return response
+
+
+class SnapshotListMixin:
+    """
+    Выдача списка элементов из опубликованного снимка версии (см. freeze_version) или из общего для процессов
+    кеша элементов (см. shared_cache) без построчного чтения из базы данных.
+    Используется, если клиент не запросил постраничную выдачу.
+    """
+
+    def get_cached_elements(self):
+        """Возвращает пары (код, значение) элементов версии в порядке добавления или None, если их нет в снимке и кеше"""
+        state = self.get_version_state()
+        if state is None:
+            return None
+        snapshot = open_snapshot(state.pk, state.revision)
+        if snapshot is not None:
+            return snapshot
+        return load_version_elements(self.get_ref_book_id(), state)
+
+    def list(self, request, *args, **kwargs):
+        paginator = self.paginator
+        if paginator is None or not paginator.is_requested(request):
+            elements = self.get_cached_elements()
+            if elements is not None:
+                return Response([{'code': code, 'value': value} for code, value in elements])
+        return super().list(request, *args, **kwargs)
+
+
+class DirectionListView(ConditionalListMixin, ValuesListMixin, generics.ListAPIView):
     """API view для отображения списка справочников. Если указана дата, возвращаются только те справочники,
-     в которых имеются версии с датой начала действия раннее или равной указанной"""
+     в которых имеются версии с датой начала действия раннее или равной указанной.
+     Поддерживается курсорная пагинация (параметры cursor и page_size)"""
 
     queryset = RefBook.objects.all()
     serializer_class = DirectionSerializer
     filterset_class = DirectionsFilter
+    pagination_class = DirectionCursorPagination
 
+    def get_etag(self):
+        """ETag списка справочников: меняется при создании, изменении и удалении справочников и их версий"""
+        stats = RefBook.objects.aggregate(count=Count('id'), last_id=Max('id'), revisions=Sum('revision'))
+        return self.make_etag('refbooks', stats['count'], stats['last_id'] or 0, stats['revisions'] or 0)
 
-class DirectionElementListView(generics.ListAPIView):
+
+class DirectionElementListView(ConditionalListMixin, SnapshotListMixin, ValuesListMixin, generics.ListAPIView):
     """API view для отображения списка элементов справочников. Если указана версия справочника то,
-     возвращаются элементы указанной версии, иначе элементы текущей версии"""
+     возвращаются элементы указанной версии, если указана дата as_of - элементы версии, действовавшей на эту дату,
+     иначе элементы текущей версии. Элементы выдаются в порядке добавления, постранично - в порядке кодов.
+     Параметр search отбирает элементы, значение которых начинается с указанной строки без учета регистра.
+     Поддерживается курсорная пагинация (параметры cursor и page_size)"""
 
     serializer_class = DirectionElementSerializer
     filterset_class = DirectionElementFilter
+    pagination_class = DirectionElementCursorPagination
 
     @swagger_auto_schema(
         manual_parameters=[
@@ -35,25 +175,121 @@ class DirectionElementListView(generics.ListAPIView):
                 type=openapi.TYPE_INTEGER,
                 required=True
             ),
+            openapi.Parameter(
+                'as_of',
+                openapi.IN_QUERY,
+                description='Date on which the ref book version was in effect',
+                type=openapi.TYPE_STRING,
+                format=openapi.FORMAT_DATE,
+                required=False
+            ),
         ]
     )
     def get(self, *args, **kwargs):
 
         return super().get(*args, *kwargs)
 
-    def get_queryset(self):
-        """Пользовательский метод для получения списка значений"""
+    def get_ref_book_id(self):
+        """Возвращает идентификатор справочника из url"""
         id_ = self.kwargs.get("id")
         if not id_.isdigit():
             raise ValidationError(code=400, detail="Введите корректное значение параметра id в url")
-        ref_book_id = self.kwargs['id']
-        ref_book = get_object_or_404(RefBook, id=ref_book_id)
-        version = self.request.query_params.get('version', None)
-        queryset = get_ref_book_queryset(ref_book_version_id__ref_book_id=ref_book)
-        if not version:
-            ref_book_version = ref_book.current_version
-            queryset = get_ref_book_queryset(ref_book_version_id=ref_book_version)
-        return queryset
+        return int(id_)
+
+    def get_as_of(self):
+        """Возвращает дату из параметра as_of, на которую определяется действующая версия справочника"""
+        return parse_as_of(self.request.query_params)
+
+    def get_version_state(self):
+        """Возвращает запрошенную (действующую на дату as_of или текущую) версию справочника и счетчик ее изменений"""
+        if not hasattr(self, '_version_state'):
+            self._version_state = get_version_state(
+                self.get_ref_book_id(),
+                self.request.query_params.get('version', None),
+                self.get_as_of(),
+            )
+        return self._version_state
+
+    def make_version_etag(self, version_pk, revision):
+        """ETag списка элементов версии: меняется при изменении элементов версии"""
+        if version_pk is None:
+            return self.make_etag('elements', self.get_ref_book_id(), 'none')
+        return self.make_etag('elements', version_pk, revision)
+
+    def get_etag(self):
+        state = self.get_version_state()
+        return self.make_version_etag(state.pk, state.revision) if state else self.make_version_etag(None, None)
+
+    def get_cached_elements(self):
+        """Поиск по началу значения (параметр search) выполняется запросом к базе данных по индексу значений"""
+        if self.request.query_params.get('search', None):
+            return None
+        return super().get_cached_elements()
+
+    def get_queryset(self):
+        """Пользовательский метод для получения списка значений"""
+        state = self.get_version_state()
+        if state is None:
+            return RefBookElement.objects.none()
+        return get_ref_book_queryset(state).order_by('pk')
+
+
+class DirectionElementExportView(View):
+    """Потоковая выгрузка элементов справочника в формате JSON Lines (по умолчанию) или CSV.
+    Параметры запроса: format - jsonl или csv, version - версия справочника, иначе выгружается текущая версия.
+    Ответ формируется по мере чтения элементов из базы данных и не накапливается в памяти.
+    Представление не наследует APIView: параметр format в DRF выбирает рендерер ответа"""
+
+    def get(self, request, *args, **kwargs):
+        """Метод обработки запроса GET"""
+        id_ = self.kwargs.get('id')
+        if not id_.isdigit():
+            return JsonResponse(['Введите корректное значение параметра id в url'], status=400, safe=False)
+        file_format = request.GET.get('format', 'jsonl')
+        if file_format not in EXPORT_CONTENT_TYPES:
+            return JsonResponse([_('Параметр "format" должен принимать значение jsonl или csv')], status=400, safe=False)
+        version = request.GET.get('version', None)
+        try:
+            state = get_version_state(int(id_), version)
+        except Http404:
+            return JsonResponse({'detail': NotFound.default_detail}, status=404)
+        response = StreamingHttpResponse(
+            iter_export_chunks(state, file_format),
+            content_type=EXPORT_CONTENT_TYPES[file_format],
+        )
+        response['Content-Disposition'] = f'attachment; filename="refbook-{id_}.{file_format}"'
+        return response
+
+
+class DirectionVersionDiffView(APIView):
+    """Изменения между двумя версиями справочника: добавленные, удаленные и измененные элементы в порядке кодов.
+    Параметры запроса: from - исходная версия (обязательный), to - новая версия, иначе используется текущая версия.
+    Ответ - JSON-массив записей {"change": "added" | "removed" | "changed", "code", "value"[, "old_value"]},
+    который формируется потоково слиянием упорядоченных по коду элементов версий"""
+
+    def get(self, request, *args, **kwargs):
+        """Метод обработки запроса GET"""
+        id_ = self.kwargs.get('id')
+        if not id_.isdigit():
+            raise ValidationError(code=400, detail='Введите корректное значение параметра id в url')
+        from_version = request.GET.get('from', None)
+        if not from_version:
+            raise ValidationError(code=400, detail=_('Параметр "from" обязателен'))
+        from_state = get_version_state(int(id_), from_version)
+        if from_state is None:
+            raise NotFound(_('Версия справочника не найдена'))
+        to_version = request.GET.get('to', None)
+        to_state = get_version_state(int(id_), to_version)
+        if to_state is None and to_version:
+            raise NotFound(_('Версия справочника не найдена'))
+
+        etag = '"diff-{}-{}-{}"'.format(
+            from_state.pk, from_state.revision, f'{to_state.pk}-{to_state.revision}' if to_state else 'none')
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = StreamingHttpResponse(iter_diff_chunks(from_state, to_state), content_type=DIFF_CONTENT_TYPE)
+        response['ETag'] = etag
+        return response
 
 
 class CheckElementView(DirectionElementListView):
@@ -83,19 +319,97 @@ class CheckElementView(DirectionElementListView):
                 type=openapi.TYPE_STRING,
                 required=True
             ),
+            openapi.Parameter(
+                'as_of',
+                openapi.IN_QUERY,
+                description='Date on which the ref book version was in effect',
+                type=openapi.TYPE_STRING,
+                format=openapi.FORMAT_DATE,
+                required=False
+            ),
         ]
     )
     def get(self, *args, **kwargs):
         """Метод обработки запроса GET"""
         return super().get(*args, **kwargs)
 
-    def get_queryset(self):
-        """Пользовательский метод для получения списка значений"""
-        queryset = super().get_queryset()
+    def list(self, request, *args, **kwargs):
+        """Проверяет элемент по кешу элементов версии, не обращаясь к базе данных при попадании в кеш.
+        Если элементы версии не помещаются в кеш, заведомо отсутствующие элементы отклоняются по фильтру Блума
+        версии без запроса к таблице элементов, остальные проверяются запросом по индексу"""
+        code, value = self.get_code_and_value()
+        elements = get_version_elements(
+            self.get_ref_book_id(),
+            request.query_params.get('version', None),
+            self.get_as_of(),
+            pair=(code, value),
+        )
+        if elements.too_large:
+            exists = get_ref_book_queryset(get_entry_state(elements)).filter(code=code, value=value).exists()
+        else:
+            exists = (code, value) in elements.pairs
+        return self.make_check_response(elements.version_pk, elements.revision, code, value, exists)
+
+    def make_check_response(self, version_pk, revision, code, value, exists):
+        """Формирует ответ проверки элемента со строгим ETag версии"""
+        etag = self.make_version_etag(version_pk, revision)
+        response = self.get_not_modified_response(etag)
+        if response is not None:
+            return response
+        response = Response([{'code': code, 'value': value}] if exists else [])
+        response['ETag'] = etag
+        return response
+
+    def get_cached_elements(self):
+        """Проверка по снимку и кешу выполняется в list() через get_version_elements, а не выдачей всех элементов"""
+        return None
+
+    def get_code_and_value(self):
+        """Возвращает обязательные параметры запроса code и value"""
         code = self.request.query_params.get('code', None)
         value = self.request.query_params.get('value', None)
         if not code or not value:
             raise ValidationError(
                 code=400,
                 detail=_('Параметры "code" и "value" обязательны'))
+        return code, value
+
+    def get_queryset(self):
+        """Пользовательский метод для получения списка значений"""
+        queryset = super().get_queryset()
+        code, value = self.get_code_and_value()
         return queryset.filter(code=code, value=value)
+
+
+class CheckElementsView(generics.GenericAPIView):
+    """API для пакетной валидации элементов справочников. Возвращает битовую строку,
+    в которой для каждого переданного элемента указано 1, если элемент присутствует в версии справочника, иначе 0"""
+
+    serializer_class = CheckElementsSerializer
+
+    @swagger_auto_schema(
+        responses={200: openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={'bitmap': openapi.Schema(type=openapi.TYPE_STRING, description='Например "1011"')},
+        )}
+    )
+    def post(self, request, *args, **kwargs):
+        """Метод обработки запроса POST"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = check_elements(serializer.validated_data['elements'])
+        return Response({'bitmap': ''.join('1' if valid else '0' for valid in result)})
+
+
+class MetricsView(View):
+    """Показатели запросов к API в текстовом формате Prometheus (см. MetricsMiddleware).
+    Доступны только с адресов из настройки REF_BOOKS_METRICS_ALLOWED_IPS"""
+
+    def get(self, request, *args, **kwargs):
+        """Метод обработки запроса GET"""
+        if request.META.get('REMOTE_ADDR') not in getattr(settings, 'REF_BOOKS_METRICS_ALLOWED_IPS', ()):
+            return HttpResponseForbidden()
+        return HttpResponse(
+            metrics_registry.render_prometheus() + bloom_filters.render_prometheus(),
+            content_type='text/plain; version=0.0.4; charset=utf-8',
+        )